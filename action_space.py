@@ -0,0 +1,55 @@
+""" Discrete drop positions of the agents
+
+An action is an index from 0 to size - 1. For each fruit kind, the size positions
+are spread evenly over the part of the dropline the fruit can reach without
+touching the walls: every action is a valid drop, and no index is wasted outside
+of the jar. Positions are ratios from 0 (left) to 1 (right) of the jar, as the x of
+SuikaGame.observation() and the ratio of SuikaGame.drop().
+"""
+import numpy as np
+
+from constants import *
+import fruit
+import utils
+
+
+def drop_margin(radius):
+    """ Distance in pixels between the drop point of a fruit and the walls
+    """
+    return radius + WALL_THICKNESS/2 + 1
+
+
+class ActionSpace(object):
+    """ Drop ratios of the actions for each fruit kind, precomputed for a jar width
+    """
+    def __init__(self, size, bocal_width=None):
+        if( bocal_width is None ):
+            bocal_width = utils.bocal_coords( window_w=WINDOW_WIDTH, window_h=WINDOW_HEIGHT )['bocal_w']
+        self.size = size
+        self.bocal_width = bocal_width
+        margins = np.minimum( drop_margin( np.asarray( fruit._KIND_RADIUS, dtype=np.float64 ) ) / bocal_width, 0.5 )
+        # (kinds, size): row 0, no fruit, spans the dropline
+        self._ratios = margins[:, None] + ( 1 - 2 * margins )[:, None] * np.linspace( 0, 1, size )
+        self._margins = margins
+        self._steps = np.maximum( ( 1 - 2 * margins ) / max( size - 1, 1 ), 1e-9 )
+
+    def ratio(self, action, kind):
+        """ Drop ratio of an action for a fruit kind
+        """
+        return float( self._ratios[kind, action] )
+
+    def ratios(self, actions, kinds):
+        """ Drop ratios of arrays of actions and kinds
+        """
+        return self._ratios[kinds, actions]
+
+    def action(self, ratio, kind):
+        """ Action of the nearest drop ratio for a fruit kind
+        """
+        return int( self.actions( ratio, kind ) )
+
+    def actions(self, ratios, kinds):
+        """ Actions of the nearest drop ratios, for arrays of ratios and kinds
+        """
+        index = np.rint( ( np.asarray(ratios) - self._margins[kinds] ) / self._steps[kinds] )
+        return np.clip( index, 0, self.size - 1 ).astype( np.intp )
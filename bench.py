@@ -0,0 +1,548 @@
+""" Headless performance benchmarks
+
+Runs scripted scenarios on a SuikaGame without display and reports
+physics steps/s, per-step latency percentiles, peak RSS and memory
+blocks per merge. Each scenario runs in a fresh process.
+
+    python bench.py                                   # all scenarios
+    python bench.py autoplay-20 shake                 # some of them
+    python bench.py --save-baseline bench_baseline.json
+    python bench.py --baseline bench_baseline.json    # exit code 1 on regression
+    python bench.py --rain [--mini]                   # max sustainable drop rate
+    python bench.py --presets                         # physics presets: speed and score shift
+    python bench.py --compare-broadphase              # spatial hash against the default tree
+    python bench.py --compare-threads                 # threaded solver against a single thread
+    python bench.py --rewind                          # cost of the rewind snapshots
+    python bench.py --imports                         # import time of the headless modules
+"""
+import argparse, contextlib, io, json, os, platform, random, resource, subprocess, sys, time
+import multiprocessing as mp
+import numpy as np
+import pyglet as pg
+
+from constants import *
+import fruit
+import profiler
+import physics
+import rewind
+from game import SuikaGame
+
+
+DEFAULT_STEPS = 3600           # 30 seconds of simulated time
+DEFAULT_SEED = 1
+DEFAULT_THRESHOLD = 0.10       # relative slowdown reported as a regression
+STORM_INTERVAL = 240           # steps between two merge storms
+PRESET_GAMES = 12              # seeded games per physics preset
+PRESET_GAME_DURATION = 120     # seconds of simulation, if the game is not over before
+PRESET_AUTOPLAY_RATE = 10      # fruits/sec
+# modules that workers and command line tools import: no display, no GUI
+IMPORT_MODULES = ( 'constants', 'utils', 'events', 'fruit', 'bocal', 'collision', 'preview', 'physics',
+                   'profiler', 'rewind', 'game', 'replay', 'raster', 'dataset', 'suika_agent', 'loader',
+                   'protocol', 'server', 'shared_env', 'distributed',
+                   'action_space' )
+IMPORT_FORBIDDEN = ( 'pyglet', 'sprites', 'gui', 'welcome_screen' )
+IMPORT_BUDGET_MS = 20          # import time of the modules of the game, without numpy and pymunk
+IMPORT_REPEATS = 5             # fresh processes per module, the fastest is kept
+
+
+class SimClock(object):
+    """ Simulated time for pyglet.clock: scheduled callbacks (spawns, removals)
+    and animations follow the physics steps instead of the wall clock.
+    """
+    def __init__(self):
+        self.time = 0.0
+        self.clock = pg.clock.Clock( time_function=lambda: self.time )
+        pg.clock.set_default( self.clock )
+
+    def advance(self, dt):
+        self.time += dt
+        self.clock.tick()
+
+
+def _spawn_grid(game, kind, cols, rows, spacing, bottom):
+    """ Spawns cols x rows fruits, centered horizontally in the jar
+    bottom: y of the first row, in jar coordinates
+    """
+    for j in range(rows):
+        for i in range(cols):
+            x = (i - (cols-1)/2) * spacing
+            y = bottom + j * spacing
+            game.fruits.spawn( kind, game.bocal.to_world( (x, y) ) )
+
+
+# Scenarios: setup(game) is called at the start and after each game over.
+# It returns an optional action(game, step_index, dt) called before each physics step.
+
+def _autoplay(rate):
+    def setup(game):
+        game.autoplayer.set_rate(rate)
+        game.autoplayer.enable()
+        return lambda game, i, dt: game.drop( None, nb=game.autoplayer.step(dt) )
+    return setup
+
+def _setup_empty(game):
+    return None
+
+def _setup_pile(game):
+    r = fruit._KIND_RADIUS[1]
+    _spawn_grid( game, kind=1, cols=25, rows=20, spacing=2.5*r,
+                 bottom=-game.bocal.height/2 + 2*r )
+    return None
+
+def _setup_merge_storm(game):
+    def storm(game, i, dt):
+        if( i % STORM_INTERVAL == 0 ):
+            r = fruit._KIND_RADIUS[1]
+            _spawn_grid( game, kind=1, cols=16, rows=4, spacing=2*r+1, bottom=0 )
+    return storm
+
+def _setup_shake(game):
+    autoplay = _autoplay(5)(game)
+    game.bocal.shake_auto()
+    return autoplay
+
+def _setup_tumble(game):
+    autoplay = _autoplay(5)(game)
+    def tumble(game, i, dt):
+        autoplay(game, i, dt)
+        if( not game.bocal.is_tumbling ):
+            game.bocal.tumble_once()
+    return tumble
+
+
+SCENARIOS = {
+    # name : (setup, mini fruits)
+    'empty':          (_setup_empty, False),
+    'autoplay-2':     (_autoplay(2), False),
+    'autoplay-5':     (_autoplay(5), False),
+    'autoplay-20':    (_autoplay(20), False),
+    'mini-pile-500':  (_setup_pile, True),
+    'merge-storm':    (_setup_merge_storm, False),
+    'shake':          (_setup_shake, False),
+    'tumble':         (_setup_tumble, False),
+}
+
+
+def run_scenario(name, steps=DEFAULT_STEPS, seed=DEFAULT_SEED, verbose=False, instant=False,
+                 preset=physics.DEFAULT_PRESET, spatial_hash=None, threads=1, rewind_capture=False):
+    """ Runs one scenario in the current process, returns a dict of metrics
+    rewind_capture: records the game in a RewindBuffer, as the window does (timed apart)
+    """
+    setup, mini = SCENARIOS[name]
+    random.seed(seed)
+    fruit.set_mode_mini(mini)
+    clock = SimClock()
+    prof = profiler.FrameProfiler()
+    out = sys.stdout if verbose else io.StringIO()    # the game prints its events
+
+    latencies = np.zeros(steps)
+    fruits_max = 0
+    merges = 0
+    restarts = 0
+    buffer = rewind.RewindBuffer()
+    captures = []
+    with contextlib.redirect_stdout(out):
+        game = SuikaGame( frame_profiler=prof, instant=instant, preset=preset, spatial_hash=spatial_hash,
+                          threads=threads )
+        dt = game.interval
+        action = setup(game)
+        blocks_start = sys.getallocatedblocks()
+        start = time.perf_counter()
+        for i in range(steps):
+            t0 = time.perf_counter()
+            if( action ):
+                action( game, i, dt )
+            game.step( dt )
+            game.update_countdown()
+            clock.advance( dt )
+            latencies[i] = time.perf_counter() - t0
+            if( rewind_capture and i % REWIND_INTERVAL == 0 and not game.is_gameover ):
+                t0 = time.perf_counter()
+                buffer.append( game.snapshot() )
+                captures.append( time.perf_counter() - t0 )
+
+            fruits_max = max( fruits_max, len(game.fruits) )
+            if( game.is_gameover ):
+                restarts += 1
+                merges += game.merges
+                game.reset()
+                action = setup(game)
+        wall = time.perf_counter() - start
+        merges += game.merges
+        blocks = sys.getallocatedblocks() - blocks_start
+        game.fruits.reset()     # releases the fruits before the game is garbage collected
+
+    p50, p95, p99 = np.percentile( latencies, [50, 95, 99] )
+    return {
+        'scenario': name,
+        'preset': preset,
+        'spatial_hash': game.spatial_hash,
+        'threads': threads,
+        'steps': steps,
+        'wall_s': round( wall, 3 ),
+        'steps_per_s': round( steps / wall, 1 ),
+        'step_ms': { 'p50': round( 1000*p50, 4 ),
+                     'p95': round( 1000*p95, 4 ),
+                     'p99': round( 1000*p99, 4 ),
+                     'max': round( 1000*latencies.max(), 4 ) },
+        'phases_p95_ms': { phase: round( 1000*p95, 4 ) for phase, (cnt, p50, p95, pmax) in prof.stats().items() },
+        'fruits_max': fruits_max,
+        'merges': merges,
+        'restarts': restarts,
+        'peak_rss_mb': round( resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1 ),
+        # net python memory blocks still allocated per merge: a leak indicator
+        'blocks_per_merge': round( blocks / merges, 2 ) if merges else None,
+        'rewind': { 'capture_ms': { 'p50': round( 1000*np.percentile( captures, 50 ), 4 ),
+                                    'p95': round( 1000*np.percentile( captures, 95 ), 4 ),
+                                    'max': round( 1000*max( captures ), 4 ) },
+                    'snapshots': len(buffer),
+                    'kb_per_snapshot': round( buffer.nbytes / len(buffer) / 1024, 2 ),
+                    'buffer_mb': round( buffer.nbytes / 1024 / 1024, 2 ) } if captures else None,
+    }
+
+
+def run_rain(mini=False, seed=DEFAULT_SEED, verbose=False, instant=False, preset=physics.DEFAULT_PRESET):
+    """ Fruit rain load test: raises the drop rate until the physics step
+    p95 exceeds PYMUNK_INTERVAL, returns the stages and the best one
+    """
+    random.seed(seed)
+    fruit.set_mode_mini(mini)
+    clock = SimClock()
+    out = sys.stdout if verbose else io.StringIO()
+    with contextlib.redirect_stdout(out):
+        game = SuikaGame( instant=instant, preset=preset )
+        dt = game.interval
+        game.rain.start()
+        while( game.rain.running ):
+            game.drop( None, nb=game.autoplayer.step(dt) )
+            game.step( dt )
+            game.update_countdown()
+            clock.advance( dt )
+        game.fruits.reset()
+    return {
+        'mini': mini,
+        'stages': game.rain.stages,
+        'overflows': game.rain.overflows,
+        'best': game.rain.best(),
+        'report': game.rain.report(),
+    }
+
+
+def run_preset_game(preset, seed, instant=False):
+    """ One seeded autoplay game until game over, returns its score and timings
+    The drops only depend on the seed: the games of each preset are paired.
+    """
+    random.seed(seed)
+    clock = SimClock()
+    with contextlib.redirect_stdout( io.StringIO() ):
+        game = SuikaGame( instant=instant, preset=preset )
+        dt = game.interval
+        game.autoplayer.set_rate( PRESET_AUTOPLAY_RATE )
+        game.autoplayer.enable()
+        steps = 0
+        start = time.perf_counter()
+        while( not game.is_gameover and steps * dt < PRESET_GAME_DURATION ):
+            game.drop( None, nb=game.autoplayer.step(dt) )
+            game.step( dt )
+            game.update_countdown()
+            clock.advance( dt )
+            steps += 1
+        wall = time.perf_counter() - start
+        score = game.score      # before the explosions of the game over
+        game.fruits.reset()
+    return { 'seed': seed, 'score': score, 'steps': steps, 'sim_s': steps * dt, 'wall_s': wall }
+
+
+def _ks_distance(a, b):
+    """ Two samples Kolmogorov-Smirnov statistic: max distance between the empirical CDFs
+    """
+    a, b = np.sort(a), np.sort(b)
+    values = np.concatenate( [a, b] )
+    cdf_a = np.searchsorted( a, values, side='right' ) / len(a)
+    cdf_b = np.searchsorted( b, values, side='right' ) / len(b)
+    return float( np.max( np.abs(cdf_a - cdf_b) ) )
+
+
+def run_presets(games=PRESET_GAMES, seed=DEFAULT_SEED, instant=False):
+    """ Plays the same seeded games with each physics preset, compares speed and
+    score distribution with the default preset
+    """
+    tasks = [ (name, seed + i, instant) for name in physics.PRESETS for i in range(games) ]
+    ctx = mp.get_context('spawn')
+    with ctx.Pool( maxtasksperchild=1 ) as pool:
+        games_results = pool.starmap( run_preset_game, tasks )
+
+    results = {}
+    for name in physics.PRESETS:
+        runs = [ r for (task, r) in zip(tasks, games_results) if task[0] == name ]
+        scores = np.array( [ r['score'] for r in runs ] )
+        steps = sum( r['steps'] for r in runs )
+        sim = sum( r['sim_s'] for r in runs )
+        wall = sum( r['wall_s'] for r in runs )
+        results[name] = { 'preset': repr(physics.PRESETS[name]),
+                          'steps_per_s': round( steps / wall, 1 ),
+                          'sim_speed': round( sim / wall, 2 ),    # simulated seconds per second
+                          'score_mean': round( float(scores.mean()), 2 ),
+                          'score_std': round( float(scores.std()), 2 ),
+                          'scores': scores.tolist() }
+    ref = np.array( results[physics.DEFAULT_PRESET]['scores'] )
+    for r in results.values():
+        scores = np.array( r['scores'] )
+        r['score_shift'] = round( float( (scores - ref).mean() ), 2 )      # paired, same seeds
+        r['ks_distance'] = round( _ks_distance( scores, ref ), 3 )
+    return results
+
+
+def print_presets(results):
+    print( f"{'preset':<10}{'steps/s':>9}{'sim x':>8}{'score':>8}{'std':>8}{'shift':>8}{'KS':>7}" )
+    for name, r in results.items():
+        print( f"{name:<10}{r['steps_per_s']:>9.0f}{r['sim_speed']:>8.1f}{r['score_mean']:>8.1f}"
+               f"{r['score_std']:>8.1f}{r['score_shift']:>8.1f}{r['ks_distance']:>7.2f}" )
+    for r in results.values():
+        print( f"  {r['preset']}" )
+    print( f"shift: mean score difference with '{physics.DEFAULT_PRESET}' on the same seeds, "
+           f"KS: distance between score distributions (0 = same)" )
+
+
+def print_comparison(ref, other, ref_name, other_name):
+    """ Side by side results of the same scenarios with two settings
+    """
+    print( f"{'scenario':<16}{ref_name+' steps/s':>16}{other_name+' steps/s':>16}{'speedup':>9}"
+           f"{ref_name+' p95':>12}{other_name+' p95':>12}{'fruits':>8}" )
+    for name in ref:
+        r, o = ref[name], other[name]
+        print( f"{name:<16}{r['steps_per_s']:>16.0f}{o['steps_per_s']:>16.0f}"
+               f"{o['steps_per_s']/r['steps_per_s']:>8.2f}x{r['step_ms']['p95']:>12.3f}{o['step_ms']['p95']:>12.3f}"
+               f"{r['fruits_max']:>8}" )
+
+
+def run_import(module):
+    """ Imports a module in a fresh process without display
+    Returns the total import time, the share of the modules of the game (self times
+    of -X importtime), the forbidden modules that were loaded and the import error.
+    """
+    here = os.path.dirname( os.path.abspath(__file__) )
+    env = { k: v for k, v in os.environ.items() if k not in ('DISPLAY', 'WAYLAND_DISPLAY') }
+    code = ( f"import sys, time; t = time.perf_counter(); import {module}; t = time.perf_counter() - t; "
+             f"print(t); print(' '.join(sys.modules))" )
+    proc = subprocess.run( [sys.executable, '-X', 'importtime', '-c', code], cwd=here, env=env,
+                           capture_output=True, text=True )
+    if( proc.returncode ):
+        return { 'module': module, 'total_ms': 0.0, 'own_ms': 0.0, 'forbidden': [],
+                 'error': proc.stderr.strip().splitlines()[-1] }
+    total, modules = proc.stdout.splitlines()
+    own = 0
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split('|')
+        if( len(fields) == 3 and fields[0].strip()[-1:].isdigit() ):
+            name = fields[2].strip()
+            if( os.path.exists( os.path.join( here, name + '.py' ) ) ):
+                own += int( fields[0].split(':')[1] )
+    loaded = modules.split()
+    forbidden = sorted( { m for m in loaded for f in IMPORT_FORBIDDEN if m == f or m.startswith(f + '.') } )
+    return { 'module': module, 'total_ms': 1000 * float(total), 'own_ms': own / 1000, 'forbidden': forbidden,
+             'error': None }
+
+
+def run_imports(modules=IMPORT_MODULES, repeats=IMPORT_REPEATS):
+    results = {}
+    for module in modules:
+        runs = [ run_import(module) for _ in range(repeats) ]
+        best = min( runs, key=lambda r: r['own_ms'] )
+        best['total_ms'] = min( r['total_ms'] for r in runs )
+        results[module] = best
+    return results
+
+
+def print_imports(results, budget=IMPORT_BUDGET_MS):
+    """ Returns the failures: modules over the budget or that load the GUI
+    """
+    failures = []
+    print( f"{'module':<14}{'total ms':>10}{'own ms':>9}" )
+    for r in results.values():
+        print( f"{r['module']:<14}{r['total_ms']:>10.1f}{r['own_ms']:>9.1f}"
+               f"{'   loads ' + ', '.join(r['forbidden']) if r['forbidden'] else ''}" )
+        if( r['own_ms'] > budget ):
+            failures.append( f"{r['module']}: {r['own_ms']:.1f} ms, budget {budget} ms" )
+        if( r['forbidden'] ):
+            failures.append( f"{r['module']}: imports {', '.join(r['forbidden'])}" )
+        if( r['error'] ):
+            failures.append( f"{r['module']}: {r['error']}" )
+    return failures
+
+
+def run_isolated(func, *args):
+    """ Runs a benchmark in a fresh process, so that peak RSS is its own
+    """
+    ctx = mp.get_context('spawn')
+    with ctx.Pool( 1, maxtasksperchild=1 ) as pool:
+        return pool.apply( func, args )
+
+
+def compare(results, baseline, threshold):
+    """ Returns the list of regressions against a baseline, as text
+    """
+    regressions = []
+    for name, r in results.items():
+        b = baseline.get('scenarios', {}).get(name)
+        if( not b ):
+            continue
+        if( r['steps_per_s'] < b['steps_per_s'] * (1 - threshold) ):
+            regressions.append( f"{name}: {r['steps_per_s']} steps/s, baseline {b['steps_per_s']}" )
+        if( r['step_ms']['p95'] > b['step_ms']['p95'] * (1 + threshold) ):
+            regressions.append( f"{name}: p95 {r['step_ms']['p95']} ms, baseline {b['step_ms']['p95']}" )
+    return regressions
+
+
+def print_table(results, phases=False):
+    print( f"{'scenario':<16}{'steps/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+           f"{'fruits':>8}{'merges':>8}{'RSS MB':>8}{'blk/merge':>10}" )
+    for r in results.values():
+        lat = r['step_ms']
+        bpm = r['blocks_per_merge']
+        print( f"{r['scenario']:<16}{r['steps_per_s']:>9.0f}{lat['p50']:>9.3f}{lat['p95']:>9.3f}"
+               f"{lat['p99']:>9.3f}{lat['max']:>9.3f}{r['fruits_max']:>8}{r['merges']:>8}"
+               f"{r['peak_rss_mb']:>8.1f}{'-' if bpm is None else f'{bpm:.2f}':>10}" )
+        if( phases ):
+            for phase, ms in r['phases_p95_ms'].items():
+                print( f"    {phase:<28} p95 {ms:.3f} ms" )
+
+
+def print_rewind(results):
+    print( f"{'scenario':<16}{'capture p50 ms':>16}{'p95 ms':>9}{'max ms':>9}{'KB/snap':>9}{'snapshots':>11}{'MB':>7}" )
+    for r in results.values():
+        rw = r['rewind']
+        if( not rw ):
+            continue
+        cap = rw['capture_ms']
+        print( f"{r['scenario']:<16}{cap['p50']:>16.3f}{cap['p95']:>9.3f}{cap['max']:>9.3f}"
+               f"{rw['kb_per_snapshot']:>9.2f}{rw['snapshots']:>11}{rw['buffer_mb']:>7.2f}" )
+
+
+def print_rain(result):
+    print( f"{'rate/s':>8}{'fruits':>8}{'step p95 ms':>13}" )
+    for stage in result['stages']:
+        print( f"{stage['rate']:>8}{stage['fruits_max']:>8}{stage['step_p95_ms']:>13.3f}"
+               f"{'' if stage['ok'] else '   over budget'}" )
+    print( f"{result['overflows']} jar overflows" )
+    print( result['report'] )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless Suika performance benchmarks")
+    parser.add_argument('scenarios', nargs='*', choices=[[]] + list(SCENARIOS), metavar='SCENARIO',
+                        help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument('--steps', type=int, default=DEFAULT_STEPS, help="physics steps per scenario")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--rain', action='store_true', help="fruit rain load test instead of the scenarios")
+    parser.add_argument('--mini', action='store_true', help="mini fruits for the rain load test")
+    parser.add_argument('--physics', choices=list(physics.PRESETS), default=physics.DEFAULT_PRESET,
+                        help="physics quality preset")
+    parser.add_argument('--spatial-hash', action='store_true', default=None,
+                        help="spatial hash broadphase sized from the fruit radii")
+    parser.add_argument('--compare-broadphase', action='store_true',
+                        help="run the scenarios with the default tree and with the spatial hash")
+    parser.add_argument('--threads', type=int, default=1,
+                        help=f"pymunk solver threads (max {physics.THREADS_MAX}, 0 = only on crowded boards)")
+    parser.add_argument('--compare-threads', action='store_true',
+                        help=f"run the scenarios with 1 and {physics.THREADS_MAX} solver threads")
+    parser.add_argument('--rewind', action='store_true',
+                        help=f"take rewind snapshots every {REWIND_INTERVAL} steps and report their cost")
+    parser.add_argument('--presets', action='store_true', help="compare the physics presets instead of the scenarios")
+    parser.add_argument('--imports', action='store_true',
+                        help=f"import time of the headless modules (exit code 1 over {IMPORT_BUDGET_MS} ms or if "
+                             f"they load the GUI)")
+    parser.add_argument('--games', type=int, default=PRESET_GAMES, help="seeded games per preset")
+    parser.add_argument('--instant', action='store_true', help="instant rules mode (no animation delays)")
+    parser.add_argument('--inline', action='store_true', help="run in this process (for profiling)")
+    parser.add_argument('--phases', action='store_true', help="show per-phase p95 durations")
+    parser.add_argument('--verbose', action='store_true', help="show the game messages")
+    parser.add_argument('--json', metavar='FILE', help="write the results to a JSON file")
+    parser.add_argument('--baseline', metavar='FILE', help="compare with a baseline JSON file")
+    parser.add_argument('--save-baseline', metavar='FILE', help="save the results as a baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    if( args.imports ):
+        results = run_imports()
+        failures = print_imports( results )
+        if( args.json ):
+            with open(args.json, 'w') as f:
+                json.dump( results, f, indent=2 )
+        for failure in failures:
+            print( f"REGRESSION {failure}" )
+        if( failures ):
+            sys.exit(1)
+        return
+
+    if( args.presets ):
+        results = run_presets( args.games, args.seed, args.instant )
+        print_presets( results )
+        if( args.json ):
+            with open(args.json, 'w') as f:
+                json.dump( results, f, indent=2 )
+        return
+
+    if( args.rain ):
+        if( args.inline ):
+            result = run_rain( args.mini, args.seed, args.verbose, args.instant, args.physics )
+        else:
+            result = run_isolated( run_rain, args.mini, args.seed, args.verbose, args.instant, args.physics )
+        print_rain( result )
+        if( args.json ):
+            with open(args.json, 'w') as f:
+                json.dump( result, f, indent=2 )
+        return
+
+    def run_all(spatial_hash=args.spatial_hash, threads=args.threads):
+        results = {}
+        for name in (args.scenarios or list(SCENARIOS)):
+            params = ( name, args.steps, args.seed, args.verbose, args.instant, args.physics, spatial_hash, threads,
+                       args.rewind )
+            if( args.inline ):
+                results[name] = run_scenario( *params )
+            else:
+                results[name] = run_isolated( run_scenario, *params )
+        return results
+
+    if( args.compare_broadphase ):
+        print_comparison( run_all(spatial_hash=False), run_all(spatial_hash=True), 'tree', 'hash' )
+        return
+    if( args.compare_threads ):
+        print_comparison( run_all(threads=1), run_all(threads=physics.THREADS_MAX), '1 thr', f"{physics.THREADS_MAX} thr" )
+        return
+
+    results = run_all()
+    print_table( results, phases=args.phases )
+    if( args.rewind ):
+        print_rewind( results )
+
+    report = {
+        'steps': args.steps,
+        'seed': args.seed,
+        'instant': args.instant,
+        'physics': args.physics,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'scenarios': results,
+    }
+    for path in (args.json, args.save_baseline):
+        if( path ):
+            with open(path, 'w') as f:
+                json.dump( report, f, indent=2 )
+
+    if( args.baseline ):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare( results, baseline, args.threshold )
+        for r in regressions:
+            print( f"REGRESSION {r}" )
+        if( regressions ):
+            sys.exit(1)
+        print( f"no regression above {100*args.threshold:.0f}% against {args.baseline}" )
+
+
+if __name__ == '__main__':
+    main()
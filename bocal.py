@@ -1,7 +1,7 @@
 import math, random
+import numpy as np
 import pymunk as pm
 from constants import *
-from sprites import LineSprite
 import utils
 
 
@@ -21,19 +21,22 @@ TUMBLE_ONCE='once'
 
 
 WALLS_DAMPING = 10     # 1 = no damping, 2 = timestep/2, etc...
+WALLS_PARK_DISTANCE = 0.5   # walls closer than this to their place are parked as static
 
 class BoxElement(object):
     """ Physical pymunk shape associated with a graphical object
        Base class for container elements (Wall, Maxline)
     """
-    def __init__(self, bocal_w, bocal_h, collision_type, thickness ):
+    def __init__(self, bocal_w, bocal_h, collision_type, thickness, render=None ):
         # fundamental dimensions of the object relative to self.body
         self._length, self._local_angle = self.dimensions( bocal_w, bocal_h )
         # coordinates of object endpoints in self.body's reference frame
         (a,b) = self.local_coords()
 
-        # pyglet graphical object
-        self.line = self.make_sprite(a,b)
+        # pyglet graphical object, none without sprites.RenderContext
+        self.line = None
+        if( render ):
+            self.line = self.make_sprite(render, a, b)
 
         # pymunk physical object with a segment collision shape
         self.body = pm.Body(body_type=pm.Body.KINEMATIC)
@@ -84,9 +87,24 @@ class BoxElement(object):
             if( d_angle > 0.000001 ):
                 self.body.angular_velocity = d_angle / (dt * WALLS_DAMPING)
 
+    def park(self, position, angle, space):
+        """ Fixes the element at its place as static geometry
+        """
+        self.body.velocity = (0, 0)
+        self.body.angular_velocity = 0
+        self.body.position = position
+        self.body.angle = angle
+        self.body.body_type = pm.Body.STATIC
+        space.reindex_shapes_for_body( self.body )
+
+    def unpark(self):
+        self.body.body_type = pm.Body.KINEMATIC
+
     def update(self):
         """ Updates the graphics object from the physics simulation
         """
+        if( not self.line ):
+            return
         (a, b) = self.world_coords()
         self.line.x, self.line.y = round(a[0]), round(a[1])
         self.line.x2, self.line.y2 = round(b[0]), round(b[1])
@@ -95,6 +113,15 @@ class BoxElement(object):
     def add_to_space(self, space):
         space.add( self.body, self.segment )
 
+    def delete(self):
+        """ Removes the element from its space, and its line from the batch
+        """
+        if( self.body.space ):
+            self.body.space.remove( self.body, self.segment )
+        if( self.line ):
+            self.line.delete()
+            self.line = None
+
 
     # methods implemented in subclasses
     def bocal_position_func(self, w, h): 
@@ -102,7 +129,7 @@ class BoxElement(object):
         """
         raise NotImplementedError("Instantiate a derived Wall or MaxLine class")
     
-    def make_sprite(self, a, b):
+    def make_sprite(self, render, a, b):
         """ Create the pyglet graphical object
         """
         raise NotImplementedError("Instantiate a derived Wall or MaxLine class")
@@ -114,25 +141,27 @@ class BoxElement(object):
     
 
 class Wall( BoxElement ):
-    def __init__(self, bocal_w, bocal_h, collision_type):
+    def __init__(self, bocal_w, bocal_h, collision_type, render=None):
         super().__init__( bocal_w=bocal_w, 
                           bocal_h=bocal_h,
                           thickness=WALL_THICKNESS,
-                          collision_type=collision_type)
+                          collision_type=collision_type,
+                          render=render)
         self.segment.filter= pm.ShapeFilter( categories=CAT_WALLS, 
                                             mask=pm.ShapeFilter.ALL_MASKS() )
         self.segment.elasticity = ELASTICITY_WALLS
         self.segment.friction = FRICTION
 
-    def make_sprite(self, a, b):
-        return LineSprite.wall( a, b )
+    def make_sprite(self, render, a, b):
+        return render.wall( a, b )
 
 
 class HorizontalWall(Wall):
-    def __init__(self, bocal_w, bocal_h):
+    def __init__(self, bocal_w, bocal_h, render=None):
         super().__init__( bocal_w=bocal_w, 
                           bocal_h=bocal_h,
-                          collision_type=COLLISION_TYPE_WALL_BOTTOM )
+                          collision_type=COLLISION_TYPE_WALL_BOTTOM,
+                          render=render )
 
     def dimensions(self, bocal_w, bocal_h):
         """ wall segment dimensions from bocal size
@@ -142,10 +171,11 @@ class HorizontalWall(Wall):
         return (length, local_angle)
     
 class VerticalWall(Wall):
-    def __init__(self, bocal_w, bocal_h):
+    def __init__(self, bocal_w, bocal_h, render=None):
         super().__init__( bocal_w=bocal_w, 
                           bocal_h=bocal_h, 
-                          collision_type=COLLISION_TYPE_WALL_SIDE )
+                          collision_type=COLLISION_TYPE_WALL_SIDE,
+                          render=render )
 
     def dimensions(self, bocal_w, bocal_h):
         """ wall segment dimensions from bocal size
@@ -175,11 +205,12 @@ class RightWall(VerticalWall):
 class MaxLine( BoxElement ):
     """ Maximum level line in the container
     """
-    def __init__(self, bocal_w, bocal_h ):
+    def __init__(self, bocal_w, bocal_h, render=None ):
         super().__init__( bocal_w=bocal_w,
                           bocal_h=bocal_h,
                           thickness=REDLINE_THICKNESS,
-                          collision_type=COLLISION_TYPE_MAXLINE)
+                          collision_type=COLLISION_TYPE_MAXLINE,
+                          render=render)
         self.segment.filter= pm.ShapeFilter( categories=CAT_MAXLINE, 
                                             mask=pm.ShapeFilter.ALL_MASKS() ^ CAT_WALLS )
         self.segment.sensor = True
@@ -192,8 +223,8 @@ class MaxLine( BoxElement ):
         local_angle=0
         return (length, local_angle)
 
-    def make_sprite(self, a, b):
-        return LineSprite.redline( a, b )
+    def make_sprite(self, render, a, b):
+        return render.redline( a, b )
 
 
 
@@ -231,7 +262,11 @@ class DropZone(object):
         if( r < 0 or r > 1 ):
             print("Click outside the container")
             return None
+        return self.drop_point_ratio( r, margin )
 
+    def drop_point_ratio(self, r, margin):
+        """ Drop point at r from 0 (left) to 1 (right) of the dropline
+        """
         # adjust drop point so fruit doesn't overflow
         if( margin ):
             r = max( margin, r)
@@ -247,13 +282,13 @@ class DropZone(object):
         return self._drop_point_interpolate( margin + (1 - 2*margin) * random.random() )
 
 
-def _make_walls( space, width, height ):
+def _make_walls( space, width, height, render=None ):
     walls = {
-        LEFT:   LeftWall(bocal_w=width, bocal_h=height),
-        RIGHT:  RightWall(bocal_w=width, bocal_h=height), 
-        BOTTOM: BottomWall(bocal_w=width, bocal_h=height),
-        TOP:    TopWall(bocal_w=width, bocal_h=height), 
-        MAXLINE: MaxLine(bocal_w=width, bocal_h=height),
+        LEFT:   LeftWall(bocal_w=width, bocal_h=height, render=render),
+        RIGHT:  RightWall(bocal_w=width, bocal_h=height, render=render), 
+        BOTTOM: BottomWall(bocal_w=width, bocal_h=height, render=render),
+        TOP:    TopWall(bocal_w=width, bocal_h=height, render=render), 
+        MAXLINE: MaxLine(bocal_w=width, bocal_h=height, render=render),
     }
     for w in walls.values():
         w.add_to_space( space )
@@ -263,20 +298,26 @@ def _make_walls( space, width, height ):
 class Bocal(object):
     """ Utility to create the walls of the game space (space).
     """
-    def __init__(self, space, center, bocal_w, bocal_h):
-        # Create a static body for the container
-        self._body = pm.Body(body_type=pm.Body.STATIC)  # Changed to STATIC
+    def __init__(self, space, center, bocal_w, bocal_h, render=None):
+        """ render: sprites.RenderContext of the wall lines, None without display
+        """
+        # Reference body of the container, without shape: the walls follow it.
+        # Kinematic so that shake and tumble velocities move it.
+        self._body = pm.Body(body_type=pm.Body.KINEMATIC)
         self._position_ref = center
         self._width_ref = bocal_w
         self._height_ref = bocal_h
         self._body.position = center  # Set initial position immediately
         space.add(self._body)
  
-        self._walls = _make_walls(space, width=bocal_w, height=bocal_h)
+        self._walls = _make_walls(space, width=bocal_w, height=bocal_h, render=render)
         self._space = space
         self._maxline = self._walls[MAXLINE]
         self._dropzone = DropZone(bocal_body=self._body, width=bocal_w, height=bocal_h)
+        self._parked = False      # walls are static geometry while the jar is at rest
+        self._lines_dirty = True  # wall sprites to move at the next update()
         self.reset()
+        self._park()
 
     def reset(self):
         # Keep the body position fixed at reference position
@@ -305,11 +346,30 @@ class Bocal(object):
     def to_bocal(self, world_coords):
         return self._body.world_to_local(world_coords)
 
+    def to_bocal_array(self, points):
+        """ to_bocal() of an (n, 2) array of world coordinates
+        """
+        a = self._body.angle
+        c, s = math.cos(a), math.sin(a)
+        d = points - np.array( self._body.position )
+        return np.stack( ( c*d[:, 0] + s*d[:, 1], -s*d[:, 0] + c*d[:, 1] ), axis=1 )
+
+    @property
+    def walls(self):
+        """ Walls and maxline, by name (LEFT, RIGHT, BOTTOM, TOP, MAXLINE)
+        """
+        return self._walls
+
     @property
     def width(self):
         bot = self._walls[BOTTOM].segment
         return (bot.b - bot.a).length
-    
+
+    @property
+    def height(self):
+        left = self._walls[LEFT].segment
+        return (left.b - left.a).length
+
     @property
     def is_tumbling(self):
         return self._tumble != TUMBLE_OFF
@@ -323,19 +383,57 @@ class Bocal(object):
         return fruit
 
 
+    @property
+    def is_moving(self):
+        return self._shake != SHAKE_OFF or self._tumble != TUMBLE_OFF
+
+
     def step(self, dt):
+        if( self._parked ):
+            if( not self.is_moving ):
+                return      # fast path: the jar is at rest
+            self._unpark()
         self._update_shake(dt)
         self._update_tumble(dt)
         self._update_walls(dt)
+        if( not self.is_moving and self._walls_in_place() ):
+            self._park()
+
+
+    def _wall_target(self, wall):
+        local_pos = wall.bocal_position_func(self._width_ref, self._height_ref)
+        return self._body.local_to_world(local_pos)
 
 
     def _update_walls(self, dt):
         """ Move the walls.
         """
         for wall in self._walls.values():
-            local_pos = wall.bocal_position_func(self._width_ref, self._height_ref)
-            world_pos = self._body.local_to_world(local_pos)
-            wall.move_to(position=world_pos, angle=self._body.angle, dt=dt)
+            wall.move_to(position=self._wall_target(wall), angle=self._body.angle, dt=dt)
+
+
+    def _walls_in_place(self):
+        for wall in self._walls.values():
+            if( (self._wall_target(wall) - wall.body.position).length > WALLS_PARK_DISTANCE ):
+                return False
+        return True
+
+
+    def _park(self):
+        """ Walls become static geometry: no work for them at each step
+        """
+        self._body.velocity = (0, 0)
+        self._body.angular_velocity = 0
+        for wall in self._walls.values():
+            wall.park( self._wall_target(wall), self._body.angle, self._space )
+        self._parked = True
+        self._lines_dirty = True
+
+
+    def _unpark(self):
+        for wall in self._walls.values():
+            wall.unpark()
+        self._parked = False
 
 
     def shake_auto(self):
@@ -423,8 +521,11 @@ class Bocal(object):
     def update(self):
         """ Updates the positions of graphical objects from the physics simulation
         """
+        if( self._parked and not self._lines_dirty ):
+            return
         for w in self._walls.values():
             w.update()
+        self._lines_dirty = not self._parked
 
 
     def on_mouse_motion(self, x, y, dx, dy):
@@ -445,7 +546,10 @@ class Bocal(object):
         self._height_ref = bocal_h
         self._dropzone.on_resize( bocal_w, bocal_h)
         for wall in self._walls.values():
-            wall.on_resize( bocal_w, bocal_h)  # only changes the length of the wall
+            wall.on_resize( bocal_w, bocal_h)  # only changes the length of the wall
+        if( self._parked ):
+            self._space.reindex_static()    # static segments changed length
+        self._lines_dirty = True
         if( self._shake == SHAKE_OFF ):
             self.shake_stop()  # to slowly move the body to the new ref position.
 
@@ -458,3 +562,7 @@ class Bocal(object):
         return self._dropzone.drop_point_random(margin / self.width)
 
 
+    def drop_point_ratio(self, r, margin):
+        return self._dropzone.drop_point_ratio(r, margin=margin/self.width)
+
+
@@ -1,6 +1,6 @@
-import pyglet as pg
 from constants import *
 from fruit import nb_fruits
+import events
 
 
 def _is_fruit_shape(shape):
@@ -40,7 +40,8 @@ class CollisionHelper(object):
     """ Contains the callback called by pymunk for each collision 
     and the algorithms for choosing the fruits to merge and create
     """
-    def __init__(self, space):
+    def __init__(self, space, events):
+        self._events = events
         self.reset()
         self.setup_handlers( space )
 
@@ -121,7 +122,7 @@ class CollisionHelper(object):
         return composantes
 
 
-    def _process_collisions(self, spawn_func, world_to_bocal_func):
+    def _process_collisions(self, world_to_bocal_func):
         """ Modifies the fruits according to collisions that occurred during pymunk.step()
         """
         # Processes explosions  
@@ -138,15 +139,14 @@ class CollisionHelper(object):
             self._actions.append( lambda : f1.merge_to( dest=f0.position ) )
 
             # Replaces the exploded fruits with a single new larger fruit
-            # Copies the info because f0 may be REMOVED when spawn() is called
+            # Copies the info because f0 may be REMOVED when the spawn event is processed
             kind = min( f0.kind + 1, nb_fruits() )
-            bocal_coords = world_to_bocal_func( f0.position )
-            spawn_fruit = lambda dt : spawn_func(kind=kind, bocal_coords=bocal_coords)
-            pg.clock.schedule_once( spawn_fruit, delay=SPAWN_DELAY )
+            (x, y) = world_to_bocal_func( f0.position )
+            self._events.schedule( SPAWN_DELAY, events.EVENT_SPAWN, (kind, x, y) )
 
 
-    def process(self, spawn_func, world_to_bocal_func):
-        self._process_collisions(spawn_func, world_to_bocal_func)
+    def process(self, world_to_bocal_func):
+        self._process_collisions(world_to_bocal_func)
 
         # Executes actions on existing fruits ( explose(), blink(), etc... )
         for action in self._actions:
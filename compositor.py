@@ -0,0 +1,267 @@
+""" Software compositor: renders recorded games into RGB frames, in NumPy only (no OpenGL)
+
+The jar walls, the maxline and the fruit sprites are drawn at the chosen frame
+size: the walls once into a background, the sprites pre-scaled and pre-rotated per
+kind. Texts, explosions and the fade animations are not drawn.
+
+    python suika.py --record game.npz
+    python compositor.py game.npz --png frames/          # frame_00000.png ...
+    python compositor.py game.npz --raw game.rgb         # raw rgb24 frames, for ffmpeg
+"""
+import argparse, contextlib, io, math, os, struct, sys, time, zlib
+import numpy as np
+import pyglet as pg
+if( __name__ == '__main__' ):
+    pg.options['shadow_window'] = False     # no display needed
+
+from constants import *
+import fruit
+from bocal import LEFT, RIGHT, BOTTOM, MAXLINE
+
+
+ASSETS_DIR = os.path.join( os.path.dirname( os.path.abspath(__file__) ), 'assets' )
+
+
+def load_rgba(name):
+    """ Pixels of an asset PNG, uint8 (h, w, 4), row 0 at the top
+    """
+    img = pg.image.load( os.path.join( ASSETS_DIR, f"{name}.png" ) ).get_image_data()
+    data = np.frombuffer( img.get_bytes( 'RGBA', img.width * 4 ), dtype=np.uint8 )
+    return data.reshape( img.height, img.width, 4 )[::-1]
+
+
+def _rotated(src, size, angle):
+    """ Square sprite of size pixels from src (h, w, 4), rotated by angle (radians,
+    counterclockwise) and 2x2 supersampled
+    Returns the premultiplied rgb in 0..255 (size, size, 3), 1 - alpha (size, size, 1),
+    and the first and last+1 pixels of its opaque centered square, copied without blending
+    """
+    h, w = src.shape[:2]
+    sub = ( np.arange( 2 * size ) + 0.5 ) / ( 2 * size ) - 0.5      # sub-pixel centers, -0.5..0.5
+    px, py = np.meshgrid( sub, -sub )                                # y up
+    c, s = math.cos(angle), math.sin(angle)
+    u = c * px + s * py + 0.5                                       # inverse rotation
+    v = -s * px + c * py + 0.5
+    inside = (u >= 0) & (u < 1) & (v >= 0) & (v < 1)
+    cols = np.clip( (u * w).astype(int), 0, w - 1 )
+    rows = np.clip( ((1 - v) * h).astype(int), 0, h - 1 )
+    rgba = src[rows, cols] * ( inside[..., None] / np.float32(255) )
+    rgba[..., :3] *= rgba[..., 3:]
+    rgba = rgba.reshape( size, 2, size, 2, 4 ).mean( axis=(1, 3) )
+
+    # opaque square: the pixels closer to the center than any transparent one
+    center = np.abs( np.arange( size ) - (size - 1) / 2 )
+    distance = np.maximum( center[:, None], center[None, :] )
+    transparent = rgba[..., 3] < 1
+    half = distance[transparent].min() if transparent.any() else size
+    core = np.flatnonzero( center < half )
+    core = ( int(core[0]), int(core[-1]) + 1 ) if len(core) else ( 0, 0 )
+    return ( np.ascontiguousarray( rgba[..., :3] * 255 ), np.ascontiguousarray( 1 - rgba[..., 3:] ), core )
+
+
+def _segment_mask(xs, ys, a, b, half_width):
+    """ Pixels (ys, xs grids) within half_width of the segment a-b
+    """
+    ab = np.subtract( b, a )
+    length2 = max( float( ab @ ab ), 1e-9 )
+    t = np.clip( ( (xs - a[0]) * ab[0] + (ys - a[1]) * ab[1] ) / length2, 0, 1 )
+    dx = xs - ( a[0] + t * ab[0] )
+    dy = ys - ( a[1] + t * ab[1] )
+    return dx * dx + dy * dy <= half_width * half_width
+
+
+class Compositor(object):
+    """ Draws the boards of a game window into RGB frames
+    """
+    def __init__(self, window_size, width=COMPOSITOR_WIDTH, height=None, rotations=COMPOSITOR_ROTATIONS):
+        """ window_size: (width, height) of the game window, the positions are in its coordinates
+        width, height: frame size, the height follows the window aspect if None
+        """
+        ww, wh = window_size
+        if( height is None ):
+            height = round( width * wh / ww )
+        self._size = ( width, height )
+        self._scale = min( width / ww, height / wh )
+        self._offset = ( (width - ww * self._scale) / 2, (height - wh * self._scale) / 2 )
+        self._rotations = rotations
+        self._sprites = {}              # kind -> [ _rotated() per rotation ], built on first use
+        self._background = None
+        self._walls_key = None
+        self._frame = np.zeros( (height, width, 3), dtype=np.float32 )
+
+    @property
+    def size(self):
+        return self._size
+
+    def to_frame(self, points):
+        """ Window coordinates (n, 2) to frame pixels (n, 2): x, row from the top
+        """
+        points = np.asarray( points, dtype=np.float64 ).reshape(-1, 2)
+        x = points[:, 0] * self._scale + self._offset[0]
+        y = self._size[1] - ( points[:, 1] * self._scale + self._offset[1] )
+        return np.stack( (x, y), axis=1 )
+
+    def _kind_sprites(self, kind):
+        sprites = self._sprites.get( kind )
+        if( sprites is None ):
+            src = load_rgba( fruit._KIND_NAME[kind] )
+            size = max( 1, round( 2 * fruit._KIND_RADIUS[kind] * self._scale ) )
+            sprites = [ _rotated( src, size, 2 * math.pi * i / self._rotations ) for i in range( self._rotations ) ]
+            self._sprites[kind] = sprites
+        return sprites
+
+    def _draw_background(self, bocal):
+        """ Black, with the walls and the maxline; redrawn when the jar moves
+        """
+        walls = bocal.walls
+        key = tuple( tuple( map( tuple, walls[name].world_coords() ) ) for name in sorted(walls) )
+        if( key == self._walls_key ):
+            return
+        width, height = self._size
+        bg = np.zeros( (height, width, 3), dtype=np.float32 )
+        ys, xs = np.mgrid[ 0:height, 0:width ] + 0.5
+        for name, color, thickness in ( (LEFT, WALL_COLOR, WALL_THICKNESS),
+                                        (RIGHT, WALL_COLOR, WALL_THICKNESS),
+                                        (BOTTOM, WALL_COLOR, WALL_THICKNESS),
+                                        (MAXLINE, REDLINE_COLOR, REDLINE_THICKNESS) ):
+            a, b = self.to_frame( walls[name].world_coords() )
+            mask = _segment_mask( xs, ys, a, b, max( 0.5, thickness * self._scale / 2 ) )
+            bg[mask] = color[:3]
+        self._background = bg
+        self._walls_key = key
+
+    def _blit(self, frame, sprite, cx, cy):
+        rgb, inv_alpha, (k0, k1) = sprite
+        size = rgb.shape[0]
+        x0 = int( round( cx - size / 2 ) )
+        y0 = int( round( cy - size / 2 ) )
+        # visible part of the sprite, in sprite pixels
+        sx0, sy0 = max( -x0, 0 ), max( -y0, 0 )
+        sx1, sy1 = min( frame.shape[1] - x0, size ), min( frame.shape[0] - y0, size )
+        if( sx0 >= sx1 or sy0 >= sy1 ):
+            return
+        # opaque square, clipped the same way
+        cx0, cy0 = min( max( k0, sx0 ), sx1 ), min( max( k0, sy0 ), sy1 )
+        cx1, cy1 = max( min( k1, sx1 ), cx0 ), max( min( k1, sy1 ), cy0 )
+
+        def blend(ya, yb, xa, xb):
+            if( ya < yb and xa < xb ):
+                region = frame[y0 + ya:y0 + yb, x0 + xa:x0 + xb]
+                region *= inv_alpha[ya:yb, xa:xb]
+                region += rgb[ya:yb, xa:xb]
+
+        # the bands around the opaque square are blended, the square is copied
+        blend( sy0, cy0, sx0, sx1 )
+        blend( cy1, sy1, sx0, sx1 )
+        blend( cy0, cy1, sx0, cx0 )
+        blend( cy0, cy1, cx1, sx1 )
+        if( cy0 < cy1 and cx0 < cx1 ):
+            frame[y0 + cy0:y0 + cy1, x0 + cx0:x0 + cx1] = rgb[cy0:cy1, cx0:cx1]
+
+    def render(self, game, out=None):
+        """ Frame of a game, uint8 (height, width, 3); out: array reused if given
+        """
+        self._draw_background( game.bocal )
+        frame = self._frame
+        np.copyto( frame, self._background )
+
+        ints, floats = game.fruits.get_state( np.float64 )
+        kinds = ints[:, 1].tolist()
+        angles = floats[:, 2]
+        next = game.fruits.peek_next()
+        if( next ):
+            kinds.append( next.kind )
+            floats = np.concatenate( ( floats[:, :2], [ tuple(next.position) ] ) )
+            angles = np.append( angles, 0 )
+        centers = self.to_frame( floats[:, :2] ).tolist()
+        steps = ( np.round( angles * self._rotations / (2 * math.pi) ).astype(int) % self._rotations ).tolist()
+        for kind, (cx, cy), step in zip( kinds, centers, steps ):
+            self._blit( frame, self._kind_sprites(kind)[step], cx, cy )
+
+        if( out is None ):
+            out = np.empty( frame.shape, dtype=np.uint8 )
+        out[...] = frame        # blending keeps the values in 0..255
+        return out
+
+
+def write_png(path, rgb, level=COMPOSITOR_PNG_LEVEL):
+    """ Writes a uint8 (h, w, 3) frame as an 8 bits RGB PNG, with zlib only
+    """
+    h, w = rgb.shape[:2]
+    raw = np.zeros( (h, w * 3 + 1), dtype=np.uint8 )      # filter type 0 in front of each row
+    raw[:, 1:] = rgb.reshape( h, -1 )
+
+    def chunk(tag, data):
+        return struct.pack( '>I', len(data) ) + tag + data + struct.pack( '>I', zlib.crc32( tag + data ) )
+
+    with open( path, 'wb' ) as f:
+        f.write( b'\x89PNG\r\n\x1a\n' )
+        f.write( chunk( b'IHDR', struct.pack( '>IIBBBBB', w, h, 8, 2, 0, 0, 0 ) ) )
+        f.write( chunk( b'IDAT', zlib.compress( raw.tobytes(), level ) ) )
+        f.write( chunk( b'IEND', b'' ) )
+
+
+def replay_frames(replay_data, compositor, fps=COMPOSITOR_FPS):
+    """ Frames of a replay at fps, rendered on a headless game
+    """
+    from game import SuikaGame
+    import replay
+    meta = replay_data.meta
+    with contextlib.redirect_stdout( io.StringIO() ):
+        game = SuikaGame( width=meta['width'], height=meta['height'], instant=meta['instant'], preset=meta['preset'] )
+    try:
+        player = replay.ReplayPlayer( replay_data, game )
+        out = None
+        for i in range( int( replay_data.duration * fps ) + 1 ):
+            player.seek( round( i / fps / meta['interval'] ) )
+            out = compositor.render( game, out )
+            yield out
+    finally:
+        game.fruits.reset()
+
+
+def main():
+    import replay
+
+    parser = argparse.ArgumentParser(description="Renders a replay into frames, without GPU or display")
+    parser.add_argument('path', help="replay file, from suika.py --record")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('--png', metavar='DIR', help="writes a PNG sequence into DIR")
+    output.add_argument('--raw', metavar='FILE', help="writes raw rgb24 frames into FILE, '-' for stdout")
+    parser.add_argument('--width', type=int, default=COMPOSITOR_WIDTH)
+    parser.add_argument('--height', type=int, default=None, help="default: the aspect of the recorded window")
+    parser.add_argument('--fps', type=float, default=COMPOSITOR_FPS)
+    args = parser.parse_args()
+
+    replay_data = replay.Replay.load( args.path )
+    compositor = Compositor( (replay_data.meta['width'], replay_data.meta['height']), args.width, args.height )
+    width, height = compositor.size
+    log = sys.stderr if args.raw == '-' else sys.stdout
+
+    if( args.png ):
+        os.makedirs( args.png, exist_ok=True )
+    raw = None
+    if( args.raw ):
+        raw = sys.stdout.buffer if args.raw == '-' else open( args.raw, 'wb' )
+
+    start = time.perf_counter()
+    count = 0
+    try:
+        for frame in replay_frames( replay_data, compositor, args.fps ):
+            if( args.png ):
+                write_png( os.path.join( args.png, f"frame_{count:05d}.png" ), frame )
+            elif( raw ):
+                raw.write( frame.data )
+            count += 1
+    finally:
+        if( raw and raw is not sys.stdout.buffer ):
+            raw.close()
+    elapsed = time.perf_counter() - start
+
+    print( f"{count} frames {width}x{height} in {elapsed:.1f} s ({1000 * elapsed / max(count, 1):.1f} ms per frame), "
+           f"game {replay_data.duration:.1f} s: {replay_data.duration / elapsed:.1f}x real time", file=log )
+    if( args.raw and args.raw != '-' ):
+        print( f"ffmpeg -f rawvideo -pix_fmt rgb24 -s {width}x{height} -r {args.fps:g} -i {args.raw} game.mp4", file=log )
+
+if __name__ == '__main__':
+    main()
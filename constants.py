@@ -7,6 +7,12 @@ BOCAL_MARGIN_BOTTOM = 50
 BOCAL_MARGIN_SIDE = 150
 GUI_FONT_SIZE = 25
 GUI_TOP_MARGIN = 10
+GUI_FPS_REFRESH = 0.5      # seconds between two refreshes of the FPS counters
+GUI_SCORE_DIGITS = 6
+GUI_FPS_DIGITS = 4
+PROFILER_HISTORY = 1024            # samples kept per phase
+PROFILER_OVERLAY_REFRESH = 0.5     # seconds
+PROFILER_FONT_SIZE = 12
 NEXT_FRUIT_Y_POS = BOCAL_MARGIN_TOP//2   # pixels from top
 PREVIEW_Y_POS =  90    # pixels from top
 PREVIEW_SPRITE_SIZE = 50
@@ -35,6 +41,76 @@ ELASTICITY_WALLS = 0.05
 AUTOPLAY_INTERVAL_BASE = 0.05       # seconds
 AUTOPLAY_INITIAL_RATE = 5
 
+# fruit rain load test: the drop rate rises stage after stage
+RAIN_START_RATE = 10        # fruits/sec
+RAIN_RATE_STEP = 10         # fruits/sec added at each stage
+RAIN_MAX_RATE = 300         # fruits/sec
+RAIN_STAGE_DURATION = 3.0   # seconds of simulation per stage
+
+# rewind: board snapshots kept by the window
+REWIND_INTERVAL = 6         # physics steps between two snapshots (20 per second at 120 Hz)
+REWIND_BUDGET_MB = 8        # memory of the snapshots, the oldest ones are dropped
+REWIND_SCRUB_FAST = 20      # snapshots per key press with SHIFT (one second)
+
+# replays: keyframes and actions of a game, played back by replay.py
+REPLAY_KEYFRAME_INTERVAL = 2.0      # seconds of simulation between two keyframes
+REPLAY_SPEEDS = (1, 2, 4, 8, 16, 32, 64)
+REPLAY_SEEK_STEP = 5.0              # seconds per LEFT/RIGHT key press, x6 with SHIFT
+REPLAY_TICK_BUDGET = 0.006          # seconds of simulation work per viewer tick
+
+# transitions dataset for offline training (dataset.py)
+OBS_MAX_FRUITS = 64         # fruits in an observation, the highest ones
+DATASET_SHARD_SIZE = 4096   # transitions per shard file
+DATASET_QUEUE_SHARDS = 2    # full shards waiting for the writer thread, then add() blocks
+
+# board grids of raster.py
+RASTER_WIDTH = 64
+RASTER_HEIGHT = 48
+
+# software frames of compositor.py
+COMPOSITOR_WIDTH = 640      # pixels, the height follows the recorded window
+COMPOSITOR_FPS = 30
+COMPOSITOR_ROTATIONS = 32   # pre-rotated sprites per fruit kind
+COMPOSITOR_PNG_LEVEL = 1    # zlib level of the PNG frames: speed first
+
+# multi-board window (multiboard.py)
+MULTIBOARD_BOARDS = 16
+MULTIBOARD_WINDOW_WIDTH = 1600
+MULTIBOARD_WINDOW_HEIGHT = 1000
+MULTIBOARD_DETAIL_SCALE = 0.35      # boards drawn smaller get no animation
+MULTIBOARD_LABEL_WIDTH = 150        # pixels: narrower tiles get no label
+MULTIBOARD_FONT_SIZE = 11
+MULTIBOARD_AUTOPLAY_RATE = 2        # fruits/sec
+MULTIBOARD_RESTART_DELAY = 3.0      # seconds of game over before a board starts again
+
+# background loading behind the welcome screen (loader.py)
+LOADER_INTERVAL = 1/60      # seconds between two polls of the main thread
+LOADER_FRAME_BUDGET = 0.004 # seconds of main thread work (texture uploads) per poll
+
+# game server for external agents (server.py, protocol.py)
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 5555
+SERVER_BATCH_STEPS = 8          # physics steps of a game per turn of the batch loop
+SERVER_STATS_INTERVAL = 10.0    # seconds
+
+# a board is at rest when its fruits are slower, see SuikaGame.is_settled()
+SETTLE_SPEED = 5.0          # pixels/s
+SETTLE_MAX_TIME = 10.0      # seconds of simulation of a settle, by default
+
+# distributed training (distributed.py)
+DIST_HOST = '127.0.0.1'
+DIST_PORT = 5556
+DIST_GAMES = 4              # games played in turn by an actor
+DIST_BATCH = 64             # transitions per batch sent to the learner
+DIST_SYNC_INTERVAL = 1.0    # seconds between two versions of the Q-table published by the learner
+DIST_MAX_FRAME = 1 << 28    # bytes, the whole Q-table goes in the first update of an actor
+
+# shared memory vector environment (shared_env.py)
+SHARED_ENVS = 16            # games, one slot each
+SHARED_WORKERS = 2          # simulator processes
+SHARED_POLL_INTERVAL = 0.0001   # seconds of sleep while waiting for a sequence counter
+SHARED_GAMEOVER_REWARD = -200.0
+
 PREVIEW_SHIFT_DELAY = 0.1  # seconds
 AUTOFIRE_DELAY = 0.5       # secondes
 SHAKE_FREQ_MIN = 1.5       # Hz
@@ -52,6 +128,8 @@ GAMEOVER_ANIMATION_INTERVAL = 0.3    # seconds
 
 
 ############# fruit animation settings ################
+VISI_NORMAL = 'visi_normal'     # sprite visibility of the fruit modes
+VISI_HIDDEN = 'visi_hidden'
 BLINK_DELAY = 1.0          # seconds
 BLINK_FREQ  = 6.0          # Hz
 FADEOUT_DELAY = 0.5        # seconds
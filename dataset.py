@@ -0,0 +1,175 @@
+""" Transitions dataset for offline training
+
+TransitionWriter streams the (observation, action, reward, next observation, done,
+score) transitions of the games into shards of DATASET_SHARD_SIZE transitions, one
+.npy file per field, written by a background thread. TransitionReader maps the
+shards in memory and samples minibatches from them.
+
+    python suika.py --dataset data/         # AI mode (I) records its transitions
+    python dataset.py data/                 # shards summary and sampling speed
+"""
+import argparse, os, queue, threading, time
+import numpy as np
+
+from constants import *
+
+
+def _fields(obs_shape):
+    """ Name, shape of one transition and dtype of the fields
+    """
+    return (
+        ( 'obs',      tuple(obs_shape), np.float32 ),
+        ( 'action',   (),               np.float32 ),
+        ( 'reward',   (),               np.float32 ),
+        ( 'next_obs', tuple(obs_shape), np.float32 ),
+        ( 'done',     (),               np.bool_ ),
+        ( 'score',    (),               np.int32 ),
+    )
+
+FIELDS = [ name for name, _, _ in _fields(()) ]
+_LAST_FIELD = FIELDS[-1]        # written last: marks a complete shard
+
+
+def _shard_path(directory, index, field):
+    return os.path.join( directory, f"shard_{index:05d}.{field}.npy" )
+
+
+class TransitionWriter(object):
+    """ Writes transitions to .npy shards from a background thread
+    Memory is bounded: shard buffers are preallocated and recycled, and add()
+    blocks when DATASET_QUEUE_SHARDS full shards are waiting to be written.
+    """
+    def __init__(self, directory, obs_shape, shard_size=DATASET_SHARD_SIZE, queue_shards=DATASET_QUEUE_SHARDS):
+        os.makedirs( directory, exist_ok=True )
+        self._directory = directory
+        self._fields = _fields( obs_shape )
+        self._shard_size = shard_size
+        # next shard index after the ones already in the directory
+        self._shard_index = 0
+        while( os.path.exists( _shard_path( directory, self._shard_index, _LAST_FIELD ) ) ):
+            self._shard_index += 1
+        self._full = queue.Queue( maxsize=queue_shards )
+        self._free = queue.Queue()
+        for _ in range( queue_shards + 1 ):
+            self._free.put( self._allocate() )
+        self._buffer = self._free.get()
+        self._count = 0
+        self._error = None
+        self.written = 0        # transitions on disk
+        self._thread = threading.Thread( target=self._write_loop, name="TransitionWriter", daemon=True )
+        self._thread.start()
+
+    def _allocate(self):
+        return { name: np.zeros( (self._shard_size,) + shape, dtype=dtype ) for name, shape, dtype in self._fields }
+
+    def add(self, obs, action, reward, next_obs, done, score):
+        if( self._error ):
+            raise self._error
+        i = self._count
+        b = self._buffer
+        b['obs'][i] = obs
+        b['action'][i] = action
+        b['reward'][i] = reward
+        b['next_obs'][i] = next_obs
+        b['done'][i] = done
+        b['score'][i] = score
+        self._count += 1
+        if( self._count == self._shard_size ):
+            self._flush()
+
+    def _flush(self):
+        if( self._count == 0 ):
+            return
+        self._full.put( (self._shard_index, self._buffer, self._count) )     # blocks if the writer is behind
+        self._shard_index += 1
+        self._buffer = self._free.get()
+        self._count = 0
+
+    def _write_loop(self):
+        while( True ):
+            item = self._full.get()
+            if( item is None ):
+                return
+            index, buffer, count = item
+            try:
+                for name in buffer:
+                    np.save( _shard_path( self._directory, index, name ), buffer[name][:count] )
+                self.written += count
+            except Exception as e:
+                self._error = e
+            self._free.put( buffer )
+
+    def close(self):
+        """ Writes the last, partial shard and stops the thread
+        """
+        if( not self._thread.is_alive() ):
+            return
+        self._flush()
+        self._full.put( None )
+        self._thread.join()
+        if( self._error ):
+            raise self._error
+
+
+class TransitionReader(object):
+    """ Memory-mapped shards of a TransitionWriter directory
+    """
+    def __init__(self, directory):
+        self._shards = []
+        index = 0
+        while( os.path.exists( _shard_path( directory, index, _LAST_FIELD ) ) ):
+            self._shards.append( { name: np.load( _shard_path( directory, index, name ), mmap_mode='r' )
+                                   for name in FIELDS } )
+            index += 1
+        if( not self._shards ):
+            raise FileNotFoundError( f"no transition shard in {directory}" )
+        self._sizes = np.array( [ len( s['done'] ) for s in self._shards ] )
+        self._rng = np.random.default_rng()
+
+    def __len__(self):
+        return int( self._sizes.sum() )
+
+    @property
+    def shards(self):
+        return len(self._shards)
+
+    def sample(self, batch_size):
+        """ Contiguous minibatch from a random shard and offset, without copy:
+        the arrays are views of the mapped files
+        """
+        k = self._rng.choice( len(self._shards), p=self._sizes / self._sizes.sum() )
+        shard = self._shards[k]
+        start = self._rng.integers( 0, max( 1, self._sizes[k] - batch_size + 1 ) )
+        return { name: shard[name][start:start + batch_size] for name in FIELDS }
+
+    def gather(self, batch_size, out=None):
+        """ Minibatch of independent transitions of a random shard, copied into out
+        (a dict of arrays reused from one call to the next, allocated if None)
+        """
+        k = self._rng.integers( len(self._shards) )
+        shard = self._shards[k]
+        idx = np.sort( self._rng.integers( 0, self._sizes[k], batch_size ) )    # sorted: sequential reads
+        if( out is None ):
+            out = { name: np.empty( (batch_size,) + shard[name].shape[1:], dtype=shard[name].dtype ) for name in FIELDS }
+        for name in FIELDS:
+            np.take( shard[name], idx, axis=0, out=out[name] )
+        return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transition dataset summary")
+    parser.add_argument('directory')
+    parser.add_argument('--batch', type=int, default=256, help="minibatch size of the sampling benchmark")
+    args = parser.parse_args()
+
+    reader = TransitionReader( args.directory )
+    print( f"{len(reader)} transitions in {reader.shards} shards" )
+    for name, sampler in ( ('sample', reader.sample), ('gather', reader.gather) ):
+        out = None
+        start = time.perf_counter()
+        for _ in range(1000):
+            out = sampler( args.batch ) if name == 'sample' else sampler( args.batch, out )
+        print( f"{name}({args.batch}): {1e6 * (time.perf_counter() - start) / 1000:.1f} us per minibatch" )
+
+if __name__ == '__main__':
+    main()
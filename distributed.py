@@ -0,0 +1,348 @@
+""" Distributed training: actor processes on any hosts, one learner, over TCP
+
+Actors play headless games with a local copy of the Q-table and ship their
+transitions to the learner by batches of DIST_BATCH. The learner owns the
+SuikaAgent: it trains on the transitions, and every DIST_SYNC_INTERVAL publishes
+the Q rows changed since, as a new version of the table. The reply to a batch holds
+the rows published since the version of the actor (the whole table on its first
+request) and the exploration rate.
+The frames are the ones of protocol.py. The states travel discretized, as the keys
+of the Q-table: tuples of ints, or of tuples of ints (the (x, y, kind, velocity)
+of the fruits), flattened to int32 after their count of ints (uint16) and the size
+of their inner tuples (uint8, 0 for flat keys).
+
+    python distributed.py learner [--host 0.0.0.0] [--save]
+    python distributed.py actor --learner HOST:PORT [--games 4]
+    python distributed.py local --actors 2 --seconds 60      # learner and actors on localhost
+"""
+import argparse, asyncio, contextlib, io, random, socket, struct, time
+import multiprocessing as mp
+import numpy as np
+
+from constants import *
+from game import SuikaGame
+import physics
+import protocol
+from shared_env import play_action
+from suika_agent import SuikaAgent
+
+BATCH_HEADER = struct.Struct( '<QI' )       # version of the actor table, transitions
+UPDATE_HEADER = struct.Struct( '<QfHI' )    # version, epsilon, action size, rows
+
+
+def encode_keys(keys):
+    """ Q-table keys (discretized states) as bytes: counts of ints (uint16), sizes of
+    the inner tuples (uint8), then the ints (int32)
+    """
+    widths = [ len(key[0]) if key and isinstance( key[0], tuple ) else 0 for key in keys ]
+    flat = [ list( sum( key, () ) ) if width else list(key) for key, width in zip( keys, widths ) ]
+    counts = np.array( [ len(ints) for ints in flat ], dtype=np.uint16 )
+    ints = np.array( [ i for ints in flat for i in ints ], dtype=np.int32 )
+    return counts.tobytes() + np.array( widths, dtype=np.uint8 ).tobytes() + ints.tobytes()
+
+
+def decode_keys(buffer, offset, count):
+    """ Returns the keys of encode_keys(), and the offset after them
+    """
+    counts, offset = _decode_array( buffer, offset, np.uint16, count )
+    widths, offset = _decode_array( buffer, offset, np.uint8, count )
+    ints, offset = _decode_array( buffer, offset, np.int32, int( counts.sum() ) )
+    ints = ints.tolist()
+    keys = []
+    start = 0
+    for n, width in zip( counts.tolist(), widths.tolist() ):
+        key = ints[start:start + n]
+        keys.append( tuple( tuple( key[i:i + width] ) for i in range( 0, n, width ) ) if width else tuple(key) )
+        start += n
+    return keys, offset
+
+
+def _decode_array(buffer, offset, dtype, count):
+    array = np.frombuffer( buffer, dtype=dtype, count=count, offset=offset )
+    return array, offset + array.nbytes
+
+
+def encode_batch(version, states, actions, rewards, next_states, dones, scores):
+    return protocol.frame( BATCH_HEADER.pack( version, len(states) )
+                           + encode_keys( states ) + encode_keys( next_states )
+                           + np.asarray( actions, dtype=np.float32 ).tobytes()
+                           + np.asarray( rewards, dtype=np.float32 ).tobytes()
+                           + np.asarray( dones, dtype=np.bool_ ).tobytes()
+                           + np.asarray( scores, dtype=np.int32 ).tobytes() )
+
+
+def decode_batch(body):
+    """ version, then the lists states, actions, rewards, next_states, dones, scores
+    """
+    version, n = BATCH_HEADER.unpack_from( body )
+    states, offset = decode_keys( body, BATCH_HEADER.size, n )
+    next_states, offset = decode_keys( body, offset, n )
+    actions, offset = _decode_array( body, offset, np.float32, n )
+    rewards, offset = _decode_array( body, offset, np.float32, n )
+    dones, offset = _decode_array( body, offset, np.bool_, n )
+    scores, offset = _decode_array( body, offset, np.int32, n )
+    if( offset != len(body) ):
+        raise protocol.ProtocolError( f"bad batch length {len(body)}" )
+    return version, states, actions.tolist(), rewards.tolist(), next_states, dones.tolist(), scores.tolist()
+
+
+def encode_update(version, epsilon, keys, values):
+    return protocol.frame( UPDATE_HEADER.pack( version, epsilon, values.shape[1], len(keys) )
+                           + encode_keys( keys ) + values.astype( np.float32 ).tobytes() )
+
+
+def decode_update(body):
+    """ version, epsilon, keys and values (rows, action size) of the rows
+    """
+    version, epsilon, action_size, n = UPDATE_HEADER.unpack_from( body )
+    keys, offset = decode_keys( body, UPDATE_HEADER.size, n )
+    values, offset = _decode_array( body, offset, np.float32, n * action_size )
+    return version, epsilon, keys, values.reshape( n, action_size )
+
+
+class Learner(object):
+    """ Trains the agent on the batches of the actors, and publishes the changed Q rows
+    """
+    def __init__(self, agent, sync_interval=DIST_SYNC_INTERVAL):
+        self.agent = agent
+        self._sync_interval = sync_interval
+        self.version = 0
+        self._changes = {}          # version: Q-table keys of the rows it published
+        self._base = 0              # versions up to this one are pruned from _changes
+        self._acked = {}            # handler task: version of its actor table
+        self._dirty = set( agent.q_table )
+        self.publish()
+        self._connections = {}      # handler task: writer, closed when the learner stops
+        # statistics
+        self.actors = 0
+        self.transitions = 0
+        self.games = 0
+        self.scores = []
+
+    def publish(self):
+        """ New version of the table with the rows trained since the last one
+        """
+        if( not self._dirty ):
+            return
+        self.version += 1
+        self._changes[self.version] = list( self._dirty )
+        self._dirty.clear()
+        self._prune()
+
+    def _prune(self):
+        """ Forgets the versions every connected actor has: an actor older than
+        them gets the whole table
+        """
+        acked = min( self._acked.values(), default=self.version )
+        while( self._base < acked ):
+            self._base += 1
+            self._changes.pop( self._base, None )
+
+    def train(self, states, actions, rewards, next_states, dones, scores):
+        agent = self.agent
+        for state, action, reward, next_state, done, score in zip( states, actions, rewards, next_states, dones, scores ):
+            agent.train( state, action, reward, next_state, done )
+            self._dirty.add( agent.discretize_state( state ) )
+            if( done ):
+                self.games += 1
+                self.scores.append( score )
+                agent.epsilon = max( agent.epsilon_min, agent.epsilon * agent.epsilon_decay )
+        self.transitions += len(states)
+
+    def update(self, version):
+        """ Update frame for an actor at version
+        """
+        keys = []
+        if( version < self._base ):
+            keys = list( self.agent.q_table )
+        elif( version < self.version ):
+            changes = self._changes
+            keys = list( dict.fromkeys( key for v in range( version + 1, self.version + 1 )
+                                        for key in changes[v] ) )
+        q_table = self.agent.q_table
+        values = np.array( [ q_table[key] for key in keys ], dtype=np.float32 ).reshape( len(keys), self.agent.action_size )
+        return encode_update( self.version, self.agent.epsilon, keys, values )
+
+    async def handle_connection(self, reader, writer):
+        self.actors += 1
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while( True ):
+                size, = protocol.LENGTH.unpack( await reader.readexactly( protocol.LENGTH.size ) )
+                if( size > DIST_MAX_FRAME ):
+                    raise protocol.ProtocolError( f"frame of {size} bytes" )
+                version, *batch = decode_batch( await reader.readexactly( size ) )
+                self._acked[task] = version
+                self.train( *batch )
+                writer.write( self.update( version ) )
+                await writer.drain()
+        except ( asyncio.IncompleteReadError, ConnectionError ):
+            pass
+        except protocol.ProtocolError as e:
+            print( f"closing an actor connection: {e}" )
+        finally:
+            self.actors -= 1
+            self._connections.pop( task, None )
+            self._acked.pop( task, None )
+            writer.close()
+
+    async def close_connections(self):
+        for writer in self._connections.values():
+            writer.close()          # the handlers read the end of their stream
+        await asyncio.gather( *self._connections, return_exceptions=True )
+
+    async def publish_loop(self):
+        while( True ):
+            await asyncio.sleep( self._sync_interval )
+            self.publish()
+
+
+async def serve(learner, host=DIST_HOST, port=DIST_PORT, stats=SERVER_STATS_INTERVAL, save=False, duration=None,
+                on_listen=()):
+    """ Runs the learner for duration seconds, or forever; on_listen: functions called once it listens
+    """
+    listener = await asyncio.start_server( learner.handle_connection, host=host, port=port )
+    print( f"learner listening on {host}:{port}, {len(learner.agent.q_table)} Q rows" )
+    for func in on_listen:
+        func()
+    publisher = asyncio.ensure_future( learner.publish_loop() )
+    start = time.perf_counter()
+    try:
+        async with listener:
+            while( duration is None or time.perf_counter() - start < duration ):
+                transitions, t = learner.transitions, time.perf_counter()
+                await asyncio.sleep( stats if duration is None else min( stats, duration ) )
+                dt = time.perf_counter() - t
+                scores = learner.scores[-100:]
+                print( f"{learner.actors} actors, {(learner.transitions - transitions) / dt:.0f} transitions/s, "
+                       f"{learner.games} games, average score {np.mean(scores) if scores else 0:.0f}, "
+                       f"{len(learner.agent.q_table)} Q rows, version {learner.version}, "
+                       f"epsilon {learner.agent.epsilon:.3f}" )
+                if( save ):
+                    learner.agent.save_model()
+    finally:
+        publisher.cancel()
+        await learner.close_connections()
+        if( save ):
+            learner.agent.save_model()
+
+
+class Actor(object):
+    """ Games played with a local copy of the Q-table, synchronized with the learner
+    """
+    def __init__(self, address, games=DIST_GAMES, instant=True, preset=physics.DEFAULT_PRESET,
+                 batch=DIST_BATCH, seed=None):
+        self._sock = socket.create_connection( address )
+        self._sock.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+        self.agent = SuikaAgent( model_file=None )
+        self.version = 0
+        self._batch = batch
+        random.seed( seed )
+        with contextlib.redirect_stdout( io.StringIO() ):
+            self._games = [ SuikaGame( instant=instant, preset=preset, sim_clock=True ) for _ in range( games ) ]
+        self._max_steps = int( SETTLE_MAX_TIME / self._games[0].interval )
+        self._sync( [] )
+
+    def close(self):
+        for game in self._games:
+            game.fruits.reset()
+        self._sock.close()
+
+    def _sync(self, transitions):
+        """ Sends the transitions, applies the update of the reply
+        """
+        self._sock.sendall( encode_batch( self.version, *zip( *transitions ) ) if transitions
+                            else encode_batch( self.version, [], [], [], [], [], [] ) )
+        version, epsilon, keys, values = decode_update( protocol.recv_frame( self._sock, DIST_MAX_FRAME ) )
+        if( values.shape[1] != self.agent.action_size ):
+            raise protocol.ProtocolError( f"learner action size {values.shape[1]}, actor {self.agent.action_size}" )
+        q_table = self.agent.q_table
+        for key, row in zip( keys, values ):
+            q_table[key] = row
+        self.version = version
+        self.agent.epsilon = epsilon
+
+    def run(self, duration=None):
+        """ Plays and ships batches until duration seconds, or forever
+        """
+        agent = self.agent
+        states = [ agent.discretize_state( agent.observation_state( game.observation() ) ) for game in self._games ]
+        transitions = []
+        start = time.perf_counter()
+        with contextlib.redirect_stdout( io.StringIO() ):      # messages of the game rules
+            while( duration is None or time.perf_counter() - start < duration ):
+                actions = agent.get_actions( states ).tolist()
+                for i, game in enumerate( self._games ):
+                    action = actions[i]
+                    ratio = game.action_space( agent.action_size ).ratio( action, game.next_kind )
+                    reward = play_action( game, ratio, self._max_steps )
+                    done = game.is_gameover
+                    score = game.score
+                    if( done ):
+                        game.reset()
+                    next_state = agent.discretize_state( agent.observation_state( game.observation() ) )
+                    transitions.append( (states[i], action, reward, next_state, done, score) )
+                    states[i] = next_state
+                if( len(transitions) >= self._batch ):
+                    self._sync( transitions )
+                    transitions = []
+
+
+def run_actor(address, games, instant, preset, seed=None, duration=None):
+    actor = Actor( address, games=games, instant=instant, preset=preset, seed=seed )
+    try:
+        actor.run( duration )
+    except ( ConnectionError, KeyboardInterrupt ):
+        pass
+    finally:
+        actor.close()
+
+
+def _address(text):
+    host, _, port = text.rpartition(':')
+    return ( host or DIST_HOST, int(port) )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed actor/learner training")
+    parser.add_argument('mode', choices=('learner', 'actor', 'local'))
+    parser.add_argument('--host', default=DIST_HOST, help="learner: listening address")
+    parser.add_argument('--port', type=int, default=DIST_PORT, help="learner: listening port")
+    parser.add_argument('--learner', type=_address, default=(DIST_HOST, DIST_PORT), metavar='HOST:PORT',
+                        help="actor: address of the learner")
+    parser.add_argument('--games', type=int, default=DIST_GAMES, help="actor: games played in turn")
+    parser.add_argument('--actors', type=int, default=2, help="local: actor processes")
+    parser.add_argument('--seconds', type=float, default=None, help="run time, forever by default")
+    parser.add_argument('--stats', type=float, default=SERVER_STATS_INTERVAL,
+                        help="learner: seconds between two statistics lines")
+    parser.add_argument('--save', action='store_true', help="learner: save the model with the statistics")
+    parser.add_argument('--seed', type=int, default=None, help="actor: seed of the games")
+    parser.add_argument('--no-instant', dest='instant', action='store_false', help="animated rules")
+    parser.add_argument('--physics', choices=list(physics.PRESETS), default=physics.DEFAULT_PRESET,
+                        help="physics quality preset")
+    args = parser.parse_args()
+
+    if( args.mode == 'actor' ):
+        run_actor( args.learner, args.games, args.instant, args.physics, args.seed, args.seconds )
+        return
+
+    learner = Learner( SuikaAgent() )
+    actors = []
+    if( args.mode == 'local' ):
+        ctx = mp.get_context('spawn')
+        for i in range( args.actors ):
+            seed = None if args.seed is None else args.seed + i
+            actors.append( ctx.Process( target=run_actor, name="Actor", daemon=True,
+                                        args=( (DIST_HOST, args.port), args.games, args.instant, args.physics,
+                                               seed, args.seconds ) ) )
+    try:
+        asyncio.run( serve( learner, host=args.host, port=args.port, stats=args.stats, save=args.save,
+                            duration=args.seconds, on_listen=[ p.start for p in actors ] ) )
+    except KeyboardInterrupt:
+        pass
+    for process in actors:
+        process.join( timeout=5 )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import heapq
+
+
+# Event types and their payload
+EVENT_SPAWN = 'spawn'               # (kind, x, y): new fruit, in bocal coordinates
+EVENT_REMOVE = 'remove'             # fruit id: end of a merge or of an explosion
+EVENT_EXPLOSE_SEQ = 'explose_seq'   # None: next explosion of the game over sequence
+
+
+class EventQueue(object):
+    """ Delayed game events, in simulation time.
+    Drained by the game at each physics step: the events are paused with
+    the game, cancelled by reset, and can be saved with the game state.
+    instant: all delays are zero, for the instant rules mode
+    """
+    def __init__(self, instant=False):
+        self.time = 0.0     # simulation time, seconds
+        self.instant = instant
+        self.clear()
+
+    def clear(self):
+        """ Cancels all pending events
+        """
+        self._heap = []     # (time, seq, type, payload)
+        self._seq = 0       # keeps the scheduling order for simultaneous events
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, delay, type, payload=None):
+        if( self.instant ):
+            delay = 0
+        heapq.heappush( self._heap, (self.time + delay, self._seq, type, payload) )
+        self._seq += 1
+
+    def advance(self, dt):
+        """ Advances the simulation time, yields the (type, payload) of due events
+        Events scheduled by the handlers with a short delay are yielded too.
+        """
+        self.time += dt
+        heap = self._heap
+        while( heap and heap[0][0] <= self.time ):
+            _, _, type, payload = heapq.heappop( heap )
+            yield (type, payload)
+
+    def pending(self):
+        """ Pending events as a list of [delay, type, payload], in order
+        """
+        return [ [t - self.time, type, payload] for (t, seq, type, payload) in sorted(self._heap) ]
+
+    def restore(self, pending):
+        """ Replaces the pending events with a list from pending()
+        """
+        self.clear()
+        for (delay, type, payload) in pending:
+            self.schedule( delay, type, payload )
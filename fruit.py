@@ -1,13 +1,13 @@
 import random
 
-import pyglet as pg
+import numpy as np
 import pymunk as pm
+import pymunk.batch
 
 from constants import *
 import utils
+import events
 
-from sprites import VISI_NORMAL, VISI_HIDDEN
-from sprites import FruitSprite, ExplosionSprite
 
 
 _FRUITS_DEF_ORIGINAL = [
@@ -45,64 +45,63 @@ _FRUITS_DEF = _FRUITS_DEF_ORIGINAL
 #_FRUITS_DEF = mode_mini( _FRUITS_DEF_ORIGINAL )
 _FRUITS_RANDOM = [ 1,2,3,4 ]
 
+# per kind constants, precomputed from _FRUITS_DEF (index 0 unused)
+_KIND_RADIUS = []
+_KIND_MASS = []
+_KIND_NAME = []
+_NB_FRUITS = 0
+
+def _update_kinds():
+    global _KIND_RADIUS, _KIND_MASS, _KIND_NAME, _NB_FRUITS
+    _KIND_RADIUS = [ 0 ] + [ f['radius'] for f in _FRUITS_DEF[1:] ]
+    _KIND_MASS = [ 0 ] + [ f['mass'] for f in _FRUITS_DEF[1:] ]
+    _KIND_NAME = [ None ] + [ f['name'] for f in _FRUITS_DEF[1:] ]
+    _NB_FRUITS = len(_FRUITS_DEF) - 1
+
+_update_kinds()
+
+def set_mode_mini(activate):
+    """ Switches between normal and mini fruits, for the fruits created afterwards
+    """
+    global _FRUITS_DEF
+    _FRUITS_DEF = mode_mini( _FRUITS_DEF_ORIGINAL ) if activate else _FRUITS_DEF_ORIGINAL
+    _update_kinds()
+
 def nb_fruits():
-    return len(_FRUITS_DEF) - 1
-
-MODE_WAIT = 'wait'
-MODE_FIRST_DROP = 'first_drop'
-MODE_NORMAL = 'normal'
-MODE_DRAG = 'drag'
-MODE_MERGE = 'merge'
-MODE_REMOVED = 'removed'
-
-SPRITE_MAIN = "sprite_main"
-SPRITE_EXPLOSION = "sprite_explosion"
-
-COLLISION_CAT = 'coll_cat'
-COLLISION_MASK = 'coll_mask'
-BODY_TYPE = 'body_type'
-VISI = 'visi'
-
-
-_FRUIT_MODES = {
-    MODE_WAIT: {
-        COLLISION_CAT: CAT_FRUIT_WAIT,
-        COLLISION_MASK: 0x00, # Collision with walls only  
-        VISI: VISI_NORMAL,
-        BODY_TYPE: pm.Body.KINEMATIC
-    },
-    MODE_FIRST_DROP: {
-        COLLISION_CAT: CAT_FRUIT_DROP,
-        COLLISION_MASK: CAT_FRUIT, # Collision with fruits and walls, but not with MAXLINE or other fruits FIRST_DROP  
-        VISI: VISI_NORMAL,
-        BODY_TYPE: pm.Body.KINEMATIC
-    },
-    MODE_NORMAL: {
-        COLLISION_CAT: CAT_FRUIT,
-        COLLISION_MASK: CAT_FRUIT_DROP | CAT_FRUIT | CAT_MAXLINE,
-        VISI: VISI_NORMAL,
-        BODY_TYPE: pm.Body.DYNAMIC
-    },
-    MODE_DRAG: {
-        COLLISION_CAT: CAT_FRUIT,
-        COLLISION_MASK: CAT_FRUIT_DROP | CAT_FRUIT | CAT_MAXLINE,
-        VISI: VISI_NORMAL,
-        BODY_TYPE: pm.Body.KINEMATIC
-    },
-    MODE_MERGE: {
-        COLLISION_CAT: CAT_FRUIT_MERGE,
-        COLLISION_MASK: 0x00,   # Collision with walls only  
-
-        VISI: VISI_NORMAL,
-        BODY_TYPE: pm.Body.KINEMATIC
-    },
-    MODE_REMOVED: {
-        COLLISION_CAT: CAT_FRUIT_REMOVED,
-        COLLISION_MASK: 0x00,   # Collision with walls only  
-        VISI: VISI_HIDDEN,
-        BODY_TYPE: pm.Body.KINEMATIC
-    }
-}
+    return _NB_FRUITS
+
+# fruit modes, used as index in _FRUIT_MODES
+MODE_WAIT = 0
+MODE_FIRST_DROP = 1
+MODE_NORMAL = 2
+MODE_DRAG = 3
+MODE_MERGE = 4
+MODE_REMOVED = 5
+
+_MODE_NAMES = ( 'wait', 'first_drop', 'normal', 'drag', 'merge', 'removed' )
+
+
+def _mode_attrs(cat, mask, visi, body_type):
+    """ Attributes of a mode: (shape filter, sprites visibility, body type)
+    the filter is built once and shared by all the fruits
+    """
+    # collision systematique avec les murs
+    return ( pm.ShapeFilter( categories=cat, mask=mask | CAT_WALLS ), visi, body_type )
+
+_FRUIT_MODES = (
+    # MODE_WAIT: collision with walls only
+    _mode_attrs( CAT_FRUIT_WAIT, 0x00, VISI_NORMAL, pm.Body.KINEMATIC ),
+    # MODE_FIRST_DROP: collision with fruits and walls, but not with MAXLINE or other fruits FIRST_DROP
+    _mode_attrs( CAT_FRUIT_DROP, CAT_FRUIT, VISI_NORMAL, pm.Body.KINEMATIC ),
+    # MODE_NORMAL
+    _mode_attrs( CAT_FRUIT, CAT_FRUIT_DROP | CAT_FRUIT | CAT_MAXLINE, VISI_NORMAL, pm.Body.DYNAMIC ),
+    # MODE_DRAG
+    _mode_attrs( CAT_FRUIT, CAT_FRUIT_DROP | CAT_FRUIT | CAT_MAXLINE, VISI_NORMAL, pm.Body.KINEMATIC ),
+    # MODE_MERGE: collision with walls only
+    _mode_attrs( CAT_FRUIT_MERGE, 0x00, VISI_NORMAL, pm.Body.KINEMATIC ),
+    # MODE_REMOVED: collision with walls only
+    _mode_attrs( CAT_FRUIT_REMOVED, 0x00, VISI_HIDDEN, pm.Body.KINEMATIC ),
+)
 
 
 _g_fruit_id = 0
@@ -111,6 +110,12 @@ def _get_new_id():
     _g_fruit_id +=1
     return _g_fruit_id
 
+def _reserve_ids(last_id):
+    """ New ids will follow last_id (fruits restored from a snapshot)
+    """
+    global _g_fruit_id
+    _g_fruit_id = max( _g_fruit_id, last_id )
+
 
 # FOR DEBUG: Mode changes allowed 
 g_valid_transitions = {
@@ -127,7 +132,7 @@ def random_kind():
     return random.choice( _FRUITS_RANDOM )
 
 def name_from_kind(kind):
-    return _FRUITS_DEF[kind]["name"]
+    return _KIND_NAME[kind]
 
 
 class AnimatedCircle( pm.Circle ):
@@ -153,30 +158,40 @@ class AnimatedCircle( pm.Circle ):
 
 
 class Fruit( object ):
-    def __init__(self, space, position, on_remove=None, kind=0, mode=MODE_WAIT):
+    # hundreds of fruits on late-game boards and mini-mode piles
+    __slots__ = ( '_id', '_kind', '_space', '_on_remove', '_body', '_body_id', '_shape',
+                  '_sprite', '_explosion', '_fruit_mode', '_dash_start_time', '_drag_offset', '_events',
+                  '_drawn', '_render' )
+
+    def __init__(self, space, position, on_remove=None, kind=0, mode=MODE_WAIT, events=None, id=None,
+                 render=None):
         # Random species if not specified  
         assert kind<=nb_fruits(), "Unknown fruit type"  
         assert position
         if( kind<=0 ):
             kind = random_kind()
-        fruit_def = _FRUITS_DEF[kind]
 
-        self._id = _get_new_id()
+        self._id = id if id else _get_new_id()     # id given when restored from a snapshot
         self._kind = kind
         self._space = space
         self._on_remove = on_remove
+        self._events = events       # EventQueue of the game, for the delayed removal
         self._body, self._shape = self._make_shape(
-            radius=fruit_def['radius'],
-            mass=fruit_def['mass'], 
+            radius=_KIND_RADIUS[kind],
+            mass=_KIND_MASS[kind], 
             position=position)
         self._shape.collision_type = kind
+        self._body_id = self._body.id    # row key of the batched body data
         space.add(self._body, self._shape)
 
-        self._sprites = { 
-            SPRITE_MAIN : FruitSprite( 
-                nom=fruit_def['name'], 
-                r=fruit_def['radius'] )
-        }
+        self._render = render       # sprites.RenderContext, None without display
+        self._sprite = None         # main sprite
+        self._explosion = None      # explosion sprite
+        self._drawn = None          # (x, y, angle) of the last sprite update
+        if( render ):
+            self._sprite = render.fruit_sprite( 
+                nom=_KIND_NAME[kind], 
+                r=_KIND_RADIUS[kind] )
         self._fruit_mode = None
         self._dash_start_time = None
         self._drag_offset = None
@@ -187,12 +202,13 @@ class Fruit( object ):
     def __del__(self):
         assert(    self._body is None 
                and self._shape is None 
-               and len(self._sprites)==0
+               and self._sprite is None
+               and self._explosion is None
                and self._fruit_mode == MODE_REMOVED), "Resources not released"
 
 
     def __repr__(self):
-        return f"{_FRUITS_DEF[self._kind]['name']}#{self._id}"
+        return f"{_KIND_NAME[self._kind]}#{self._id}"
 
 
     def _make_shape(self, radius, mass, position):
@@ -210,23 +226,25 @@ class Fruit( object ):
 
     def release_ressources(self):
         if( not self.removed ):
-            print( f"WARNING: {self} delete() called with mode different from MODE_REMOVED ({self._fruit_mode})" )
+            print( f"WARNING: {self} delete() called with mode different from MODE_REMOVED ({_MODE_NAMES[self._fruit_mode]})" )
         # remove pymunk objects and local references
         if( self._body or self._shape):
             self._space.remove( self._body, self._shape )
             self._body = self._shape = None
-        for k,sprite in self._sprites.items():
-            sprite.delete()
-        self._sprites = {}
+        if( self._sprite ):
+            self._sprite.delete()
+            self._sprite = None
+        if( self._explosion ):
+            self._explosion.delete()
+            self._explosion = None
 
     # Only used to move the pending fruit (next_fruit)  
     def on_window_resize(self, width, height):
         if(self._fruit_mode != MODE_WAIT):
-            print(f"{self} WARNING: on_resize() ignored in mode {self._fruit_mode}")
+            print(f"{self} WARNING: on_resize() ignored in mode {_MODE_NAMES[self._fruit_mode]}")
             return
-        fruit_def = _FRUITS_DEF[self._kind]
         x = width//2
-        y = height - fruit_def['radius'] - 5
+        y = height - _KIND_RADIUS[self._kind] - 5
         self.position = pm.Vec2d(x,y)
 
 
@@ -264,9 +282,8 @@ class Fruit( object ):
         return self._shape.radius
 
     def _is_deleted(self):
-        return (self._body==None 
-            and self._shape==None
-            and self._sprites==None )
+        return (self._body is None 
+            and self._shape is None )
 
 
     def _set_mode(self, mode):
@@ -280,38 +297,52 @@ class Fruit( object ):
             return
 
         self._fruit_mode = mode
-        attrs = _FRUIT_MODES[self._fruit_mode]
+        shape_filter, visi, body_type = _FRUIT_MODES[mode]
 
         # DYNAMIC or KINEMATIC  
-        self._body.body_type = attrs[BODY_TYPE]
+        self._body.body_type = body_type
 
         # Sprites visibility  
-        for s in self._sprites.values( ):
-            s.visibility = attrs[VISI]
+        if( self._sprite ):
+            self._sprite.visibility = visi
+        if( self._explosion ):
+            self._explosion.visibility = visi
 
         # Modifies the collision rules  
-        self._shape.filter = pm.ShapeFilter(
-            categories= attrs[COLLISION_CAT],
-            mask = attrs[COLLISION_MASK] | CAT_WALLS )  # collision systematique avec les murs
+        self._shape.filter = shape_filter
 
 
-    def update(self):
-        """Updates the fruit's sprite based on the physics simulation and other factors."""
+    def update(self, min_move=0):
+        """Updates the fruit's sprite based on the physics simulation and other factors.
+        min_move: pixels, the sprite stays in place while the fruit moves less (boards drawn small)
+        """
         if( self.removed or self._is_deleted() ):
             return
         (x, y) = self._body.position
-        degres = -180/3.1416 * self._body.angle  # pymunk and pyglet have opposite rotation directions  
-        for s in self._sprites.values():
-            s.update( x=x, y=y, rotation=degres, on_animation_stop=None )
+        angle = self._body.angle
+        if( min_move and self._drawn ):
+            (x0, y0, a0) = self._drawn
+            if( abs(x - x0) < min_move and abs(y - y0) < min_move
+                    and abs(angle - a0) * self._shape.radius < min_move ):
+                self._shape.update_animation()
+                return
+        self._drawn = (x, y, angle)
+        degres = -180/3.1416 * angle  # pymunk and pyglet have opposite rotation directions  
+        if( self._sprite ):
+            self._sprite.update( x=x, y=y, rotation=degres, on_animation_stop=None )
+        if( self._explosion ):
+            self._explosion.update( x=x, y=y, rotation=degres, on_animation_stop=None )
         self._shape.update_animation()
 
 
 
     def blink(self, activate, delay=0):
+        if( not self._sprite ):
+            return
         if(not activate):
-            self._sprites[SPRITE_MAIN].blink = False
-        elif( not self._sprites[SPRITE_MAIN].blink ):
-            self._sprites[SPRITE_MAIN].blink = True
+            self._sprite.blink = False
+        elif( not self._sprite.blink ):
+            self._sprite.blink = True
 
 
     def drop(self):
@@ -333,14 +364,18 @@ class Fruit( object ):
             return
         #print( f"{self}.fade_in()")
         self.normal()
-        self._sprites[SPRITE_MAIN].fadein = True
+        if( self._events and self._events.instant ):
+            return      # full size at once, no animation
+        if( self._sprite ):
+            self._sprite.fadein = True
         self._shape.grow_start()
 
 
     def fade_out(self):
         assert( self._body.body_type == pm.Body.KINEMATIC )
         self.normal()
-        self._sprite[SPRITE_MAIN].fadeout = True
+        if( self._sprite ):
+            self._sprite.fadeout = True
 
 
     def drag_mode(self, cursor):
@@ -365,7 +400,17 @@ class Fruit( object ):
             return
         self._set_mode( MODE_MERGE )  # No more collisions with fruits  
         self.set_velocity_to(dest, delay=MERGE_DELAY)
-        pg.clock.schedule_once(lambda dt : self.remove(), delay=MERGE_DELAY )
+        self._events.schedule( MERGE_DELAY, events.EVENT_REMOVE, self._id )
+
+
+    def restore_motion(self, velocity, angle, angular_velocity):
+        """ Motion saved in a snapshot
+        """
+        self._body.velocity = velocity
+        self._body.angle = angle
+        self._body.angular_velocity = angular_velocity
+        if( self._fruit_mode == MODE_FIRST_DROP ):
+            self._shape.collision_type = COLLISION_TYPE_FIRST_DROP
 
 
     def set_velocity_to(self, dest, delay):
@@ -381,12 +426,16 @@ class Fruit( object ):
         if( self._fruit_mode in [MODE_MERGE, MODE_REMOVED] ):
             return
         self._set_mode(MODE_MERGE)
-        explo = ExplosionSprite( 
+        # removed in simulation time, the animation lasts EXPLOSION_DELAY as well
+        self._events.schedule( EXPLOSION_DELAY, events.EVENT_REMOVE, self._id )
+        if( not self._sprite or self._events.instant or not self._render.animations ):
+            return
+        explo = self._render.explosion_sprite( 
             r=self._shape.radius, 
-            on_explosion_end=self.remove)
+            on_explosion_end=None)
         explo.position = ( *self._body.position, 1)
-        self._sprites[SPRITE_EXPLOSION] = explo
-        self._sprites[SPRITE_MAIN].fadeout = True
+        self._explosion = explo
+        self._sprite.fadeout = True
 
 
     def is_offscreen(self) -> bool :
@@ -404,11 +453,19 @@ class Fruit( object ):
         self.release_ressources()
 
 
+# motion of the bodies, by pymunk.batch.get_space_bodies()
+_BATCH_FIELDS = ( pymunk.batch.BodyFields.BODY_ID | pymunk.batch.BodyFields.POSITION | pymunk.batch.BodyFields.ANGLE
+                  | pymunk.batch.BodyFields.VELOCITY | pymunk.batch.BodyFields.ANGULAR_VELOCITY )
+
+
 class ActiveFruits(object):
 
-    def __init__(self, space, width, height):
+    def __init__(self, space, width, height, events, render=None):
         self._space = space
+        self._events = events
+        self._render = render       # sprites.RenderContext of the new fruits
         self._fruits = dict()
+        self._batch = pymunk.batch.Buffer()     # reused by get_state()
         self._score = 0
         self._next_fruit = None
         self._window_size = ( width, height )
@@ -422,13 +479,12 @@ class ActiveFruits(object):
         self.remove_all()
         self.remove_next()
         self._score = 0
-        pg.clock.unschedule( self.explose_seq )
 
-    def update(self):
+    def update(self, min_move=0):
         if( self._next_fruit ):
             self._next_fruit.update()
         for f in self._fruits.values():
-            f.update()
+            f.update( min_move )
 
     def prepare_next(self, kind):
         """Creates a fruit waiting to be dropped."""
@@ -439,7 +495,9 @@ class ActiveFruits(object):
         self._next_fruit = Fruit(space=self._space,
                                  kind=kind, 
                                  position=self._next_position(),
-                                 on_remove=self.on_remove)
+                                 on_remove=self.on_remove,
+                                 events=self._events,
+                                 render=self._render)
         # self.add() appelé dans play_next()
 
     def drop_next(self, position):
@@ -455,7 +513,7 @@ class ActiveFruits(object):
 
     def remove(self, id):
         points = 0
-        if id in self._fruits:
+        if id in self._fruits and not self._fruits[id].removed:
             points = self._fruits[id].points
             self._fruits[id].remove()
         return points
@@ -467,6 +525,14 @@ class ActiveFruits(object):
         self.cleanup()
         return points
 
+    def replace_next(self, kind):
+        """ Changes the kind of the fruit waiting to be dropped
+        """
+        if( self._next_fruit ):
+            self._next_fruit._on_remove = None      # not scored
+            self.remove_next()
+        self.prepare_next( kind )
+
     def remove_next(self):
         if( self._next_fruit ):
             self._next_fruit.remove()
@@ -477,7 +543,9 @@ class ActiveFruits(object):
         f =  Fruit( space=self._space,
                     kind=kind,
                     position=position,
-                    on_remove=self.on_remove)
+                    on_remove=self.on_remove,
+                    events=self._events,
+                    render=self._render)
         self.add(f)
         f.fade_in()
         return f
@@ -485,7 +553,7 @@ class ActiveFruits(object):
     def on_remove(self, f):
         self._score += f.points
 
-    def explose_seq(self, dt):
+    def explose_seq(self):
         """Makes the fruits explode, starting with the most recent one."""  
         # Searches for the oldest non-exploded fruit  
         explosables = [ i for i,f in self._fruits.items() if f._fruit_mode in [MODE_NORMAL, MODE_FIRST_DROP] ]
@@ -495,18 +563,67 @@ class ActiveFruits(object):
         # Finds the oldest non-exploded fruit  
         # Continues as long as there are fruits remaining  
         if( self._fruits ):
-            pg.clock.schedule_once( self.explose_seq, GAMEOVER_ANIMATION_INTERVAL )
+            self._events.schedule( GAMEOVER_ANIMATION_INTERVAL, events.EVENT_EXPLOSE_SEQ )
 
     def gameover(self):
         self._is_gameover = True
         self.remove_next()
+        if( self._events.instant ):
+            # remaining fruits are scored at once, as after the explosion sequence
+            self.remove_all()
+            return
         # program the explosion of remaining fruits
         print( f'Programming final explosion for {len(self._fruits)} active fruits')
-        pg.clock.schedule_once( self.explose_seq, GAMEOVER_ANIMATION_START)
+        self._events.schedule( GAMEOVER_ANIMATION_START, events.EVENT_EXPLOSE_SEQ )
 
     def add(self, newfruit):
         self._fruits[ newfruit.id ] = newfruit
 
+    def get_state(self, dtype=np.float32):
+        """ Fruits in play as two arrays, for the board snapshots
+        ints (n, 3): id, kind, mode
+        floats (n, 6): x, y, angle, vx, vy, angular velocity
+        """
+        # one call for the motion of all the bodies of the space, in its own order
+        self._batch.clear()
+        pymunk.batch.get_space_bodies( self._space, _BATCH_FIELDS, self._batch )
+        body_ids = np.frombuffer( self._batch.int_buf(), dtype=np.intp ).tolist()
+        motion = np.frombuffer( self._batch.float_buf(), dtype=np.float64 ).reshape(-1, 6)
+
+        fruits = { f._body_id: f for f in self._fruits.values() if f._fruit_mode != MODE_REMOVED }
+        rows = []
+        ints = []
+        for row, body_id in enumerate( body_ids ):
+            f = fruits.get( body_id )
+            if( f ):            # not the bocal, the walls or the next fruit
+                rows.append( row )
+                ints.append( (f._id, f._kind, f._fruit_mode) )
+        return ( np.array( ints, dtype=np.int32 ).reshape(-1, 3),
+                 motion[rows].astype( dtype ) )
+
+    def set_state(self, ints, floats, score, is_gameover):
+        """ Replaces the fruits in play with arrays from get_state()
+        The fruits keep their id: the pending events refer to them.
+        """
+        self.reset()
+        for (id, kind, mode), (x, y, angle, vx, vy, w) in zip( ints.tolist(), floats.tolist() ):
+            if( mode == MODE_DRAG ):
+                mode = MODE_NORMAL      # the drag is not saved
+            f = Fruit( space=self._space,
+                       kind=kind,
+                       position=(x, y),
+                       on_remove=self.on_remove,
+                       mode=mode,
+                       events=self._events,
+                       id=id,
+                       render=self._render )
+            f.restore_motion( (vx, vy), angle, w )
+            self.add(f)
+        if( len(ints) ):
+            _reserve_ids( int( ints[:, 0].max() ) )
+        self._score = score
+        self._is_gameover = is_gameover
+
     def cleanup(self, all_fruits=False):
         """ garbage collection 
         """
@@ -0,0 +1,601 @@
+import time
+import numpy as np
+import pymunk as pm
+
+from constants import *
+from bocal import Bocal
+from fruit import ActiveFruits
+from collision import CollisionHelper
+from preview import FruitQueue
+from action_space import ActionSpace, drop_margin
+import utils
+import events
+import physics
+import profiler
+import rewind
+
+
+# Player actions, recorded for the replays, and their payload
+ACTION_DROP = 'drop'            # (kind, x, y): fruit dropped, in world coordinates
+ACTION_SHOOT = 'shoot'          # fruit id
+ACTION_GAMEOVER = 'gameover'    # None
+
+
+class Autoplayer(object):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._rate = 0
+        self.disable()
+
+    def get_rate(self):
+        return self._rate
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    def enable(self):
+        if( not self._enabled ):
+            self._enabled = True
+            if( self._rate==0 ):
+                self._rate = AUTOPLAY_INITIAL_RATE
+
+    def disable(self):
+        self._time_debt = 0
+        self._enabled = False
+
+    def toggle(self):
+        if( not self._enabled ):
+             self.enable()
+        else:
+            self.disable()
+
+    def set_rate(self, rate):
+        self._time_debt = 0
+        self._rate = max( 0, rate )
+
+    def adjust_rate( self, adj ):
+        self._time_debt = 0
+        if( adj>0 and self._rate==0 ):
+            self._rate = AUTOPLAY_INITIAL_RATE
+        else:
+            self._rate = max( 0, self._rate+adj )
+        print(f"autoplayer rate = {self._rate} fruits/sec")
+
+    def step(self, dt):
+        # called each frame
+        # returns the number of fruits to drop on the current frame
+        if( not self._enabled or self._rate == 0 ):
+            return 0
+        t = self._time_debt + dt
+        nb = int( t * self._rate )
+        self._time_debt = t - nb/self._rate
+        return nb
+
+
+class RainRamp(object):
+    """ Load test: raises the autoplay rate stage after stage, as long as
+    the physics steps (and the frames, in a window) hold within the budget.
+    """
+    def __init__(self, autoplayer, budget=PYMUNK_INTERVAL):
+        # callbacks
+        self.on_finished = None
+
+        self._autoplayer = autoplayer
+        self._budget = budget
+        self.stages = []
+        self.overflows = 0
+        self._rate = RAIN_START_RATE
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def start(self):
+        self.stages = []
+        self.overflows = 0
+        self._rate = RAIN_START_RATE
+        self._running = True
+        self._new_stage()
+        self.resume()
+
+    def stop(self):
+        if( self._running ):
+            self._running = False
+            self._autoplayer.disable()
+
+    def resume(self):
+        """ Restores the drop rate after a game reset
+        """
+        self._autoplayer.set_rate( self._rate )
+        self._autoplayer.enable()
+
+    def _new_stage(self):
+        self._stage_time = 0
+        self._step_times = []
+        self._frame_times = []
+        self._fruits_max = 0
+
+    def record_step(self, dt, duration, fruit_count):
+        """ called after each physics step
+        dt: simulated time, duration: time spent computing the step
+        """
+        if( not self._running ):
+            return
+        self._stage_time += dt
+        self._step_times.append( duration )
+        self._fruits_max = max( self._fruits_max, fruit_count )
+        if( self._stage_time >= RAIN_STAGE_DURATION ):
+            self._end_stage()
+
+    def record_frame(self, duration):
+        if( self._running ):
+            self._frame_times.append( duration )
+
+    def _end_stage(self):
+        step_p95 = float( np.percentile(self._step_times, 95) )
+        frame_p95 = float( np.percentile(self._frame_times, 95) ) if self._frame_times else 0.0
+        ok = step_p95 <= self._budget and frame_p95 <= self._budget
+        self.stages.append( {
+            'rate': self._rate,
+            'fruits_max': self._fruits_max,
+            'step_p95_ms': round( 1000*step_p95, 4 ),
+            'frame_p95_ms': round( 1000*frame_p95, 4 ),
+            'ok': ok } )
+        print( f"rain {self._rate} fruits/sec: {self._fruits_max} fruits, "
+               f"step p95 {1000*step_p95:.3f} ms, frame p95 {1000*frame_p95:.3f} ms {'ok' if ok else 'OVER BUDGET'}" )
+
+        if( not ok or self._rate + RAIN_RATE_STEP > RAIN_MAX_RATE ):
+            self.stop()
+            if( self.on_finished ):
+                self.on_finished()
+            return
+        self._rate += RAIN_RATE_STEP
+        self._new_stage()
+        self.resume()
+
+    def best(self):
+        """ Last stage within the budget, None if the first one already failed
+        """
+        ok = [ s for s in self.stages if s['ok'] ]
+        return ok[-1] if ok else None
+
+    def report(self):
+        best = self.best()
+        if( not best ):
+            return "rain: over budget from the first stage"
+        # boards of this load that one core can step at 120 Hz
+        boards = int( self._budget * 1000 / max( best['step_p95_ms'], best['frame_p95_ms'], 1e-6 ) )
+        return ( f"rain: max {best['rate']} fruits/sec with {best['fruits_max']} fruits at "
+                 f"{1/self._budget:.0f} Hz (step p95 {best['step_p95_ms']:.3f} ms, ~{boards} boards/core)" )
+
+
+class SuikaGame(object):
+    """ Rules and physics simulation of one board, without any window.
+    SuikaWindow displays one of these, the benchmarks run them headless.
+    """
+    def __init__(self, width=WINDOW_WIDTH, height=WINDOW_HEIGHT, frame_profiler=None, instant=False,
+                 preset=physics.DEFAULT_PRESET, spatial_hash=None, threads=1, render=None, sim_clock=False):
+        """ preset: physics quality preset name (physics.PRESETS)
+        spatial_hash: spatial hash broadphase, None to follow the preset
+        threads: pymunk solver threads, physics.THREADS_AUTO to follow the fruit count
+        render: sprites.RenderContext of the board, None for a game without sprites
+        sim_clock: the game over countdown follows the simulation time instead of
+            utils.now(), for games stepped faster than real time (server.py)
+        """
+        # callbacks
+        self.on_gameover = None
+        self.on_action = None       # on_action(type, payload), for the replays
+
+        bocal_coords = utils.bocal_coords(window_w=width, window_h=height)
+        self._preset = physics.PRESETS[preset]
+        self._spatial_hash = self._preset.spatial_hash if spatial_hash is None else spatial_hash
+        self._threads_auto = threads == physics.THREADS_AUTO and physics.threading_supported()
+        self._space = physics.make_space( threads )
+        self._space.gravity = (0, GRAVITY)
+        physics.configure_space( self._space, self._preset, bocal_coords['bocal_w'], bocal_coords['bocal_h'],
+                                 spatial_hash=self._spatial_hash )
+        self._events = events.EventQueue(instant=instant)
+        self._render = render
+        self._bocal = Bocal(space=self._space, render=render, **bocal_coords)
+        self._preview = FruitQueue(cnt=PREVIEW_COUNT, render=render)
+        self._fruits = ActiveFruits(space=self._space, width=width, height=height, events=self._events,
+                                    render=render)
+        self._countdown = utils.CountDown( clock=(lambda: self._events.time) if sim_clock else None )
+        self._collision_helper = CollisionHelper(self._space, self._events)
+        self._autoplayer = Autoplayer()
+        self._rain = RainRamp(self._autoplayer)
+        self._profiler = frame_profiler if frame_profiler else profiler.FrameProfiler()
+        self._action_spaces = {}    # size: ActionSpace of the jar, until the next resize
+        self._event_handlers = {
+            events.EVENT_SPAWN: self._on_spawn,
+            events.EVENT_REMOVE: self._fruits.remove,
+            events.EVENT_EXPLOSE_SEQ: lambda payload: self._fruits.explose_seq(),
+        }
+        self.reset()
+
+    def reset(self):
+        self._is_gameover = False
+        self._is_paused = False
+        self._dragged_fruit = None
+        self._steps = 0
+        self.merges = 0
+        self._events.clear()
+        self._bocal.reset()
+        self._preview.reset()
+        self._fruits.reset()
+        self._collision_helper.reset()
+        self._countdown.reset()
+        self._autoplayer.reset()
+        if( self._rain.running ):
+            self._rain.resume()
+        self.prepare_next()
+
+    @property
+    def space(self):
+        return self._space
+
+    @property
+    def render(self):
+        return self._render
+
+    @property
+    def bocal(self):
+        return self._bocal
+
+    @property
+    def fruits(self):
+        return self._fruits
+
+    @property
+    def preview(self):
+        return self._preview
+
+    @property
+    def preset(self):
+        return self._preset
+
+    @property
+    def spatial_hash(self):
+        return self._spatial_hash
+
+    @property
+    def interval(self):
+        """ Simulated time of one step(), seconds
+        """
+        return self._preset.interval
+
+    @property
+    def events(self):
+        return self._events
+
+    @property
+    def instant(self):
+        return self._events.instant
+
+    def set_instant(self, instant):
+        """ Instant rules: merges resolve in the step of the collision, spawned
+        fruits appear at full size and the game over skips the explosions.
+        For training, when nobody watches. Scoring and physics are unchanged.
+        """
+        self._events.instant = bool(instant)
+
+    @property
+    def autoplayer(self):
+        return self._autoplayer
+
+    @property
+    def rain(self):
+        return self._rain
+
+    @property
+    def score(self):
+        return self._fruits._score
+
+    @property
+    def is_gameover(self):
+        return self._is_gameover
+
+    @property
+    def is_paused(self):
+        return self._is_paused
+
+    @property
+    def steps(self):
+        """ Ticks since the game start
+        """
+        return self._steps
+
+    @property
+    def next_kind(self):
+        """ Kind of the fruit to drop, 0 if none
+        """
+        next = self._fruits.peek_next()
+        return next.kind if next else 0
+
+    def action_space(self, size):
+        """ ActionSpace of size drop positions for the jar
+        """
+        space = self._action_spaces.get( size )
+        if( space is None ):
+            space = self._action_spaces[size] = ActionSpace( size, self._bocal.width )
+        return space
+
+
+    def snapshot(self, dtype=np.float32):
+        """ State of the board as a rewind.BoardSnapshot
+        dtype: precision of the positions and velocities
+        """
+        ints, floats = self._fruits.get_state( dtype )
+        next = self._fruits.peek_next()
+        return rewind.BoardSnapshot(
+            steps=self._steps,
+            time=self._events.time,
+            fruit_ints=ints,
+            fruit_floats=floats,
+            next_kind=next.kind if next else 0,
+            preview=np.array( self._preview.kinds(), dtype=np.int8 ),
+            score=self._fruits._score,
+            merges=self.merges,
+            countdown=self._countdown.elapsed(),
+            is_gameover=self._is_gameover,
+            events=self._events.pending() )
+
+
+    def observation(self, max_fruits=OBS_MAX_FRUITS):
+        """ Fixed size view of the board for learning, float32 (max_fruits + 1, 3)
+        row 0: kind of the next fruit in column 2, 0 if none
+        next rows: x, y, kind of the fruits in the jar, highest first, zero padded.
+        x and y go from 0 to 1 across the jar, from its bottom left corner.
+        """
+        obs = np.zeros( (max_fruits + 1, 3), dtype=np.float32 )
+        next = self._fruits.peek_next()
+        if( next ):
+            obs[0, 2] = next.kind
+        ints, floats = self._fruits.get_state( np.float64 )
+        if( len(ints) ):
+            local = self._bocal.to_bocal_array( floats[:, :2] )
+            top = np.argsort( -local[:, 1] )[:max_fruits]
+            n = len(top)
+            obs[1:n+1, 0] = local[top, 0] / self._bocal.width + 0.5
+            obs[1:n+1, 1] = local[top, 1] / self._bocal.height + 0.5
+            obs[1:n+1, 2] = ints[top, 1]
+        return obs
+
+
+    def restore(self, snapshot):
+        """ Puts the board back in the state of a snapshot, with the jar at rest
+        The pause state is kept.
+        """
+        self._dragged_fruit = None
+        self._steps = snapshot.steps
+        self._is_gameover = snapshot.is_gameover
+        self.merges = snapshot.merges
+        self._bocal.reset()
+        self._collision_helper.reset()
+        self._events.time = snapshot.time
+        self._events.restore( snapshot.events )
+        self._fruits.set_state( snapshot.fruit_ints, snapshot.fruit_floats, snapshot.score, snapshot.is_gameover )
+        self._preview.set_kinds( snapshot.preview.tolist() )
+        if( snapshot.next_kind ):
+            self._fruits.prepare_next( kind=snapshot.next_kind )
+        self._countdown.set_elapsed( snapshot.countdown )
+
+
+    def prepare_next(self):
+        kind = self._preview.get_next_fruit()
+        self._fruits.prepare_next( kind=kind )
+
+
+    def drop(self, cursor_x, nb=1, ratio=None):
+        """ cursor_x: window abscissa of the drop, random if None
+        ratio: drop point from 0 (left) to 1 (right) of the jar, as the x of
+            observation(), instead of cursor_x
+        """
+        for _ in range(nb):
+            next = self._fruits.peek_next()
+            if( not next ):
+                return
+            margin = drop_margin( next.radius )
+
+            # position of the mouse or random if x = None
+            if( ratio is not None ):
+                pos = self._bocal.drop_point_ratio( ratio, margin=margin )
+            elif( cursor_x is None ):
+                pos = self._bocal.drop_point_random( margin=margin )
+            else:
+                pos = self._bocal.drop_point_cursor( cursor_x, margin=margin )
+
+            if( not pos ):            # pos==None if click is outside container
+                return
+            if( self.on_action ):
+                self.on_action( ACTION_DROP, (next.kind, pos[0], pos[1]) )
+            self._fruits.drop_next(pos)
+            self.prepare_next()
+
+
+    def drop_action(self, action, size):
+        """ Drops the next fruit at an action of action_space(size)
+        Returns the drop ratio, None if there is no fruit to drop.
+        """
+        kind = self.next_kind
+        if( not kind ):
+            return None
+        ratio = self.action_space( size ).ratio( action, kind )
+        self.drop( None, ratio=ratio )
+        return ratio
+
+
+    def gameover(self):
+        """ Actions in case of game over
+        """
+        print("GAMEOVER")
+        if( self.on_action ):
+            self.on_action( ACTION_GAMEOVER, None )
+        self._is_gameover = True    # inhibit game actions
+        self._fruits.gameover()
+        if( self.on_gameover ):
+            self.on_gameover()
+
+
+    def toggle_pause(self):
+        assert( not self._is_gameover )
+        self._is_paused = not self._is_paused
+
+
+    def fruit_drag_start(self, cursor):
+        # pass the fruit under the mouse in DRAG_MODE
+        self._dragged_fruit = self.find_fruit_at( *cursor )
+        if( self._dragged_fruit) :
+            self._dragged_fruit.drag_mode( cursor )   # set_mode
+
+
+    def fruit_drag_stop(self):
+        if( self._dragged_fruit ):
+            self._dragged_fruit.drag_mode( None )   # set_mode
+            self._dragged_fruit = None
+
+
+    def find_fruit_at(self, x, y):
+        qi = self._space.point_query( (x, y), max_distance=0, shape_filter=pm.ShapeFilter() )
+        if( len(qi)==0 ):
+            return None
+        if( len(qi) > 1):
+            print("WARNING: Multiple overlapping fruits detected")
+        if( not hasattr( qi[0].shape, 'fruit' )):
+           return None     # shape is not a fruit (e.g. bocal)
+        return qi[0].shape.fruit
+
+
+    def shoot_fruit(self, x, y):
+        f = self.find_fruit_at(x, y)
+        if( not self._is_gameover and f ):
+            if( self.on_action ):
+                self.on_action( ACTION_SHOOT, f.id )
+            f.explose()
+
+
+    def apply_action(self, type, payload):
+        """ Plays again an action reported by on_action
+        """
+        if( type == ACTION_DROP ):
+            kind, x, y = payload
+            next = self._fruits.peek_next()
+            if( not next ):
+                return
+            if( next.kind != kind ):
+                # the preview queue is not replayed, only the dropped kinds
+                self._fruits.replace_next( kind )
+            self._fruits.drop_next( (x, y) )
+            self.prepare_next()
+        elif( type == ACTION_SHOOT ):
+            f = self._fruits._fruits.get( payload )
+            if( not self._is_gameover and f ):
+                f.explose()
+        elif( type == ACTION_GAMEOVER and not self._is_gameover ):
+            self.gameover()
+
+
+    def spawn_in_bocal(self, kind, bocal_coords):
+        position = self._bocal.to_world( bocal_coords )
+        self._fruits.spawn( kind, position )
+        self.merges += 1
+
+
+    def _on_spawn(self, payload):
+        kind, x, y = payload
+        self.spawn_in_bocal( kind, (x, y) )
+
+
+    def step(self, dt, cursor=None):
+        """ Advance one tick: the simulation moves forward by self.interval
+        dt: elapsed time on the caller clock
+        cursor: mouse position, used to move the dragged fruit
+        """
+        if( self._is_paused ):
+            return
+
+        prof = self._profiler
+        t0 = time.perf_counter()
+        with prof.phase(profiler.PHASE_TICK):
+            # delayed events due at this step (spawns, removals)
+            with prof.phase(profiler.PHASE_EVENTS):
+                for (type, payload) in self._events.advance( self._preset.interval ):
+                    self._event_handlers[type]( payload )
+            # update bocal elements position
+            with prof.phase(profiler.PHASE_BOCAL):
+                self._bocal.step( self._preset.interval )
+            # update dragged fruit in DRAG_MODE
+            if( self._dragged_fruit and cursor ):
+                with prof.phase(profiler.PHASE_DRAG):
+                    self._dragged_fruit.drag_to( cursor, dt)
+            # prepare collision handler
+            self._collision_helper.reset()
+            # execute the physics steps of the tick
+            if( self._threads_auto ):
+                physics.auto_threads( self._space, len(self._fruits) )
+            with prof.phase(profiler.PHASE_SPACE):
+                step_size = self._preset.step_size
+                for _ in range( self._preset.substeps ):
+                    self._space.step( step_size )
+
+            # modify fruits based on detected collisions
+            with prof.phase(profiler.PHASE_COLLISIONS):
+                self._collision_helper.process(
+                    world_to_bocal_func=self._bocal.to_bocal )
+                if( self._events.instant ):
+                    # removals and spawns of this step's merges
+                    for (type, payload) in self._events.advance( 0 ):
+                        self._event_handlers[type]( payload )
+            # clean up
+            with prof.phase(profiler.PHASE_CLEANUP):
+                self._fruits.cleanup()
+        self._steps += 1
+        self._rain.record_step( dt, time.perf_counter() - t0, len(self._fruits) )
+
+
+    def update_countdown(self):
+        """ Detects the game end when fruits stay above the maxline
+        Returns the countdown message to display
+        """
+        # handle countdown in case of overflow
+        if( not self._bocal.is_tumbling):
+            ids = self._bocal.fruits_sur_maxline()
+            self._countdown.update( ids )
+
+        countdown_val, countdown_txt = self._countdown.status()
+        if( countdown_val < 0 and not self._is_gameover ):
+            if( self._rain.running ):
+                # the load test goes on with an empty jar
+                self._rain.overflows += 1
+                self.reset()
+            else:
+                self.gameover()
+        return countdown_txt
+
+
+    def is_settled(self, max_speed=SETTLE_SPEED):
+        """ True when no merge or spawn is on the way and every fruit is slower than max_speed
+        """
+        if( len( self._events ) ):
+            return False
+        _, floats = self._fruits.get_state( np.float64 )
+        return not len(floats) or np.max( np.hypot( floats[:, 3], floats[:, 4] ) ) < max_speed
+
+
+    def on_resize(self, width, height):
+        bocal_coords = utils.bocal_coords(window_w=width, window_h=height)
+        self._action_spaces.clear()     # drop positions follow the jar width
+        self._bocal.on_resize(**bocal_coords)
+        if( self._spatial_hash ):
+            # cell count follows the jar size
+            physics.update_spatial_hash( self._space, bocal_coords['bocal_w'], bocal_coords['bocal_h'] )
+        self._fruits.on_resize(width, height)
+        self._preview.on_resize(width, height)
@@ -1,23 +1,45 @@
 import pyglet as pg
 from constants import *
 import sprites
+import utils
 
 
 TOP_LEFT = 'label1'
 TOP_CENTER = 'label2'
 TOP_RIGHT = 'label3'
 
+GUI_FONT_NAME = "Arial"
+
+# characters pre-rendered for the fixed-width numeric fields
+NUMBER_CHARSET = "0123456789 ./-"
+
+_glyph_cache = {}
+
+def _number_glyphs(font_name, font_size):
+    """ Glyphs of NUMBER_CHARSET, rasterized once per font
+    Returns a tuple (glyphs by character, cell width, font ascent)
+    """
+    key = (font_name, font_size)
+    if( key not in _glyph_cache ):
+        font = pg.font.load(font_name, font_size)
+        glyphs = font.get_glyphs(NUMBER_CHARSET)
+        if( isinstance(glyphs, tuple) ):     # pyglet >= 2.1 also returns glyph positions
+            glyphs = glyphs[0]
+        cell = max( g.advance for g in glyphs )
+        _glyph_cache[key] = ( dict(zip(NUMBER_CHARSET, glyphs)), cell, font.ascent )
+    return _glyph_cache[key]
+
 
 
 class Label( pg.text.Label):
-    def __init__(self, window_width, window_height):
+    def __init__(self, render, window_width, window_height):
         coords = self.coords( window_width, window_height, margin=GUI_TOP_MARGIN)
         super().__init__(
             **coords,
-            font_name="Arial",
+            font_name=GUI_FONT_NAME,
             font_size=GUI_FONT_SIZE,
-            batch=sprites.batch(),
-            group=sprites.groupe_gui() )
+            batch=render.batch,
+            group=render.group(sprites.SPRITE_GROUP_GUI) )
 
     def coords( window_width, window_height, margin):
         raise NotImplementedError("Implementer coords() dans la sous-classe")
@@ -27,15 +49,6 @@ class Label( pg.text.Label):
         self.x = coords['x']
         self.y = coords['y']
 
-class TopLeftLabel( Label ):
-    def coords(self, width, height, margin):
-        return {
-            'x' : margin,
-            'y': height - margin,
-            'anchor_x' : 'left',
-            'anchor_y' : 'top',
-        }
-
 class CenterLabel( Label ):
     def coords(self, width, height, margin):
         return {
@@ -45,24 +58,180 @@ class CenterLabel( Label ):
             'anchor_y' : 'top',
         }
 
-class TopRightLabel( Label ):
-    def coords(self, width, height, margin):
-        return {
-            'x' : width - margin,
-            'y': height - margin,
-            'anchor_x' : 'right',
-            'anchor_y' : 'top',
-        }
-    
+
+class NumberField(object):
+    """ Fixed-width numeric text, one sprite per character slot.
+    Slots never move and glyphs come from a shared cache, so changing a digit
+    swaps a texture region instead of laying out a whole pg.text.Label again.
+    A text longer than the slots adds slots: digits are never truncated.
+    """
+    def __init__(self, render, slots, anchor_x):
+        self._glyphs, self._cell, self._ascent = _number_glyphs( GUI_FONT_NAME, GUI_FONT_SIZE )
+        self._render = render
+        self._anchor_x = anchor_x
+        self._text = ""
+        self._x = 0
+        self._y = 0
+        self._sprites = []
+        self._grow(slots)
+
+    def _grow(self, slots):
+        """ Adds sprites up to slots, the text keeps its anchor
+        """
+        added = slots - len(self._sprites)
+        for _ in range(added):
+            s = pg.sprite.Sprite( self._glyphs['0'], batch=self._render.batch,
+                                  group=self._render.group(sprites.SPRITE_GROUP_GUI) )
+            s.visible = False
+            self._sprites.append(s)
+        if( self._anchor_x == 'right' ):
+            self._text = self._text.rjust(slots)
+        else:
+            self._text = self._text.ljust(slots)
+        for i in range(slots):
+            self._place(i)
+
+    @property
+    def width(self):
+        return len(self._sprites) * self._cell
+
+    @property
+    def left(self):
+        if( self._anchor_x == 'right' ):
+            return self._x - self.width
+        return self._x
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        if( len(text) > len(self._sprites) ):
+            self._grow( len(text) )
+        slots = len(self._sprites)
+        if( self._anchor_x == 'right' ):
+            text = text.rjust(slots)
+        else:
+            text = text.ljust(slots)
+        old = self._text
+        self._text = text
+        for i in range(slots):
+            if( text[i] != old[i] ):
+                self._place(i)
+
+    def set_position(self, x, y):
+        """ (x, y) is the anchor point, y being the top of the text
+        """
+        self._x = x
+        self._y = y
+        for i in range(len(self._sprites)):
+            self._place(i)
+
+    def _place(self, i):
+        sprite = self._sprites[i]
+        glyph = self._glyphs.get( self._text[i] )
+        if( glyph is None or self._text[i] == ' ' ):
+            sprite.visible = False
+            return
+        if( sprite.image is not glyph ):
+            sprite.image = glyph
+        # glyphs are centered in their cell so that digits stay aligned
+        x0 = self.left + i * self._cell + (self._cell - glyph.advance) / 2
+        sprite.update( x = x0 + glyph.vertices[0],
+                       y = self._y - self._ascent + glyph.vertices[1] )
+        sprite.visible = True
+
+
+class CounterLabel(object):
+    """ Caption followed by a NumberField, anchored to a top corner of the window
+    """
+    def __init__(self, render, window_width, window_height, slots, anchor_x):
+        self._anchor_x = anchor_x
+        self._caption = pg.text.Label(
+            font_name=GUI_FONT_NAME,
+            font_size=GUI_FONT_SIZE,
+            anchor_x=anchor_x,
+            anchor_y='top',
+            batch=render.batch,
+            group=render.group(sprites.SPRITE_GROUP_GUI) )
+        self._field = NumberField( render, slots=slots, anchor_x=anchor_x )
+        self._window_size = (window_width, window_height)
+        self._layout()
+
+    @property
+    def caption(self):
+        return self._caption.text
+
+    @caption.setter
+    def caption(self, text):
+        self._caption.text = text
+        self._layout()
+
+    @property
+    def value(self):
+        return self._field.text.strip()
+
+    @value.setter
+    def value(self, text):
+        width = self._field.width
+        self._field.text = text
+        if( self._field.width != width ):     # slots added: the caption moves
+            self._layout()
+
+    def _layout(self):
+        (width, height) = self._window_size
+        y = height - GUI_TOP_MARGIN
+        space = GUI_FONT_SIZE // 2
+        if( self._anchor_x == 'right' ):
+            self._field.set_position( width - GUI_TOP_MARGIN, y )
+            self._caption.position = ( self._field.left - space, y, 0 )
+        else:
+            self._caption.position = ( GUI_TOP_MARGIN, y, 0 )
+            self._field.set_position( GUI_TOP_MARGIN + self._caption.content_width + space, y )
+
+    def on_resize(self, width, height):
+        self._window_size = (width, height)
+        self._layout()
+
+
+class ProfilerOverlay( pg.text.Label ):
+    """ Table of the FrameProfiler phase durations, under the top labels
+    """
+    def __init__(self, render, window_width, window_height):
+        super().__init__(
+            font_name="Courier New",
+            font_size=PROFILER_FONT_SIZE,
+            multiline=True,
+            width=window_width,
+            anchor_x='left',
+            anchor_y='top',
+            color=(255,255,160,255),
+            batch=render.batch,
+            group=render.group(sprites.SPRITE_GROUP_GUI) )
+        self.on_resize( window_width, window_height )
+        self.visible = False
+        self._refresh = 0
+
+    def on_resize(self, width, height):
+        self.position = ( GUI_TOP_MARGIN, height - 3 * GUI_TOP_MARGIN - GUI_FONT_SIZE, 0 )
+
+    def update(self, profiler):
+        t = utils.now()
+        if( not self.visible or t - self._refresh < PROFILER_OVERLAY_REFRESH ):
+            return
+        self._refresh = t
+        self.text = profiler.summary()
+
 
 class GameOverSprite(pg.sprite.Sprite):
-    def __init__(self, width, height):
+    def __init__(self, render, width, height):
 
-        img = pg.resource.image("gameover.png")
+        img = sprites.image("gameover.png")
         img.anchor_x = img.width // 2                       # anchored at the center of the image
         img.anchor_y = img.height // 2
         self._gameover_img = img
-        super().__init__(img, batch=sprites.batch(), group=sprites.groupe_gui() )
+        super().__init__(img, batch=render.batch, group=render.group(sprites.SPRITE_GROUP_GUI) )
         self.on_resize(width=width, height=height)
         self.visible = False
 
@@ -75,13 +244,13 @@ class GameOverSprite(pg.sprite.Sprite):
 
 
 class GameOverMask(pg.shapes.Rectangle):
-    def __init__(self, width, height):
+    def __init__(self, render, width, height):
         super().__init__(
             x=0,y=0,
             width=width, height=height,
             color=(40,20,10,150), 
-            batch=sprites.batch(), 
-            group=sprites.groupe_masque() )
+            batch=render.batch, 
+            group=render.group(sprites.SPRITE_GROUP_MASQUE) )
         
     def on_resize(self, width, heigth):
         self.width=width
@@ -89,39 +258,81 @@ class GameOverMask(pg.shapes.Rectangle):
 
 
 class GUI(object):
-    def __init__( self, window_width, window_height) :
-
+    def __init__( self, render, window_width, window_height) :
+        """ render: sprites.RenderContext of the window
+        """
         # textes en haut 
-        self._label_topleft = TopLeftLabel(window_width, window_height)
-        self._label_center = CenterLabel(window_width, window_height)
-        self._label_topright = TopRightLabel(window_width, window_height)
-        self._gameover = GameOverSprite( window_width, window_height )
-        self._gameover_mask = GameOverMask( window_width, window_height)
+        self._label_topleft = CounterLabel(render, window_width, window_height, slots=GUI_SCORE_DIGITS, anchor_x='left')
+        self._label_center = CenterLabel(render, window_width, window_height)
+        self._label_topright = CounterLabel(render, window_width, window_height, slots=2*GUI_FPS_DIGITS+3, anchor_x='right')
+        self._gameover = GameOverSprite( render, window_width, window_height )
+        self._gameover_mask = GameOverMask( render, window_width, window_height)
+        self._profiler_overlay = ProfilerOverlay( render, window_width, window_height )
         self._resizables = [self._gameover,
+                            self._profiler_overlay,
                             self._gameover_mask,
                             self._label_topleft,
                             self._label_center,
                             self._label_topright ]
+        # last values sent to the labels: setting pg.text.Label.text triggers a full relayout
+        self._texts = {}
+        self._score = None
+        self._fps_refresh = 0
 
     def on_resize(self, width, height):
         for item in self._resizables:
             item.on_resize(width, height)
 
     def update_label(self, label, text):
-        if(label==TOP_LEFT): self._label_topleft.text = text
+        """ TOP_LEFT and TOP_RIGHT set the captions of the numeric fields
+        """
+        if( self._texts.get(label) == text ):
+            return
+        self._texts[label] = text
+        if(label==TOP_LEFT): self._label_topleft.caption = text
         if(label==TOP_CENTER): self._label_center.text = text
-        if(label==TOP_RIGHT): self._label_topright.text = text
+        if(label==TOP_RIGHT): self._label_topright.caption = text
 
     def update_dict( self, texts ):
         for lbl, txt in texts.items():
             self.update_label(lbl, txt)
 
+    def update_score(self, score):
+        if( score != self._score ):
+            self._score = score
+            self._label_topleft.value = str(score)
+
+    def update_fps(self, physics_fps, display_fps):
+        """ Speedmeters are only read every GUI_FPS_REFRESH seconds
+        """
+        t = utils.now()
+        if( t - self._fps_refresh < GUI_FPS_REFRESH ):
+            return
+        self._fps_refresh = t
+        self._label_topright.value = f"{physics_fps.value:.0f} / {display_fps.value:.0f}"
+
+    def update_training_stats(self, epsilon, best_score, episode):
+        """ Formatted at each call: update_label() skips the relayout if the text is unchanged,
+        and rewrites it after TOP_CENTER showed something else
+        """
+        self.update_label( TOP_CENTER, f"Epsilon: {epsilon:.3f} | Best: {best_score} | Ep: {episode}" )
+
+    def toggle_profiler(self):
+        self._profiler_overlay.visible = not self._profiler_overlay.visible
+
+    def update_profiler(self, profiler):
+        self._profiler_overlay.update( profiler )
+
     def reset(self):
         self.update_dict({ label:"" for label in [TOP_LEFT, TOP_CENTER, TOP_RIGHT] } )
+        self._score = None
+        self._fps_refresh = 0
+        self._label_topleft.value = ""
+        self._label_topright.value = ""
         self._gameover.visible=False
         self._gameover_mask.visible=False
 
     def show_gameover(self):
-        self._label_center.text = "GAME OVER"
+        self.update_label( TOP_CENTER, "GAME OVER" )
         self._gameover.visible=True
         self._gameover_mask.visible=True
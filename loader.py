@@ -0,0 +1,89 @@
+""" Background loading: the slow part of each job (disk, decoding, unpickling) runs
+on a worker thread, its end (texture upload, anything that needs the GL context
+or the objects of the window) on the main thread, a few milliseconds per poll.
+
+    loader = BackgroundLoader()
+    loader.add( "model", work=load_model, finish=set_model )
+    loader.start()
+    pg.clock.schedule_interval( lambda dt: loader.poll(), LOADER_INTERVAL )
+"""
+import queue, threading, time
+
+from constants import *
+
+
+class BackgroundLoader(object):
+    """ Runs jobs in order: work() on the worker thread, then finish(result) on the
+    thread that calls poll()
+    """
+    def __init__(self):
+        self._jobs = []
+        self._results = queue.Queue()
+        self._finished = 0
+        self._thread = None
+        self.current = None         # name of the job being finished, for the progress display
+        self.on_ready = None
+
+    def add(self, name, work=None, finish=None):
+        """ work(): slow part, without GL nor window objects. finish(result): main thread part
+        """
+        self._jobs.append( (name, work, finish) )
+
+    def start(self):
+        if( self._jobs ):
+            self.current = self._jobs[0][0]
+        self._thread = threading.Thread( target=self._work_loop, name="BackgroundLoader", daemon=True )
+        self._thread.start()
+
+    def _work_loop(self):
+        for name, work, finish in self._jobs:
+            try:
+                result = work() if work else None
+                self._results.put( (name, finish, result, None) )
+            except Exception as e:
+                self._results.put( (name, finish, None, e) )
+
+    @property
+    def progress(self):
+        """ Fraction of the jobs finished, 0..1
+        """
+        return self._finished / len(self._jobs) if self._jobs else 1.0
+
+    @property
+    def ready(self):
+        return self._finished == len(self._jobs)
+
+    def poll(self, budget=LOADER_FRAME_BUDGET):
+        """ Finishes the jobs done by the worker, for budget seconds at most
+        Returns True when all the jobs are finished.
+        """
+        if( self.ready ):
+            return True
+        end = time.perf_counter() + budget
+        while( time.perf_counter() < end ):
+            try:
+                name, finish, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if( not error and finish ):
+                try:
+                    finish( result )
+                except Exception as e:
+                    error = e
+            if( error ):
+                # the resource is loaded again, synchronously, on first use
+                print( f"warning: background loading of {name} failed: {error}" )
+            self._finished += 1
+            if( not self.ready ):
+                self.current = self._jobs[self._finished][0]
+        if( self.ready ):
+            self.current = None
+            if( self.on_ready ):
+                self.on_ready()
+        return self.ready
+
+    def wait(self):
+        """ Finishes all the jobs now, blocking
+        """
+        while( not self.poll( budget=1.0 ) ):
+            time.sleep( 0.001 )
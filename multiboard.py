@@ -0,0 +1,238 @@
+""" Multi-board window: many games side by side in a grid, to watch a population play
+
+All the boards share the sprite batch of the window. Each one draws through its
+own RenderContext, whose layers sit under a BoardGroup that scales and moves the
+board into its tile.
+Boards drawn too small to read get no animation (fades, blinks, explosions) and
+their sprites follow only the motions of half a pixel or more on screen; tiles
+too narrow get no score label.
+
+    python multiboard.py [--boards 16] [--instant]
+
+P: pause, +/-: autoplay rate, ESC: quit
+"""
+import argparse, math
+import pyglet as pg
+from pyglet import gl
+from pyglet.math import Mat4, Vec3
+
+from constants import *
+from game import SuikaGame
+import physics
+import sprites
+import utils
+
+
+class BoardGroup(pg.graphics.Group):
+    """ Draws the layers of one board into its tile of the window
+    """
+    def __init__(self, window):
+        super().__init__(order=0)
+        self._window = window
+        self.tile = (0, 0, 1, 1)        # x, y, width, height, in window pixels
+        self.offset = (0, 0)            # position of the board origin
+        self.scale = 1.0
+        self._saved_view = None
+
+    def set_state(self):
+        window = self._window
+        self._saved_view = window.view
+        window.view = ( window.view
+                        @ Mat4.from_translation( Vec3( self.offset[0], self.offset[1], 0 ) )
+                        @ Mat4.from_scale( Vec3( self.scale, self.scale, 1 ) ) )
+        # fruits out of the jar stay in the tile
+        ratio = window.scale
+        x, y, w, h = self.tile
+        gl.glEnable( gl.GL_SCISSOR_TEST )
+        gl.glScissor( int(x * ratio), int(y * ratio), int(w * ratio), int(h * ratio) )
+
+    def unset_state(self):
+        gl.glDisable( gl.GL_SCISSOR_TEST )
+        self._window.view = self._saved_view
+
+    # each board is a distinct group, pyglet merges groups of same order and parent
+    def __eq__(self, other):
+        return self is other
+
+    def __hash__(self):
+        return id(self)
+
+
+class Board(object):
+    """ One game of the grid, played by its autoplayer
+    """
+    def __init__(self, window, index, instant=False, preset=physics.DEFAULT_PRESET):
+        self.index = index
+        self._window = window
+        self.group = BoardGroup( window )
+        self.render = sprites.RenderContext( batch=window.render.batch, parent=self.group )
+        self.min_move = 0       # pixels of the board, see Fruit.update()
+        self.label = None
+        self._label_text = None
+        self._gameover_time = None
+        self.game = SuikaGame( instant=instant, preset=preset, render=self.render )
+        self.game.on_gameover = self.on_gameover
+        self.game.on_resize( WINDOW_WIDTH, WINDOW_HEIGHT )     # places the preview
+        self.rate = MULTIBOARD_AUTOPLAY_RATE
+        self.start()
+
+    def start(self):
+        self.game.reset()
+        self._gameover_time = None
+        self.game.autoplayer.set_rate( self.rate )
+        self.game.autoplayer.enable()
+
+    def on_gameover(self):
+        self._gameover_time = utils.now()
+
+    def tick(self, dt):
+        """ One simulation step, then the drops of the autoplayer
+        """
+        game = self.game
+        if( self._gameover_time and utils.now() - self._gameover_time > MULTIBOARD_RESTART_DELAY ):
+            self.start()
+        game.step( dt )
+        if( not game.is_gameover and not game.is_paused ):
+            game.drop( None, game.autoplayer.step( dt ) )
+
+    def update(self):
+        """ Sprites of the board for the next frame
+        """
+        game = self.game
+        game.update_countdown()
+        game.fruits.update( self.min_move )
+        game.preview.update()
+        game.bocal.update()
+        if( self.label ):
+            text = f"#{self.index + 1}  {game.score}"
+            if( game.is_gameover ):
+                text += "  GAME OVER"
+            if( text != self._label_text ):      # a label relayout is costly
+                self.label.text = text
+                self._label_text = text
+
+    def set_label(self, visible):
+        if( visible and not self.label ):
+            render = self._window.render
+            self.label = pg.text.Label( "", font_name="Arial", font_size=MULTIBOARD_FONT_SIZE,
+                                        anchor_x='left', anchor_y='top',
+                                        batch=render.batch, group=render.group(sprites.SPRITE_GROUP_GUI) )
+            self._label_text = None
+        elif( not visible and self.label ):
+            self.label.delete()
+            self.label = None
+
+    def delete(self):
+        self.set_label( False )
+        self.game.fruits.reset()
+
+
+def grid_layout(count, width, height, board_width, board_height):
+    """ Columns, rows and board scale that show count boards the largest
+    """
+    best = None
+    for cols in range( 1, count + 1 ):
+        rows = math.ceil( count / cols )
+        scale = min( width / cols / board_width, height / rows / board_height )
+        if( best is None or scale > best[2] ):
+            best = ( cols, rows, scale )
+    return best
+
+
+class MultiBoardWindow(pg.window.Window):
+    def __init__(self, boards=MULTIBOARD_BOARDS, width=MULTIBOARD_WINDOW_WIDTH, height=MULTIBOARD_WINDOW_HEIGHT,
+                 instant=False, preset=physics.DEFAULT_PRESET):
+        super().__init__(width=width, height=height, resizable=True)
+        self.set_caption(f"Suika Game - {boards} boards")
+        self._board_size = ( WINDOW_WIDTH, WINDOW_HEIGHT )     # game coordinates of every board
+        self.render = sprites.RenderContext()       # the batch of all the boards, and the labels
+        self._boards = [ Board( self, i, instant=instant, preset=preset ) for i in range(boards) ]
+        self._paused = False
+        self.display_fps = utils.Speedmeter()
+        self._fps_label = pg.text.Label( "", font_name="Arial", font_size=MULTIBOARD_FONT_SIZE,
+                                         x=width - 4, y=4, anchor_x='right', anchor_y='bottom',
+                                         batch=self.render.batch, group=self.render.group(sprites.SPRITE_GROUP_GUI) )
+        self._fps_text = None
+        pg.clock.schedule_interval(self.simulation_tick, interval=self._boards[0].game.interval)
+        self.layout( width, height )
+
+    @property
+    def boards(self):
+        return self._boards
+
+    def layout(self, width, height):
+        """ Tiles of the boards, and their level of detail
+        """
+        bw, bh = self._board_size
+        cols, rows, scale = grid_layout( len(self._boards), width, height, bw, bh )
+        tile_w, tile_h = width / cols, height / rows
+        for i, board in enumerate( self._boards ):
+            x = ( i % cols ) * tile_w
+            y = height - ( i // cols + 1 ) * tile_h       # first row at the top
+            group = board.group
+            group.tile = ( x, y, tile_w, tile_h )
+            group.offset = ( x + (tile_w - bw * scale) / 2, y + (tile_h - bh * scale) / 2 )
+            group.scale = scale
+            board.render.animations = scale >= MULTIBOARD_DETAIL_SCALE
+            board.min_move = 0 if board.render.animations else 0.5 / scale
+            board.set_label( tile_w >= MULTIBOARD_LABEL_WIDTH )
+            if( board.label ):
+                board.label.position = ( x + 4, y + tile_h - 4, 0 )
+        self._fps_label.position = ( width - 4, 4, 0 )
+
+    def simulation_tick(self, dt):
+        if( self._paused ):
+            return
+        for board in self._boards:
+            board.tick( dt )
+
+    def on_draw(self):
+        self.clear()
+        for board in self._boards:
+            board.update()
+        text = f"{len(self._boards)} boards  {self.display_fps.value:.0f} FPS"
+        if( text != self._fps_text ):
+            self._fps_label.text = text
+            self._fps_text = text
+        self.render.draw()
+        self.display_fps.tick()
+
+    def on_resize(self, width, height):
+        super().on_resize(width, height)
+        self.layout( width, height )
+
+    def on_key_press(self, symbol, modifiers):
+        key = pg.window.key
+        if symbol == key.ESCAPE:
+            self.close()
+        elif symbol == key.P:
+            self._paused = not self._paused
+        elif symbol in ( key.PLUS, key.NUM_ADD, key.EQUAL ):
+            self.set_rate( +1 )
+        elif symbol in ( key.MINUS, key.NUM_SUBTRACT ):
+            self.set_rate( -1 )
+
+    def set_rate(self, offset):
+        for board in self._boards:
+            board.rate = max( 1, board.rate + offset )
+            board.game.autoplayer.set_rate( board.rate )
+
+    def on_close(self):
+        for board in self._boards:
+            board.delete()
+        super().on_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suika games side by side")
+    parser.add_argument('--boards', type=int, default=MULTIBOARD_BOARDS)
+    parser.add_argument('--instant', action='store_true', help="instant rules, as in training")
+    parser.add_argument('--physics', choices=list(physics.PRESETS), default=physics.DEFAULT_PRESET,
+                        help="physics quality preset")
+    args = parser.parse_args()
+
+    window = MultiBoardWindow( boards=args.boards, instant=args.instant, preset=args.physics )
+    pg.app.run()
+
+if __name__ == '__main__':
+    main()
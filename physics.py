@@ -0,0 +1,109 @@
+""" Physics quality presets: speed/accuracy trade-offs of the pymunk simulation
+
+    python bench.py --presets     # steps/s and score distribution shift per preset
+"""
+import sys
+import pymunk as pm
+
+from constants import *
+import fruit
+
+
+PRESET_FAST = 'fast'
+PRESET_BALANCED = 'balanced'
+PRESET_ACCURATE = 'accurate'
+DEFAULT_PRESET = PRESET_BALANCED
+
+SPATIAL_HASH_CELLS_PER_FRUIT = 10   # chipmunk advice: about 10x more cells than objects
+
+THREADS_AUTO = 0            # threaded solver only for crowded boards
+THREADS_MAX = 2             # pymunk limit for the threaded solver
+THREADS_MIN_FRUITS = 150    # fruits from which the second thread pays off (see bench.py --compare-threads)
+
+
+class PhysicsPreset(object):
+    """ Settings of the physics simulation
+    interval: simulated time of one game step (tick)
+    substeps: pymunk steps per tick, of interval/substeps each
+    iterations: solver iterations per pymunk step
+    collision_slop: allowed overlap between shapes, in pixels
+    spatial_hash: spatial hash broadphase instead of the bounding box tree
+    """
+    def __init__(self, name, interval, substeps, iterations, collision_slop, spatial_hash):
+        self.name = name
+        self.interval = interval
+        self.substeps = substeps
+        self.iterations = iterations
+        self.collision_slop = collision_slop
+        self.spatial_hash = spatial_hash
+
+    @property
+    def step_size(self):
+        return self.interval / self.substeps
+
+    def __repr__(self):
+        return ( f"{self.name}: {1/self.interval:.0f} Hz x{self.substeps}, {self.iterations} iterations, "
+                 f"slop {self.collision_slop}{', spatial hash' if self.spatial_hash else ''}" )
+
+
+PRESETS = {
+    PRESET_FAST:     PhysicsPreset( PRESET_FAST, interval=1/60, substeps=1, iterations=5,
+                                    collision_slop=0.5, spatial_hash=True ),
+    # pymunk defaults, the settings of the original game
+    PRESET_BALANCED: PhysicsPreset( PRESET_BALANCED, interval=PYMUNK_INTERVAL, substeps=1, iterations=10,
+                                    collision_slop=0.1, spatial_hash=False ),
+    PRESET_ACCURATE: PhysicsPreset( PRESET_ACCURATE, interval=PYMUNK_INTERVAL, substeps=2, iterations=20,
+                                    collision_slop=0.05, spatial_hash=False ),
+}
+
+
+def spatial_hash_params(bocal_w, bocal_h):
+    """ Cell size and cell count of the spatial hash, from the active fruits and jar size
+    Cells are as large as the fruits usually dropped, the count allows for a full jar.
+    """
+    kinds = fruit._FRUITS_RANDOM
+    mean_radius = sum( fruit._KIND_RADIUS[k] for k in kinds ) / len(kinds)
+    dim = 2 * mean_radius
+    # fruits of mean size filling the jar
+    capacity = (bocal_w * bocal_h) / (dim * dim)
+    count = int( max( 1000, SPATIAL_HASH_CELLS_PER_FRUIT * capacity ) )
+    return dim, count
+
+
+def threading_supported():
+    return not sys.platform.startswith('win')
+
+
+def make_space(threads=1):
+    """ threads: solver threads, THREADS_AUTO to switch with the fruit count
+    """
+    if( threads == 1 or not threading_supported() ):
+        return pm.Space()
+    space = pm.Space(threaded=True)
+    space.threads = 1 if threads == THREADS_AUTO else min( threads, THREADS_MAX )
+    return space
+
+
+def auto_threads(space, fruit_count):
+    """ Threads for a threaded space in THREADS_AUTO mode
+    """
+    threads = THREADS_MAX if fruit_count >= THREADS_MIN_FRUITS else 1
+    if( space.threads != threads ):
+        space.threads = threads
+
+
+def configure_space(space, preset, bocal_w, bocal_h, spatial_hash=None):
+    """ spatial_hash: overrides the preset broadphase when not None
+    """
+    space.iterations = preset.iterations
+    space.collision_slop = preset.collision_slop
+    if( preset.spatial_hash if spatial_hash is None else spatial_hash ):
+        update_spatial_hash( space, bocal_w, bocal_h )
+
+
+def update_spatial_hash(space, bocal_w, bocal_h):
+    """ (Re)builds the spatial hash of the space for the jar size
+    pymunk cannot go back to the bounding box tree: only for spaces using the hash
+    """
+    dim, count = spatial_hash_params( bocal_w, bocal_h )
+    space.use_spatial_hash( dim, count )
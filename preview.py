@@ -1,23 +1,27 @@
 from constants import *
-from sprites import PreviewSprite
 import fruit 
 import utils
 
 class QueueItem(object):
-    def __init__(self, kind, sprite_size ):
+    def __init__(self, kind, sprite_size, render=None ):
         self.kind = kind
-        self._sprite = PreviewSprite( nom=fruit.name_from_kind(kind), width=sprite_size )
+        self._sprite = None
+        if( render ):
+            self._sprite = render.preview_sprite( nom=fruit.name_from_kind(kind), width=sprite_size )
         self.y_pos = 0
 
     def update(self, slot, y):
+        if( not self._sprite ):
+            return
         x = PREVIEW_SLOT_SIZE * (slot + 0.5)
         self._sprite.position = (x,y,0)
         self._sprite.update(x, y)
 
 
 class FruitQueue( object ):
-    def __init__( self, cnt):
+    def __init__( self, cnt, render=None):
         self._cnt = cnt
+        self._render = render       # sprites.RenderContext, None without display
         self.y_pos = 0
         self.reset()
 
@@ -28,11 +32,21 @@ class FruitQueue( object ):
         self._shift_end_time = None
         self.update()
 
+    def kinds(self):
+        return [ item.kind for item in self._queue ]
+
+    def set_kinds(self, kinds):
+        """ Replaces the queue with kinds from kinds() (restored board)
+        """
+        self._queue = [ QueueItem( kind=k, sprite_size=PREVIEW_SPRITE_SIZE, render=self._render ) for k in kinds ]
+        self._shift_end_time = None
+        self.update()
+
     def on_resize(self, width, height):
         self.y_pos = height - PREVIEW_Y_POS
 
     def _add_item(self):
-        s = QueueItem( kind = fruit.random_kind(), sprite_size=PREVIEW_SPRITE_SIZE )
+        s = QueueItem( kind = fruit.random_kind(), sprite_size=PREVIEW_SPRITE_SIZE, render=self._render )
         self._queue.insert(0, s)
 
     def get_next_fruit(self):
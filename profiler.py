@@ -0,0 +1,135 @@
+import time, json
+import numpy as np
+from constants import *
+
+
+# Phases of a physics tick
+PHASE_TICK = 'tick'
+PHASE_EVENTS = 'EventQueue'
+PHASE_BOCAL = 'Bocal.step'
+PHASE_DRAG = 'drag'
+PHASE_SPACE = 'space.step'
+PHASE_COLLISIONS = 'CollisionHelper.process'
+PHASE_CLEANUP = 'ActiveFruits.cleanup'
+PHASE_REWIND = 'RewindBuffer.capture'
+
+# Phases of a displayed frame
+PHASE_FRAME = 'frame'
+PHASE_FRUITS = 'ActiveFruits.update'
+PHASE_PREVIEW = 'FruitQueue.update'
+PHASE_WALLS = 'Bocal.update'
+PHASE_GUI = 'GUI'
+PHASE_DRAW = 'batch.draw'
+
+PHASES = [
+    PHASE_TICK,
+    PHASE_EVENTS,
+    PHASE_BOCAL,
+    PHASE_DRAG,
+    PHASE_SPACE,
+    PHASE_COLLISIONS,
+    PHASE_CLEANUP,
+    PHASE_REWIND,
+    PHASE_FRAME,
+    PHASE_FRUITS,
+    PHASE_PREVIEW,
+    PHASE_WALLS,
+    PHASE_GUI,
+    PHASE_DRAW,
+]
+
+
+class PhaseTimer(object):
+    """ Context manager timing one phase. One instance per phase is reused
+    so that timing a phase does not allocate anything.
+    """
+    __slots__ = ('_profiler', '_index', '_start')
+
+    def __init__(self, profiler, index):
+        self._profiler = profiler
+        self._index = index
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._profiler.record( self._index, time.perf_counter() - self._start )
+        return False
+
+
+class FrameProfiler(object):
+    """ Rolling duration histograms of the phases of frames and physics ticks
+
+    Durations are kept in preallocated arrays (PROFILER_HISTORY samples per phase)
+    and can be streamed to a JSONL file, one line per displayed frame.
+    """
+    def __init__(self, phases=PHASES, history=PROFILER_HISTORY):
+        self._phases = list(phases)
+        self._history = history
+        self._samples = np.zeros( (len(self._phases), history) )
+        self._counts = [0] * len(self._phases)
+        self._current = [0.0] * len(self._phases)   # accumulated over the current frame
+        self._timers = { name : PhaseTimer(self, i) for i, name in enumerate(self._phases) }
+        self._frame_idx = 0
+        self._export = None
+
+    @property
+    def phases(self):
+        return self._phases
+
+    def phase(self, name):
+        return self._timers[name]
+
+    def record(self, index, duration):
+        self._samples[ index, self._counts[index] % self._history ] = duration
+        self._counts[index] += 1
+        self._current[index] += duration
+
+    def reset(self):
+        self._samples[:] = 0
+        self._counts = [0] * len(self._phases)
+        self._current = [0.0] * len(self._phases)
+
+    def end_frame(self):
+        """ Closes the current frame, and exports it if streaming is active
+        """
+        if( self._export ):
+            record = { 'frame': self._frame_idx,
+                       't': round( time.perf_counter(), 6 ),
+                       'ms': { name: round( 1000*d, 4 ) for name, d in zip( self._phases, self._current ) if d > 0 } }
+            self._export.write( json.dumps(record) + '\n' )
+        self._frame_idx += 1
+        self._current = [0.0] * len(self._phases)
+
+    def stats(self):
+        """ Returns { phase: (count, p50, p95, max) }, durations in seconds
+        """
+        ret = {}
+        for i, name in enumerate(self._phases):
+            n = min( self._counts[i], self._history )
+            if( n == 0 ):
+                continue
+            samples = self._samples[i, :n]
+            p50, p95 = np.percentile( samples, [50, 95] )
+            ret[name] = ( self._counts[i], p50, p95, samples.max() )
+        return ret
+
+    def summary(self):
+        """ Text table of stats(), in milliseconds
+        """
+        lines = [ f"{'phase':<24}{'p50':>8}{'p95':>8}{'max':>8}" ]
+        for name, (cnt, p50, p95, pmax) in self.stats().items():
+            lines.append( f"{name:<24}{1000*p50:>8.3f}{1000*p95:>8.3f}{1000*pmax:>8.3f}" )
+        return '\n'.join(lines)
+
+    def start_export(self, path):
+        self.stop_export()
+        self._export = open( path, 'w' )
+        print( f"profiler: streaming frame timings to {path}" )
+
+    def stop_export(self):
+        if( self._export ):
+            self._export.close()
+            self._export = None
@@ -0,0 +1,201 @@
+""" Binary protocol of the game server (server.py), and a blocking client for the agents
+
+Every message is a frame: its length as a little-endian uint32, then its body.
+Request body: opcode (uint8), game id (uint16), then the arguments of the opcode.
+Reply body: status (uint8, STATUS_OK or STATUS_ERROR), then the result of the
+opcode, or a UTF-8 error message.
+The replies of a connection come in the order of its requests, so a client can
+send several requests (for several games) before reading their replies.
+
+    with protocol.Client( ('127.0.0.1', SERVER_PORT) ) as client:
+        game = client.new()
+        client.reset( game, seed=1 )
+        state, obs = client.observe( game )
+        client.drop( game, 0.5 )        # 0: left of the jar, 1: right
+        state = client.settle( game )
+"""
+import collections, socket, struct
+import numpy as np
+
+from constants import *
+
+# opcodes: arguments -> result
+OP_NEW = 1          # instant (uint8) -> game id (uint16)
+OP_RESET = 2        # seed (int64, -1: random) -> state
+OP_OBSERVE = 3      # -> state, observation (float32, see SuikaGame.observation())
+OP_DROP = 4         # x (float32, 0..1 across the jar) -> state
+OP_STEP = 5         # steps (uint32) -> state
+OP_SETTLE = 6       # max steps (uint32, 0: SETTLE_MAX_TIME) -> state, when the fruits are at rest
+OP_DELETE = 7       # -> nothing
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+MAX_FRAME = 1 << 20         # bytes, longer frames close the connection
+
+LENGTH = struct.Struct( '<I' )
+HEADER = struct.Struct( '<BH' )
+ARGS = {
+    OP_NEW:     struct.Struct( '<B' ),
+    OP_RESET:   struct.Struct( '<q' ),
+    OP_OBSERVE: struct.Struct( '<' ),
+    OP_DROP:    struct.Struct( '<f' ),
+    OP_STEP:    struct.Struct( '<I' ),
+    OP_SETTLE:  struct.Struct( '<I' ),
+    OP_DELETE:  struct.Struct( '<' ),
+}
+GAME_ID = struct.Struct( '<H' )
+STATE = struct.Struct( '<iIHB' )
+
+OBS_SHAPE = ( OBS_MAX_FRUITS + 1, 3 )
+
+# result of most opcodes: where the game is after the request
+State = collections.namedtuple( 'State', 'score steps fruits gameover' )
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def frame(body):
+    return LENGTH.pack( len(body) ) + body
+
+
+def encode_request(op, game, *args):
+    return frame( HEADER.pack( op, game ) + ARGS[op].pack( *args ) )
+
+
+def decode_request(body):
+    """ Returns (op, game, args) of a request body
+    """
+    if( len(body) < HEADER.size ):
+        raise ProtocolError( "truncated request" )
+    op, game = HEADER.unpack_from( body )
+    if( op not in ARGS ):
+        raise ProtocolError( f"unknown opcode {op}" )
+    args = ARGS[op]
+    if( len(body) != HEADER.size + args.size ):
+        raise ProtocolError( f"bad request length {len(body)} for opcode {op}" )
+    return op, game, args.unpack_from( body, HEADER.size )
+
+
+def encode_state(game):
+    return STATE.pack( game.score, game.steps, len(game.fruits), game.is_gameover )
+
+
+def encode_reply(result=b''):
+    return frame( bytes( (STATUS_OK,) ) + result )
+
+
+def encode_error(message):
+    return frame( bytes( (STATUS_ERROR,) ) + message.encode() )
+
+
+def decode_reply(body):
+    """ Result bytes of a reply body, raises ProtocolError with the error message of the server
+    """
+    if( not body ):
+        raise ProtocolError( "empty reply" )
+    if( body[0] != STATUS_OK ):
+        raise ProtocolError( body[1:].decode( errors='replace' ) )
+    return memoryview(body)[1:]
+
+
+def decode_state(result):
+    return State( *STATE.unpack_from( result ) )
+
+
+def decode_observation(result):
+    """ state, observation array of an OP_OBSERVE result
+    """
+    obs = np.frombuffer( result, dtype=np.float32, offset=STATE.size ).reshape( OBS_SHAPE )
+    return decode_state( result ), obs
+
+
+def _recv_exactly(sock, size):
+    buf = bytearray( size )
+    view = memoryview( buf )
+    got = 0
+    while( got < size ):
+        n = sock.recv_into( view[got:] )
+        if( n == 0 ):
+            raise ConnectionError( "connection closed by the server" )
+        got += n
+    return buf
+
+
+def recv_frame(sock, max_size=MAX_FRAME):
+    size, = LENGTH.unpack( _recv_exactly( sock, LENGTH.size ) )
+    if( size > max_size ):
+        raise ProtocolError( f"frame of {size} bytes" )
+    return bytes( _recv_exactly( sock, size ) )
+
+
+class Client(object):
+    """ Blocking connection to a game server
+    address: path of a Unix socket, or (host, port) of a TCP socket
+    """
+    def __init__(self, address):
+        if( isinstance( address, str ) ):
+            self._sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+        else:
+            self._sock = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
+            self._sock.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+        self._sock.connect( address )
+        self._pending = 0
+
+    def close(self):
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def send(self, op, game, *args):
+        """ Sends a request without waiting for its reply, see receive()
+        """
+        self._sock.sendall( encode_request( op, game, *args ) )
+        self._pending += 1
+
+    def receive(self):
+        """ Result bytes of the oldest request sent
+        """
+        self._pending -= 1
+        return decode_reply( recv_frame( self._sock ) )
+
+    def request(self, op, game, *args):
+        self.send( op, game, *args )
+        return self.receive()
+
+    def new(self, instant=False):
+        """ Creates a game, returns its id
+        """
+        return GAME_ID.unpack( self.request( OP_NEW, 0, instant ) )[0]
+
+    def reset(self, game, seed=None):
+        """ New game: the fruits and random drops only depend on the seed
+        """
+        return decode_state( self.request( OP_RESET, game, -1 if seed is None else seed ) )
+
+    def observe(self, game):
+        """ State and observation (OBS_MAX_FRUITS + 1, 3) of the game
+        """
+        return decode_observation( self.request( OP_OBSERVE, game ) )
+
+    def drop(self, game, x):
+        """ Drops the next fruit at x from 0 (left) to 1 (right) of the jar
+        """
+        return decode_state( self.request( OP_DROP, game, x ) )
+
+    def step(self, game, steps=1):
+        return decode_state( self.request( OP_STEP, game, steps ) )
+
+    def settle(self, game, max_steps=0):
+        """ Steps until the fruits are at rest, the game is over, or max_steps
+        """
+        return decode_state( self.request( OP_SETTLE, game, max_steps ) )
+
+    def delete(self, game):
+        self.request( OP_DELETE, game )
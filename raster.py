@@ -0,0 +1,138 @@
+""" Software rasterizer of the boards for the agents, in NumPy only (no OpenGL)
+
+A board becomes a small multi-channel grid: one channel per fruit kind, plus the
+maxline. Fruits are discs of their kind radius, stretched to the grid aspect.
+Row 0 is the top of the jar.
+
+    python raster.py        # timings, and a preview of a board
+"""
+import argparse, contextlib, io, random, time
+import numpy as np
+
+from constants import *
+import fruit
+
+
+def channels():
+    """ Channels of a grid: kinds 1..nb_fruits(), then the maxline
+    """
+    return fruit.nb_fruits() + 1
+
+
+def board_fruits(game):
+    """ Fruits of a game in jar units, for rasterize_batch()
+    Returns xy (n, 2) and radius (n, 2) in fractions of the jar width and height,
+    kinds (n,), and the maxline height in fraction of the jar height.
+    """
+    bocal = game.bocal
+    size = np.array( (bocal.width, bocal.height) )
+    ints, floats = game.fruits.get_state( np.float64 )
+    kinds = ints[:, 1]
+    xy = bocal.to_bocal_array( floats[:, :2] ) / size + 0.5
+    radius = np.asarray( fruit._KIND_RADIUS )[kinds, None] / size
+    maxline = 1 - REDLINE_TOP_MARGIN / bocal.height
+    return xy, radius, kinds, maxline
+
+
+def rasterize_batch(board_idx, xy, radius, kinds, maxlines, width=RASTER_WIDTH, height=RASTER_HEIGHT):
+    """ Grids of many boards at once, uint8 (boards, channels(), height, width) of 0/1
+    board_idx (n,): board of each fruit, xy/radius/kinds: as board_fruits(), concatenated
+    maxlines (boards,): maxline heights
+    """
+    boards = len(maxlines)
+    c = channels()
+    out = np.zeros( (boards * c, height * width), dtype=np.uint8 )
+
+    # one row of out per (board, kind)
+    rows = board_idx * c + kinds - 1
+    # in pixels, row 0 at the top
+    cx = xy[:, 0] * width
+    cy = ( 1 - xy[:, 1] ) * height
+    rx = radius[:, 0] * width
+    ry = radius[:, 1] * height
+    for kind in np.unique( kinds ):
+        # fruits of a kind share the size of their bounding box: (n, box_h, box_w) masks
+        sel = np.flatnonzero( kinds == kind )
+        half_w = int( np.ceil( rx[sel].max() ) ) + 1
+        half_h = int( np.ceil( ry[sel].max() ) ) + 1
+        xs = np.floor( cx[sel] ).astype(int)[:, None] + np.arange( -half_w, half_w + 1 )    # (n, box_w)
+        ys = np.floor( cy[sel] ).astype(int)[:, None] + np.arange( -half_h, half_h + 1 )    # (n, box_h)
+        dx2 = ( ( xs + 0.5 - cx[sel, None] ) / rx[sel, None] ) ** 2
+        dy2 = ( ( ys + 0.5 - cy[sel, None] ) / ry[sel, None] ) ** 2
+        dx2[ (xs < 0) | (xs >= width) ] = np.inf        # outside of the grid
+        dy2[ (ys < 0) | (ys >= height) ] = np.inf
+        f, j, i = np.nonzero( dy2[:, :, None] + dx2[:, None, :] <= 1 )
+        out[ rows[sel][f], ys[f, j] * width + xs[f, i] ] = 1
+
+    out = out.reshape( boards, c, height, width )
+    # maxline: the row of each board that contains it
+    line_rows = np.clip( ( (1 - np.asarray(maxlines)) * height ).astype(int), 0, height - 1 )
+    out[ np.arange(boards), c - 1, line_rows, : ] = 1
+    return out
+
+
+def rasterize(game, width=RASTER_WIDTH, height=RASTER_HEIGHT):
+    """ Grid of one game, uint8 (channels(), height, width)
+    """
+    return rasterize_games( [game], width, height )[0]
+
+
+def rasterize_games(games, width=RASTER_WIDTH, height=RASTER_HEIGHT):
+    """ Grids of several games, uint8 (len(games), channels(), height, width)
+    """
+    boards = [ board_fruits(g) for g in games ]
+    board_idx = np.concatenate( [ np.full( len(b[2]), i ) for i, b in enumerate(boards) ] ).astype(int)
+    xy = np.concatenate( [ b[0] for b in boards ] ).reshape(-1, 2)
+    radius = np.concatenate( [ b[1] for b in boards ] ).reshape(-1, 2)
+    kinds = np.concatenate( [ b[2] for b in boards ] ).astype(int)
+    maxlines = [ b[3] for b in boards ]
+    return rasterize_batch( board_idx, xy, radius, kinds, maxlines, width, height )
+
+
+def preview(grid):
+    """ Text view of a grid: the kind of each pixel, '-' for the maxline
+    """
+    kinds = np.argmax( grid[:-1], axis=0 ) + 1
+    kinds[ grid[:-1].max(axis=0) == 0 ] = 0
+    lines = []
+    for y in range( grid.shape[1] ):
+        lines.append( ''.join( '-' if grid[-1, y, x] and not kinds[y, x] else ' 123456789ABCDEF'[ kinds[y, x] ]
+                               for x in range( grid.shape[2] ) ) )
+    return '\n'.join(lines)
+
+
+def main():
+    from game import SuikaGame
+
+    parser = argparse.ArgumentParser(description="NumPy board rasterizer")
+    parser.add_argument('--boards', type=int, default=16, help="boards of the batch timing")
+    parser.add_argument('--seconds', type=float, default=60, help="autoplay time of the boards")
+    parser.add_argument('--width', type=int, default=RASTER_WIDTH)
+    parser.add_argument('--height', type=int, default=RASTER_HEIGHT)
+    args = parser.parse_args()
+
+    random.seed(1)
+    games = []
+    with contextlib.redirect_stdout( io.StringIO() ):
+        for _ in range( args.boards ):
+            g = SuikaGame()
+            g.autoplayer.set_rate( 5 )
+            g.autoplayer.enable()
+            for _ in range( int( args.seconds / g.interval ) ):
+                g.drop( None, g.autoplayer.step( g.interval ) )
+                g.step( g.interval )
+            games.append( g )
+
+    print( preview( rasterize( games[0], args.width, args.height ) ) )
+    for name, func in ( ('1 board', lambda: rasterize( games[0], args.width, args.height )),
+                        (f"{args.boards} boards", lambda: rasterize_games( games, args.width, args.height )) ):
+        start = time.perf_counter()
+        for _ in range(100):
+            func()
+        print( f"{name}: {10 * (time.perf_counter() - start):.3f} ms" )
+    print( f"{sum( len(g.fruits) for g in games )} fruits, grid {channels()}x{args.height}x{args.width}" )
+    for g in games:
+        g.fruits.reset()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+""" Replays: full-state keyframes of a game and the stream of the player actions
+
+A replay file (.npz) holds a keyframe every REPLAY_KEYFRAME_INTERVAL seconds and
+each action with the step it was played at. Seeking restores the last keyframe
+before the target and simulates only the gap, replaying the actions.
+
+    python suika.py --record game.npz
+    python replay_viewer.py game.npz
+"""
+import bisect, json, time
+import numpy as np
+
+from constants import *
+import game as suika_game
+import rewind
+
+
+REPLAY_VERSION = 1
+
+# action types, as stored in the files
+ACTION_TYPES = ( suika_game.ACTION_DROP, suika_game.ACTION_SHOOT, suika_game.ACTION_GAMEOVER )
+
+
+class Replay(object):
+    """ Keyframes (rewind.BoardSnapshot) and actions [(step, type, payload)] of one game
+    """
+    def __init__(self, meta, keyframes, actions):
+        """ meta: settings of the recorded game (interval, preset, instant, window size)
+        and its length in steps
+        """
+        self.meta = meta
+        self.keyframes = keyframes
+        self.actions = actions
+        self._keyframe_steps = [ k.steps for k in keyframes ]
+        self._action_steps = [ a[0] for a in actions ]
+
+    @property
+    def steps(self):
+        return self.meta['steps']
+
+    @property
+    def duration(self):
+        """ Seconds of simulation
+        """
+        return self.steps * self.meta['interval']
+
+    def keyframe_before(self, step):
+        """ Index of the last keyframe at or before step
+        """
+        return max( 0, bisect.bisect_right( self._keyframe_steps, step ) - 1 )
+
+    def first_action(self, step):
+        """ Index of the first action played at or after step
+        """
+        return bisect.bisect_left( self._action_steps, step )
+
+    def save(self, path):
+        kfs = self.keyframes
+        info = [ { 'steps': k.steps,
+                   'time': k.time,
+                   'next_kind': k.next_kind,
+                   'preview': k.preview.tolist(),
+                   'score': k.score,
+                   'merges': k.merges,
+                   'countdown': k.countdown,
+                   'is_gameover': k.is_gameover,
+                   'events': k.events } for k in kfs ]
+        args = np.zeros( (len(self.actions), 3) )
+        for i, (step, type, payload) in enumerate( self.actions ):
+            if( payload is not None ):
+                args[i, :np.size(payload)] = payload
+        np.savez_compressed( path,
+            meta=np.array( json.dumps( dict( self.meta, version=REPLAY_VERSION ) ) ),
+            keyframes=np.array( json.dumps(info) ),
+            fruit_counts=np.array( [ len(k) for k in kfs ], dtype=np.int32 ),
+            fruit_ints=np.concatenate( [ k.fruit_ints for k in kfs ] ),
+            fruit_floats=np.concatenate( [ k.fruit_floats for k in kfs ] ),
+            action_steps=np.array( self._action_steps, dtype=np.int64 ),
+            action_types=np.array( [ ACTION_TYPES.index(a[1]) for a in self.actions ], dtype=np.int8 ),
+            action_args=args )
+
+    @staticmethod
+    def load(path):
+        with np.load( path ) as data:
+            meta = json.loads( str(data['meta']) )
+            if( meta['version'] != REPLAY_VERSION ):
+                raise ValueError( f"{path}: replay version {meta['version']}, expected {REPLAY_VERSION}" )
+            offsets = np.concatenate( ( [0], np.cumsum( data['fruit_counts'] ) ) )
+            ints, floats = data['fruit_ints'], data['fruit_floats']
+            keyframes = []
+            for i, k in enumerate( json.loads( str(data['keyframes']) ) ):
+                a, b = offsets[i], offsets[i+1]
+                keyframes.append( rewind.BoardSnapshot(
+                    steps=k['steps'], time=k['time'],
+                    fruit_ints=ints[a:b], fruit_floats=floats[a:b],
+                    next_kind=k['next_kind'], preview=np.array( k['preview'], dtype=np.int8 ),
+                    score=k['score'], merges=k['merges'], countdown=k['countdown'],
+                    is_gameover=k['is_gameover'], events=k['events'] ) )
+            actions = []
+            for step, t, args in zip( data['action_steps'].tolist(), data['action_types'].tolist(),
+                                      data['action_args'].tolist() ):
+                type = ACTION_TYPES[t]
+                if( type == suika_game.ACTION_DROP ):
+                    payload = ( int(args[0]), args[1], args[2] )
+                elif( type == suika_game.ACTION_SHOOT ):
+                    payload = int( args[0] )
+                else:
+                    payload = None
+                actions.append( (step, type, payload) )
+        return Replay( meta, keyframes, actions )
+
+
+class ReplayRecorder(object):
+    """ Records the keyframes and the actions of the games of a SuikaGame
+    """
+    def __init__(self, game, width, height, keyframe_interval=REPLAY_KEYFRAME_INTERVAL):
+        """ width, height: window size, the positions are in window coordinates
+        """
+        self._game = game
+        self._size = ( width, height )
+        self._keyframe_steps = max( 1, round( keyframe_interval / game.interval ) )
+        game.on_action = self.on_action
+        self.start()
+
+    def start(self):
+        """ New game: first keyframe on the current board
+        """
+        self._keyframes = [ self._snapshot() ]
+        self._actions = []
+        self.saved = False
+
+    def _snapshot(self):
+        return self._game.snapshot( dtype=np.float64 )     # full precision, for the re-simulation
+
+    def on_action(self, type, payload):
+        self._actions.append( (self._game.steps, type, payload) )
+
+    def record_step(self):
+        """ called after each physics step
+        """
+        steps = self._game.steps
+        if( steps % self._keyframe_steps == 0 and self._keyframes[-1].steps != steps ):
+            self._keyframes.append( self._snapshot() )
+
+    def truncate(self):
+        """ The game goes on from an earlier board (rewind): drops the later records
+        """
+        steps = self._game.steps
+        self._keyframes = [ k for k in self._keyframes if k.steps < steps ] + [ self._snapshot() ]
+        self._actions = [ a for a in self._actions if a[0] < steps ]
+
+    def replay(self):
+        game = self._game
+        meta = { 'interval': game.interval,
+                 'preset': game.preset.name,
+                 'instant': game.instant,
+                 'width': self._size[0],
+                 'height': self._size[1],
+                 'steps': game.steps,
+                 'score': game.score,
+                 'keyframe_steps': self._keyframe_steps }
+        keyframes = list( self._keyframes )
+        if( keyframes[-1].steps != game.steps ):
+            keyframes.append( self._snapshot() )    # the last board is exact
+        return Replay( meta, keyframes, list(self._actions) )
+
+    def save(self, path):
+        self.replay().save( path )
+        self.saved = True
+
+
+class ReplayPlayer(object):
+    """ Plays a replay on a SuikaGame, built with the settings of the replay
+    """
+    def __init__(self, replay, game):
+        self._replay = replay
+        self._game = game
+        self._step = None
+
+    @property
+    def step(self):
+        """ Step shown, None before the first seek
+        """
+        return self._step
+
+    def seek(self, target, budget=None):
+        """ Brings the game to the target step, returns the step reached
+        Going back or past the next keyframe restores the last keyframe before
+        the target, then the gap is simulated.
+        budget: seconds of simulation work, the game stops short of the target beyond
+        """
+        replay = self._replay
+        target = min( max( int(target), 0 ), replay.steps )
+        k = replay.keyframe_before( target )
+        if( self._step is None or self._step > target or self._step < replay.keyframes[k].steps ):
+            self._restore( k )
+
+        deadline = time.perf_counter() + budget if budget else None
+        while( self._step < target ):
+            self._tick()
+            if( deadline and time.perf_counter() > deadline ):
+                break
+        return self._step
+
+    def _restore(self, k):
+        kf = self._replay.keyframes[k]
+        self._game.restore( kf )
+        self._step = kf.steps
+        self._next_keyframe = k + 1
+        self._next_action = self._replay.first_action( kf.steps )
+
+    def _tick(self):
+        replay = self._replay
+        actions = replay.actions
+        while( self._next_action < len(actions) and actions[self._next_action][0] == self._step ):
+            _, type, payload = actions[self._next_action]
+            self._game.apply_action( type, payload )
+            self._next_action += 1
+        self._game.step( self._game.interval )
+        self._step += 1
+        # back on the recorded board at each keyframe: the re-simulation drifts
+        keyframes = replay.keyframes
+        if( self._next_keyframe < len(keyframes) and keyframes[self._next_keyframe].steps == self._step ):
+            self._restore( self._next_keyframe )
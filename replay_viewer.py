@@ -0,0 +1,131 @@
+""" Replay viewer: plays a replay file in the game window
+
+    python replay_viewer.py game.npz [--speed 8]
+
+SPACE: play/pause, LEFT/RIGHT: seek (SHIFT: faster), UP/DOWN: speed,
+HOME/END: start/end of the game, F: frame profiler, ESC: quit
+"""
+import argparse
+import pyglet as pg
+
+from constants import *
+from suika import SuikaWindow
+import replay
+
+
+def _format_time(seconds):
+    return f"{int(seconds // 60)}:{seconds % 60:04.1f}"
+
+
+class ReplayWindow(SuikaWindow):
+    """ Game window showing a replay instead of a live game
+    """
+    def __init__(self, replay_data, speed=1):
+        meta = replay_data.meta
+        super().__init__(width=meta['width'], height=meta['height'], instant=meta['instant'],
+                         preset=meta['preset'])
+        # the positions are in window coordinates
+        self.set_minimum_size(meta['width'], meta['height'])
+        self.set_maximum_size(meta['width'], meta['height'])
+        self.set_caption("Suika Game - replay")
+
+        self._replay = replay_data
+        self._player = replay.ReplayPlayer(replay_data, self._game)
+        self._speed = speed if speed in REPLAY_SPEEDS else REPLAY_SPEEDS[0]
+        self._position = 0.0        # target step, follows the playback clock
+        self._playing = True
+        self._gameover_shown = False
+        self.start_game()
+        self._player.seek(0)
+
+    def autoplay_tick(self, dt):
+        pass
+
+    def ai_tick(self, dt):
+        pass
+
+    def on_gameover(self):
+        super().on_gameover()
+        self._gameover_shown = True
+
+    def seek(self, step):
+        self._position = min( max( step, 0 ), self._replay.steps )
+        self._player.seek( self._position )
+        self._check_gameover()
+
+    def _check_gameover(self):
+        # a seek back before the game over hides its screen
+        if( self._gameover_shown and not self._is_gameover ):
+            self._gui.reset()
+            self._gameover_shown = False
+
+    def set_speed(self, offset):
+        i = REPLAY_SPEEDS.index( self._speed ) + offset
+        self._speed = REPLAY_SPEEDS[ min( max( i, 0 ), len(REPLAY_SPEEDS) - 1 ) ]
+
+    def simulation_tick(self, dt):
+        if( self._playing ):
+            self._position += dt * self._speed / self._game.interval
+            if( self._position >= self._replay.steps ):
+                self._position = self._replay.steps
+                self._playing = False
+        # beyond the budget the playback falls behind, then jumps to the next keyframes
+        self._player.seek( self._position, budget=REPLAY_TICK_BUDGET )
+        self._check_gameover()
+        self.pymunk_fps.tick_rel(dt)
+
+    def game_status(self):
+        interval = self._game.interval
+        shown = self._player.step * interval
+        status = f"REPLAY {self._speed}x {_format_time(shown)} / {_format_time(self._replay.duration)}"
+        if( not self._playing ):
+            status += " PAUSE"
+        return status
+
+    def on_key_press(self, symbol, modifiers):
+        key = pg.window.key
+        seek_steps = REPLAY_SEEK_STEP / self._game.interval
+        if( modifiers & key.MOD_SHIFT ):
+            seek_steps *= 6
+        if symbol == key.ESCAPE:
+            self.end_application()
+        elif symbol == key.SPACE:           # play/pause, from the start at the end
+            if( not self._playing and self._position >= self._replay.steps ):
+                self.seek(0)
+            self._playing = not self._playing
+        elif symbol == key.LEFT:
+            self.seek( self._player.step - seek_steps )
+        elif symbol == key.RIGHT:
+            self.seek( self._player.step + seek_steps )
+        elif symbol == key.UP:
+            self.set_speed(+1)
+        elif symbol == key.DOWN:
+            self.set_speed(-1)
+        elif symbol == key.HOME:
+            self.seek(0)
+        elif symbol == key.END:
+            self.seek( self._replay.steps )
+        elif symbol == key.F:
+            self._gui.toggle_profiler()
+
+    def on_key_release(self, symbol, modifiers):
+        pass
+
+    def on_mouse_press(self, x, y, button, modifiers):
+        pass
+
+    def on_mouse_scroll(self, x, y, scroll_x, scroll_y):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suika replay viewer")
+    parser.add_argument('path', help="replay file, from suika.py --record")
+    parser.add_argument('--speed', type=int, choices=REPLAY_SPEEDS, default=1, help="playback speed")
+    args = parser.parse_args()
+
+    window = ReplayWindow( replay.Replay.load(args.path), speed=args.speed )
+    pg.app.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+""" Rewind: recent board snapshots kept in memory, to scrub back and resume
+
+The window takes a snapshot every REWIND_INTERVAL physics steps, and drops
+the oldest ones beyond REWIND_BUDGET_MB. LEFT/RIGHT scrub, ENTER resumes.
+"""
+import collections
+
+from constants import *
+
+
+_SNAPSHOT_BYTES = 400       # python objects of a snapshot, besides the arrays
+_EVENT_BYTES = 150          # one pending event
+
+
+class BoardSnapshot(object):
+    """ Compact state of a board: the fruits as NumPy arrays, the rules state as scalars
+    The jar is not saved, it is restored at rest.
+    """
+    __slots__ = ( 'steps', 'time', 'fruit_ints', 'fruit_floats', 'next_kind', 'preview',
+                  'score', 'merges', 'countdown', 'is_gameover', 'events' )
+
+    def __init__(self, steps, time, fruit_ints, fruit_floats, next_kind, preview, score, merges, countdown,
+                 is_gameover, events):
+        """ steps: ticks since the game start
+        time: simulation time of the game (EventQueue.time)
+        fruit_ints, fruit_floats: arrays from ActiveFruits.get_state()
+        next_kind: kind of the fruit waiting to be dropped, 0 if none
+        preview: kinds of the preview queue
+        countdown: seconds since the overflow countdown start, None if not running
+        events: pending events, from EventQueue.pending()
+        """
+        self.steps = steps
+        self.time = time
+        self.fruit_ints = fruit_ints
+        self.fruit_floats = fruit_floats
+        self.next_kind = next_kind
+        self.preview = preview
+        self.score = score
+        self.merges = merges
+        self.countdown = countdown
+        self.is_gameover = is_gameover
+        self.events = events
+
+    def __len__(self):
+        return len(self.fruit_ints)
+
+    @property
+    def nbytes(self):
+        """ Approximate memory size
+        """
+        return ( self.fruit_ints.nbytes + self.fruit_floats.nbytes + self.preview.nbytes
+                 + _SNAPSHOT_BYTES + _EVENT_BYTES * len(self.events) )
+
+
+class RewindBuffer(object):
+    """ Ring of the last snapshots of a game, bounded in memory
+    """
+    def __init__(self, interval=REWIND_INTERVAL, budget_mb=REWIND_BUDGET_MB):
+        self._interval = interval
+        self._budget = budget_mb * 1024 * 1024
+        self.clear()
+
+    def clear(self):
+        self._snapshots = collections.deque()
+        self._nbytes = 0
+        self._steps = 0
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def __getitem__(self, index):
+        return self._snapshots[index]
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def record_step(self, game):
+        """ Called after each physics step: takes a snapshot every interval steps
+        Paused games are not recorded, nor the game over sequence.
+        """
+        if( game.is_paused or game.is_gameover ):
+            return
+        self._steps += 1
+        if( self._steps % self._interval == 0 ):
+            self.append( game.snapshot() )
+
+    def append(self, snapshot):
+        self._snapshots.append( snapshot )
+        self._nbytes += snapshot.nbytes
+        while( self._nbytes > self._budget and len(self._snapshots) > 1 ):
+            self._nbytes -= self._snapshots.popleft().nbytes
+
+    def truncate(self, index):
+        """ Drops the snapshots after index, to resume the game from there
+        """
+        while( len(self._snapshots) > index + 1 ):
+            self._nbytes -= self._snapshots.pop().nbytes
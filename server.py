@@ -0,0 +1,272 @@
+""" Headless game server for external agents, on asyncio
+
+Agents in other processes (or other frameworks) connect over a Unix or TCP socket
+on localhost and drive games with the binary protocol of protocol.py: new game,
+reset(seed), observe, drop(x), step and step-until-settled.
+The requests of all the connections go to a single batch loop: at each turn it
+runs the pending requests of every game, and advances the games that are stepping
+by SERVER_BATCH_STEPS ticks, so that a long settle does not hold the others.
+Each game has its own random state and countdown clock: its fruits only depend on
+its seed and drops, whatever the other games do.
+
+    python server.py                        # TCP on 127.0.0.1:SERVER_PORT
+    python server.py --unix /tmp/suika.sock
+"""
+import argparse, asyncio, collections, contextlib, io, os, random, time
+
+from constants import *
+from game import SuikaGame
+import physics
+import protocol
+
+_STEP_OPS = ( protocol.OP_STEP, protocol.OP_SETTLE )
+
+
+class ServedGame(object):
+    """ A game of the server and its pending requests, run in order
+    """
+    def __init__(self, instant, preset):
+        self.game = SuikaGame( instant=instant, preset=preset, sim_clock=True )
+        self.requests = collections.deque()     # (op, args, future)
+        self.steps_left = 0                     # of the OP_STEP / OP_SETTLE being run
+        self._rng_state = random.Random().getstate()
+
+    @contextlib.contextmanager
+    def rng(self):
+        """ Own random state of the game, for the code run inside
+        """
+        saved = random.getstate()
+        random.setstate( self._rng_state )
+        try:
+            yield
+        finally:
+            self._rng_state = random.getstate()
+            random.setstate( saved )
+
+    def step(self, steps):
+        game = self.game
+        for _ in range( steps ):
+            game.step( game.interval )
+            game.update_countdown()
+            if( game.is_gameover ):
+                break
+
+    def delete(self):
+        self.game.fruits.reset()        # releases the pymunk objects of the fruits
+
+
+class GameServer(object):
+    def __init__(self, preset=physics.DEFAULT_PRESET, batch_steps=SERVER_BATCH_STEPS):
+        self._preset = preset
+        self._batch_steps = batch_steps
+        self._games = {}
+        self._next_id = 1
+        self._wakeup = asyncio.Event()
+        self.requests = 0           # served, for the statistics
+        self.steps = 0
+
+    async def handle_connection(self, reader, writer):
+        """ Reads the requests of a client; its replies are written in order by _write_replies()
+        """
+        replies = asyncio.Queue()
+        sender = asyncio.ensure_future( self._write_replies( replies, writer ) )
+        owned = set()       # games of the connection, deleted when it closes
+        try:
+            while( True ):
+                size, = protocol.LENGTH.unpack( await reader.readexactly( protocol.LENGTH.size ) )
+                if( size > protocol.MAX_FRAME ):
+                    raise protocol.ProtocolError( f"frame of {size} bytes" )
+                op, game_id, args = protocol.decode_request( await reader.readexactly( size ) )
+                future = asyncio.get_running_loop().create_future()
+                replies.put_nowait( future )
+                self.submit( op, game_id, args, future, owned )
+        except ( asyncio.IncompleteReadError, ConnectionError ):
+            pass
+        except protocol.ProtocolError as e:
+            print( f"closing a connection: {e}" )
+        finally:
+            replies.put_nowait( None )
+            await sender
+            for game_id in owned:
+                self._delete( game_id )
+            writer.close()
+
+    async def _write_replies(self, replies, writer):
+        while( True ):
+            future = await replies.get()
+            if( future is None ):
+                return
+            try:
+                writer.write( await future )
+                await writer.drain()
+            except ConnectionError:
+                return
+
+    def submit(self, op, game_id, args, future, owned):
+        if( op == protocol.OP_NEW ):
+            game_id = self._new_id()
+            with contextlib.redirect_stdout( io.StringIO() ):
+                self._games[game_id] = ServedGame( bool( args[0] ), self._preset )
+            owned.add( game_id )
+            future.set_result( protocol.encode_reply( protocol.GAME_ID.pack( game_id ) ) )
+            return
+        served = self._games.get( game_id )
+        if( served is None ):
+            future.set_result( protocol.encode_error( f"no game {game_id}" ) )
+            return
+        served.requests.append( (op, args, future) )
+        self._wakeup.set()
+
+    def _delete(self, game_id):
+        """ Removes a game, its pending requests (of any connection) get an error reply
+        """
+        served = self._games.pop( game_id, None )
+        if( not served ):
+            return
+        for _, _, future in served.requests:
+            if( not future.done() ):
+                future.set_result( protocol.encode_error( f"no game {game_id}" ) )
+        served.requests.clear()
+        served.delete()
+
+    def _new_id(self):
+        while( self._next_id in self._games or self._next_id == 0 ):
+            self._next_id = self._next_id % 0xFFFF + 1
+        game_id = self._next_id
+        self._next_id = self._next_id % 0xFFFF + 1
+        return game_id
+
+    async def batch_loop(self):
+        """ Runs the requests of all the games, a turn at a time
+        """
+        while( True ):
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            with contextlib.redirect_stdout( io.StringIO() ):     # messages of the game rules
+                busy = False
+                for game_id, served in list( self._games.items() ):
+                    busy |= self._run( game_id, served )
+            if( busy ):
+                self._wakeup.set()
+                await asyncio.sleep( 0 )        # reads and writes of the connections
+
+    def _run(self, game_id, served):
+        """ Runs the pending requests of a game, up to the end of a turn of steps
+        Returns True if requests are left.
+        """
+        requests = served.requests
+        with served.rng():
+            while( requests ):
+                op, args, future = requests[0]
+                try:
+                    if( op in _STEP_OPS ):
+                        result = self._run_steps( served, op, args )
+                        if( result is None ):
+                            return True         # next turn
+                    else:
+                        requests.popleft()      # before an OP_DELETE clears them
+                        result = self._run_request( game_id, served, op, args )
+                    reply = protocol.encode_reply( result )
+                except Exception as e:
+                    served.steps_left = 0
+                    reply = protocol.encode_error( f"{type(e).__name__}: {e}" )
+                if( requests and requests[0][2] is future ):
+                    requests.popleft()
+                self.requests += 1
+                if( not future.cancelled() ):
+                    future.set_result( reply )
+                if( game_id not in self._games ):   # deleted, _delete() replied to the others
+                    break
+        return False
+
+    def _run_steps(self, served, op, args):
+        """ A turn of an OP_STEP or OP_SETTLE, returns its result when it is over, else None
+        """
+        game = served.game
+        if( not served.steps_left ):            # first turn
+            steps = args[0]
+            if( op == protocol.OP_SETTLE and not steps ):
+                steps = int( SETTLE_MAX_TIME / game.interval )
+            served.steps_left = steps
+        if( op == protocol.OP_SETTLE and served.game.is_settled() ):
+            served.steps_left = 0
+        steps = min( served.steps_left, self._batch_steps )
+        start = game.steps
+        served.step( steps )
+        self.steps += game.steps - start
+        served.steps_left -= steps
+        if( game.is_gameover ):
+            served.steps_left = 0
+        if( served.steps_left ):
+            return None
+        return protocol.encode_state( game )
+
+    def _run_request(self, game_id, served, op, args):
+        game = served.game
+        if( op == protocol.OP_RESET ):
+            # run in served.rng(): the random state of the game is the active one
+            random.seed( None if args[0] < 0 else args[0] )
+            game.reset()
+            return protocol.encode_state( game )
+        if( op == protocol.OP_OBSERVE ):
+            return protocol.encode_state( game ) + game.observation().tobytes()
+        if( op == protocol.OP_DROP ):
+            x = args[0]
+            if( not 0 <= x <= 1 ):
+                raise ValueError( f"drop x {x} out of 0..1" )
+            if( not game.is_gameover ):
+                game.drop( None, ratio=x )
+            return protocol.encode_state( game )
+        if( op == protocol.OP_DELETE ):
+            self._delete( game_id )
+            return b''
+        raise protocol.ProtocolError( f"unknown opcode {op}" )
+
+    @property
+    def games(self):
+        return len( self._games )
+
+
+async def serve(server, unix=None, host=SERVER_HOST, port=SERVER_PORT, stats=SERVER_STATS_INTERVAL):
+    if( unix ):
+        listener = await asyncio.start_unix_server( server.handle_connection, path=unix )
+        print( f"listening on {unix}" )
+    else:
+        listener = await asyncio.start_server( server.handle_connection, host=host, port=port )
+        print( f"listening on {host}:{port}" )
+    loop = asyncio.ensure_future( server.batch_loop() )
+    try:
+        async with listener:
+            while( stats ):
+                requests, steps, t = server.requests, server.steps, time.perf_counter()
+                await asyncio.sleep( stats )
+                dt = time.perf_counter() - t
+                print( f"{server.games} games, {(server.requests - requests) / dt:.0f} requests/s, "
+                       f"{(server.steps - steps) / dt:.0f} steps/s" )
+            await listener.serve_forever()
+    finally:
+        loop.cancel()
+        if( unix and os.path.exists( unix ) ):
+            os.remove( unix )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suika game server for external agents")
+    parser.add_argument('--unix', metavar='PATH', help="Unix socket path, instead of TCP")
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help="TCP port on 127.0.0.1")
+    parser.add_argument('--physics', choices=list(physics.PRESETS), default=physics.DEFAULT_PRESET,
+                        help="physics quality preset")
+    parser.add_argument('--batch-steps', type=int, default=SERVER_BATCH_STEPS,
+                        help="physics steps of a game per turn of the batch loop")
+    parser.add_argument('--stats', type=float, default=SERVER_STATS_INTERVAL,
+                        help="seconds between two statistics lines, 0 for none")
+    args = parser.parse_args()
+
+    server = GameServer( preset=args.physics, batch_steps=args.batch_steps )
+    try:
+        asyncio.run( serve( server, unix=args.unix, port=args.port, stats=args.stats ) )
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
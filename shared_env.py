@@ -0,0 +1,241 @@
+""" Vector environment of games run by worker processes, exchanged through shared memory
+
+The observations, rewards, done flags and actions of all the games live in one
+multiprocessing.shared_memory block, one slot per game: nothing is pickled between
+the learner and the workers, and the learner reads the batch of every step as
+NumPy views of the block, without copy.
+Each slot has two sequence counters: the learner writes the action of a game, then
+bumps its action_seq; the worker of the game drops the fruit, steps the board until
+it is at rest, writes the observation, reward and done flag, then sets obs_seq to
+action_seq. A slot is ready when both counters are equal.
+A game over is followed by a new game in the same slot: its done step returns the
+first observation of the next game, and the final score of the finished one.
+
+    python shared_env.py --envs 16 --workers 2 [--train]     # decisions/s of a SuikaAgent
+"""
+import argparse, contextlib, io, math, random, time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+from constants import *
+from action_space import ActionSpace
+from game import SuikaGame
+import physics
+
+OBS_SHAPE = ( OBS_MAX_FRUITS + 1, 3 )
+_ALIGN = 64         # bytes: every array on its own cache lines
+_SETTLE_CHECK = 8   # physics steps between two SuikaGame.is_settled() tests
+
+
+def _layout(envs, obs_shape):
+    """ Name, shape and dtype of the arrays of the block
+    """
+    return (
+        ( 'obs',        (envs,) + tuple(obs_shape), np.float32 ),
+        ( 'reward',     (envs,),                    np.float32 ),
+        ( 'done',       (envs,),                    np.bool_ ),
+        ( 'score',      (envs,),                    np.int32 ),
+        ( 'action',     (envs,),                    np.float32 ),    # 0..1 across the jar, NaN: new game
+        ( 'action_seq', (envs,),                    np.int64 ),      # written by the learner
+        ( 'obs_seq',    (envs,),                    np.int64 ),      # written by the workers
+        ( 'stop',       (1,),                       np.int64 ),
+    )
+
+
+class SharedSlots(object):
+    """ Arrays of the slots, in a shared memory block
+    Creates the block if name is None, else attaches to the block of that name.
+    """
+    def __init__(self, envs, obs_shape=OBS_SHAPE, name=None):
+        layout = _layout( envs, obs_shape )
+        offsets = []
+        size = 0
+        for _, shape, dtype in layout:
+            offsets.append( size )
+            size += math.ceil( math.prod(shape) * np.dtype(dtype).itemsize / _ALIGN ) * _ALIGN
+        self._owner = name is None
+        self._shm = shared_memory.SharedMemory( name=name, create=self._owner, size=size if self._owner else 0 )
+        self.envs = envs
+        for ( field, shape, dtype ), offset in zip( layout, offsets ):
+            array = np.ndarray( shape, dtype=dtype, buffer=self._shm.buf, offset=offset )
+            if( self._owner ):
+                array[...] = 0
+            setattr( self, field, array )
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def close(self):
+        for field, _, _ in _layout( 0, () ):
+            setattr( self, field, None )       # views of the buffer, released before it
+        self._shm.close()
+        if( self._owner ):
+            self._shm.unlink()
+
+
+def play_action(game, ratio, max_steps):
+    """ Drops a fruit at ratio across the jar, and steps until the board is at rest
+    Returns the reward.
+    """
+    score = game.score
+    game.drop( None, ratio=ratio )
+    for i in range( max_steps ):
+        game.step( game.interval )
+        game.update_countdown()
+        if( game.is_gameover or ( i % _SETTLE_CHECK == 0 and game.is_settled() ) ):
+            break
+    reward = game.score - score
+    if( game.is_gameover ):
+        reward += SHARED_GAMEOVER_REWARD
+    return reward
+
+
+def _worker_main(name, envs, first, count, instant, preset, seed):
+    """ Runs the games of the slots first..first+count until the stop flag is set
+    """
+    slots = SharedSlots( envs, name=name )
+    random.seed( None if seed is None else seed + first )     # fruits of a worker only depend on the seed
+    hi = first + count
+    with contextlib.redirect_stdout( io.StringIO() ):         # messages of the game rules
+        games = [ SuikaGame( instant=instant, preset=preset, sim_clock=True ) for _ in range( count ) ]
+        max_steps = int( SETTLE_MAX_TIME / games[0].interval )
+        try:
+            while( not slots.stop[0] ):
+                pending = np.flatnonzero( slots.action_seq[first:hi] != slots.obs_seq[first:hi] )
+                if( not len(pending) ):
+                    time.sleep( SHARED_POLL_INTERVAL )
+                    continue
+                for i in pending:
+                    game, slot = games[i], first + i
+                    seq = slots.action_seq[slot]
+                    ratio = slots.action[slot]
+                    reward, done = 0.0, False
+                    if( math.isnan( ratio ) ):
+                        game.reset()
+                    else:
+                        reward = play_action( game, min( max( float(ratio), 0.0 ), 1.0 ), max_steps )
+                        done = game.is_gameover
+                    slots.score[slot] = game.score
+                    if( done ):
+                        game.reset()
+                    slots.obs[slot] = game.observation()
+                    slots.reward[slot] = reward
+                    slots.done[slot] = done
+                    slots.obs_seq[slot] = seq       # last: the slot is ready
+        finally:
+            for game in games:
+                game.fruits.reset()
+            slots.close()
+
+
+class SharedEnvs(object):
+    """ Games run by worker processes, stepped as a batch by the learner
+    The arrays returned by reset() and step() are views of the shared block: they
+    are valid until the next step, copy them to keep them. close() unmaps the block,
+    its views must not be used after it.
+    """
+    def __init__(self, envs=SHARED_ENVS, workers=SHARED_WORKERS, instant=True,
+                 preset=physics.DEFAULT_PRESET, seed=None):
+        self.slots = SharedSlots( envs )
+        self._seq = 0
+        ctx = mp.get_context('spawn')       # no fork of the learner, its agent and threads
+        self._workers = []
+        for part in np.array_split( np.arange( envs ), min( workers, envs ) ):
+            process = ctx.Process( target=_worker_main, name="SharedEnvWorker", daemon=True,
+                                   args=( self.slots.name, envs, int(part[0]), len(part), instant, preset, seed ) )
+            process.start()
+            self._workers.append( process )
+
+    @property
+    def envs(self):
+        return self.slots.envs
+
+    def reset(self):
+        """ New games in every slot, returns their observations
+        """
+        self.step_async( np.full( self.envs, np.nan, dtype=np.float32 ) )
+        return self.step_wait()[0]
+
+    def step_async(self, actions):
+        """ Sends an action (0..1 across the jar) to every game
+        """
+        slots = self.slots
+        slots.action[:] = actions
+        self._seq += 1
+        slots.action_seq[:] = self._seq     # after the actions
+        return self._seq
+
+    def step_wait(self):
+        """ Waits for every slot, returns the views obs, reward, done, score
+        """
+        slots = self.slots
+        while( not np.all( slots.obs_seq == self._seq ) ):
+            for process in self._workers:
+                if( not process.is_alive() ):
+                    raise RuntimeError( f"shared env worker exited with code {process.exitcode}" )
+            time.sleep( SHARED_POLL_INTERVAL )
+        return slots.obs, slots.reward, slots.done, slots.score
+
+    def step(self, actions):
+        self.step_async( actions )
+        return self.step_wait()
+
+    def close(self):
+        if( self.slots.stop is None ):
+            return
+        self.slots.stop[0] = 1
+        for process in self._workers:
+            process.join( timeout=5 )
+            if( process.is_alive() ):
+                process.terminate()
+        self.slots.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    from suika_agent import SuikaAgent
+
+    parser = argparse.ArgumentParser(description="Shared memory vector environment")
+    parser.add_argument('--envs', type=int, default=SHARED_ENVS)
+    parser.add_argument('--workers', type=int, default=SHARED_WORKERS)
+    parser.add_argument('--decisions', type=int, default=200, help="batched steps of the run")
+    parser.add_argument('--train', action='store_true', help="Q-learning updates of the agent")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--physics', choices=list(physics.PRESETS), default=physics.DEFAULT_PRESET,
+                        help="physics quality preset")
+    args = parser.parse_args()
+
+    agent = SuikaAgent()
+    space = ActionSpace( agent.action_size )        # jar of the default window, as the workers
+    with SharedEnvs( args.envs, args.workers, preset=args.physics, seed=args.seed ) as envs:
+        obs = envs.reset()
+        states = [ agent.observation_state( o ) for o in obs ]
+        games = 0
+        wait = 0
+        start = time.perf_counter()
+        for _ in range( args.decisions ):
+            actions = agent.get_actions( states )
+            ratios = space.ratios( actions, obs[:, 0, 2].astype( np.intp ) )     # for the next fruits
+            t = time.perf_counter()
+            obs, reward, done, score = envs.step( ratios )
+            wait += time.perf_counter() - t
+            next_states = [ agent.observation_state( o ) for o in obs ]
+            if( args.train ):
+                for i in range( envs.envs ):
+                    agent.train( states[i], actions[i], reward[i], next_states[i], done[i] )
+            games += int( done.sum() )
+            states = next_states
+        elapsed = time.perf_counter() - start
+    decisions = args.decisions * args.envs
+    print( f"{decisions} decisions in {elapsed:.1f} s: {decisions / elapsed:.0f}/s, "
+           f"{games} games over, learner waiting {100 * wait / elapsed:.0f}% of the time" )
+
+if __name__ == '__main__':
+    main()
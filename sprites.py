@@ -1,41 +1,131 @@
+""" Sprites of the game, and the RenderContext that game objects create them through
+
+The game rules (fruit, bocal, preview, game) never import this module: they
+receive a RenderContext, or None to run without any sprite (benchmarks, training,
+headless tools). Nothing here touches OpenGL before the first sprite is created.
+"""
+import os
 import pyglet as pg
 from constants import *
 import utils
 
-pg.resource.path = ['assets/']
-
-VISI_NORMAL = 'visi_normal'
-VISI_HIDDEN = 'visi_hidden'
-
 SPRITE_GROUP_FOND = 'fond'
 SPRITE_GROUP_FRUITS = 'fruit'
 SPRITE_GROUP_EXPLOSIONS = 'explosions'
 SPRITE_GROUP_MASQUE = 'masque'
 SPRITE_GROUP_GUI = 'gui'
 
-_groups = {
-    SPRITE_GROUP_FOND : pg.graphics.Group( order = 0 ),
-    SPRITE_GROUP_FRUITS : pg.graphics.Group( order = 1 ),
-    SPRITE_GROUP_EXPLOSIONS : pg.graphics.Group( order = 2 ),
-    SPRITE_GROUP_MASQUE : pg.graphics.Group( order = 3 ),
-    SPRITE_GROUP_GUI : pg.graphics.Group( order = 4 )
-}
+# layers in drawing order
+_LAYERS = ( SPRITE_GROUP_FOND, SPRITE_GROUP_FRUITS, SPRITE_GROUP_EXPLOSIONS, SPRITE_GROUP_MASQUE, SPRITE_GROUP_GUI )
+
+ASSETS_DIR = os.path.join( os.path.dirname( os.path.abspath(__file__) ), 'assets' )
+ATLAS_MAX_SIZE = 2048       # larger images get their own texture, as with pyglet.resource
+
+_images = {}                # name: texture (region of the atlas)
+_atlas = None
+
+def load_image_data(name):
+    """ Decoded image of the assets directory: disk and PNG decoding only, no
+    OpenGL, so it can run on a worker thread.
+    Decoded row by row with the PyPNG of pyglet, whose decoder joins the pixels in
+    one C call that holds the GIL (half a second for the explosion sheet).
+    """
+    import pyglet.extlibs.png as pypng
+    width, height, rows, meta = pypng.Reader( filename=os.path.join( ASSETS_DIR, name ) ).asDirect()
+    fmt = ( 'LA' if meta['alpha'] else 'L' ) if meta['greyscale'] else ( 'RGBA' if meta['alpha'] else 'RGB' )
+    data = b''.join( row.tobytes() if hasattr( row, 'tobytes' ) else bytes( row ) for row in rows )
+    return pg.image.ImageData( width, height, fmt, data, -len(data) // height )
+
+def add_image(name, data):
+    """ Uploads a decoded image to the texture atlas (main thread)
+    """
+    global _atlas
+    if( name in _images ):          # already loaded on first use
+        return _images[name]
+    max_size = min( ATLAS_MAX_SIZE, pg.image.get_max_texture_size() ) - 1
+    if( data.width <= max_size and data.height <= max_size ):
+        if( _atlas is None ):
+            _atlas = pg.image.atlas.TextureBin()
+        _images[name] = _atlas.add( data, border=1 )
+    else:
+        _images[name] = data.get_texture()
+    return _images[name]
+
+def is_loaded(name):
+    return name in _images
+
+def image(name):
+    """ Texture of an image of the assets directory, loaded on first use if it
+    was not preloaded
+    """
+    img = _images.get( name )
+    if( img is None ):
+        img = add_image( name, load_image_data( name ) )
+    return img
 
-def sprite_group(name): return _groups[name]
-def batch():            return _g_batch
-def groupe_gui():       return _groups[SPRITE_GROUP_GUI]
-def groupe_masque():    return _groups[SPRITE_GROUP_MASQUE]
+def preload(loader, names):
+    """ Adds to a loader.BackgroundLoader the images, then the explosion animation
+    """
+    for name in list(names) + [ EXPLO_PNG ]:
+        loader.add( name, work=lambda name=name: load_image_data( name ),
+                    finish=lambda data, name=name: add_image( name, data ) )
+    loader.add( "explosion", finish=lambda _: explosion_sequence() )
 
-_g_batch = pg.graphics.Batch()   # optimization for display
+
+class RenderContext(object):
+    """ Graphics of a game: its sprite batch, its layer groups and its level of detail
+    The batch and the groups are created on first use.
+    """
+    def __init__(self, batch=None, parent=None, animations=True):
+        """ batch: shared with other contexts (several boards in one window), own batch if None
+        parent: group above the layers, e.g. the transform of a board
+        animations: False for boards shown too small, no fades, blinks nor explosions
+        """
+        self._batch = batch
+        self._parent = parent
+        self._groups = None
+        self.animations = animations
+
+    @property
+    def batch(self):
+        if( self._batch is None ):
+            self._batch = pg.graphics.Batch()   # optimization for display
+        return self._batch
+
+    def group(self, name):
+        if( self._groups is None ):
+            self._groups = { layer: pg.graphics.Group( order=order, parent=self._parent )
+                             for order, layer in enumerate( _LAYERS ) }
+        return self._groups[name]
+
+    def draw(self):
+        if( self._batch ):
+            self._batch.draw()
+
+    # factories of the game objects sprites
+    def fruit_sprite(self, nom, r):
+        return FruitSprite( self, nom=nom, r=r )
+
+    def preview_sprite(self, nom, width):
+        return PreviewSprite( self, nom=nom, width=width )
+
+    def explosion_sprite(self, r, on_explosion_end):
+        return ExplosionSprite( self, r=r, on_explosion_end=on_explosion_end )
+
+    def wall(self, a, b):
+        return LineSprite.wall( self, a, b )
+
+    def redline(self, a, b):
+        return LineSprite.redline( self, a, b )
 
 
 class LineSprite( pg.shapes.Line ):
     """objet graphique de type ligne"""
-    def __init__(self, a, b, color, thickness):
+    def __init__(self, render, a, b, color, thickness):
         super().__init__( x=a[0], y=a[1], x2=b[0], y2=b[1], thickness=thickness, 
             color=color, 
-            batch=batch(), 
-            group=sprite_group(SPRITE_GROUP_GUI) )
+            batch=render.batch, 
+            group=render.group(SPRITE_GROUP_GUI) )
         self.anchor_position = (0, 0)
 
     def __del__(self):
@@ -43,20 +133,21 @@ class LineSprite( pg.shapes.Line ):
         super().__del__()
 
     @classmethod
-    def wall(cls, a, b):
+    def wall(cls, render, a, b):
         # Segments to build the jar
-        return cls( a=a, b=b, thickness=WALL_THICKNESS, color=WALL_COLOR)
+        return cls( render, a=a, b=b, thickness=WALL_THICKNESS, color=WALL_COLOR)
 
     @classmethod
-    def redline(cls, a, b):
+    def redline(cls, render, a, b):
         # Maximum level red line
-        return cls( a=a, b=b, thickness=REDLINE_THICKNESS, color=REDLINE_COLOR)
+        return cls( render, a=a, b=b, thickness=REDLINE_THICKNESS, color=REDLINE_COLOR)
 
 
 class SuikaSprite ( pg.sprite.Sprite ):
 
-    def __init__(self, **kwargs):
+    def __init__(self, render, **kwargs):
         super().__init__(**kwargs)
+        self._render = render
         self._blink_start = None
         self._fadein_start = None 
         self._fadeout_start = None
@@ -117,6 +208,12 @@ class SuikaSprite ( pg.sprite.Sprite ):
 
     # intercepts the pyglet.spite.Sprite update to process animations
     def update(self, x, y, rotation, on_animation_stop):
+        if( not self._render.animations ):
+            # small board: no animation, a single vertex update
+            pg.sprite.Sprite.update( self, x=x, y=y, rotation=rotation,
+                                     scale_x=self._scale_ref[0], scale_y=self._scale_ref[1] )
+            return
+
         # position processed by pyglet
         pg.sprite.Sprite.update( self, x=x, y=y, rotation=rotation )
 
@@ -161,25 +258,26 @@ class SuikaSprite ( pg.sprite.Sprite ):
 
 
 class FruitSprite( SuikaSprite ):
-    def __init__(self, nom, r, group=None):
+    def __init__(self, render, nom, r, group=None):
         #  pyglet sprite associated with the physics object
         if( group is None ):
-            group = sprite_group(SPRITE_GROUP_FRUITS)
-        img = pg.resource.image( f"{nom}.png" )
+            group = render.group(SPRITE_GROUP_FRUITS)
+        img = image( f"{nom}.png" )
         img.anchor_x = img.width // 2                 # anchor to the center of the image
         img.anchor_y = img.height // 2
         self._scale_ref = (2 * r / img.width,  2 * r / img.height)
 
-        super().__init__(img=img, 
-                         batch=batch(), 
-                         group=sprite_group(SPRITE_GROUP_FRUITS) )
+        super().__init__(render,
+                         img=img, 
+                         batch=render.batch, 
+                         group=group )
 
 
 class PreviewSprite( FruitSprite ):
     """ fruits en attente (non associé à un objet pymunk)
     """
-    def __init__(self, nom, width=PREVIEW_SPRITE_SIZE, refcnt=None ):
-        super().__init__(nom, r=width/2, group=sprite_group(SPRITE_GROUP_GUI) )
+    def __init__(self, render, nom, width=PREVIEW_SPRITE_SIZE, refcnt=None ):
+        super().__init__(render, nom, r=width/2, group=render.group(SPRITE_GROUP_GUI) )
 
     def update(self, x, y):
          super().update( x=x, y=y, rotation=0, on_animation_stop=None )
@@ -209,7 +307,7 @@ EXPLO_CENTRES = [
 
 
 def _make_sequence():
-    img = pg.resource.image(EXPLO_PNG)
+    img = image(EXPLO_PNG)
     seq = []
     for (x,y) in EXPLO_CENTRES:
         region = img.get_region( x=x-EXPLO_SIZE//2, y=y-EXPLO_SIZE//2, 
@@ -224,16 +322,24 @@ def _make_sequence():
 
 
 # global variable to avoid recreating the sequence with each explosion.
-_sequence_explosion = _make_sequence()
+# Preloaded, or loaded on first use: it needs a GL context
+_sequence_explosion = None
+
+def explosion_sequence():
+    global _sequence_explosion
+    if( _sequence_explosion is None ):
+        _sequence_explosion = _make_sequence()
+    return _sequence_explosion
 
 class ExplosionSprite( SuikaSprite ):
-    def __init__(self, r, on_explosion_end):
+    def __init__(self, render, r, on_explosion_end):
         # setup callback
         self._on_explosion_end = on_explosion_end
         # build actual sprite
-        super().__init__(img=_sequence_explosion,
-                         batch = batch(),
-                         group=sprite_group(SPRITE_GROUP_EXPLOSIONS))
+        super().__init__(render,
+                         img=explosion_sequence(),
+                         batch = render.batch,
+                         group=render.group(SPRITE_GROUP_EXPLOSIONS))
 
         scale = 2.5 * r / EXPLO_SIZE
         self._scale_ref = ( scale, scale )
@@ -242,4 +348,5 @@ class ExplosionSprite( SuikaSprite ):
     # Event sent by pyglet automatically
     def on_animation_end(self):
         # returns the event to the parent Fruit object
-        self._on_explosion_end()
\ No newline at end of file
+        if( self._on_explosion_end ):
+            self._on_explosion_end()
\ No newline at end of file
@@ -1,65 +1,22 @@
+import argparse, time
 import pyglet as pg
-import pymunk as pm
 import numpy as np
 
 from constants import *
-from bocal import Bocal
-from fruit import ActiveFruits
+from game import SuikaGame, Autoplayer
+import fruit
+import loader
 import gui
-from collision import CollisionHelper
 import utils
-from preview import FruitQueue
 import sprites
-from suika_agent import SuikaAgent
+import profiler
+import physics
+import rewind
+import replay
+import dataset
 from welcome_screen import WelcomeScreen
 
 
-class Autoplayer(object):
-    def __init__(self):
-        self.reset()
-
-    def reset(self):
-        self._rate = 0
-        self.disable()
-
-    def get_rate(self):
-        return self._rate
-
-    def enable(self):
-        if( not self._enabled ):
-            self._enabled = True
-            if( self._rate==0 ):
-                self._rate = AUTOPLAY_INITIAL_RATE
-
-    def disable(self):
-        self._time_debt = 0
-        self._enabled = False
-
-    def toggle(self):
-        if( not self._enabled ):
-             self.enable()
-        else:
-            self.disable()
-
-    def adjust_rate( self, adj ):
-        self._time_debt = 0
-        if( adj>0 and self._rate==0 ):
-            self._rate = AUTOPLAY_INITIAL_RATE
-        else:
-            self._rate = max( 0, self._rate+adj )
-        print(f"autoplayer rate = {self._rate} fruits/sec")
-
-    def step(self, dt):
-        # called each frame
-        # returns the number of fruits to drop on the current frame
-        if( not self._enabled or self._rate == 0 ):
-            return 0
-        t = self._time_debt + dt
-        nb = int( t * self._rate )
-        self._time_debt = t - nb/self._rate
-        return nb
-
-
 class MouseState(object):
     """
     Utility to track mouse state (position, buttons)
@@ -132,85 +89,146 @@ class MouseState(object):
 
 
 class SuikaWindow(pg.window.Window):
-    def __init__(self, width=WINDOW_WIDTH, height=WINDOW_HEIGHT):
+    def __init__(self, width=WINDOW_WIDTH, height=WINDOW_HEIGHT, profile_path=None, instant=False,
+                 preset=physics.DEFAULT_PRESET, spatial_hash=None, threads=1, record_path=None,
+                 dataset_path=None):
+        """ record_path: saves a replay of each game, '{game}' is replaced by the game number
+        dataset_path: directory where the AI transitions are streamed (dataset.py)
+        """
         # Initialize all attributes before creating window
-        self._is_gameover = False
-        self._is_paused = False
         self._autoplay_txt = ""
         self._is_mouse_shake = False
         self._is_benchmark_mode = False
-        self._dragged_fruit = None
+        self._rain_txt = ""
+        self._rewind_pos = None     # index of the snapshot shown while scrubbing, None when live
         self.game_started = False
+        self.welcome_screen = None
         
         # Initialize window
         super().__init__(width=width, height=height, resizable=True)
         
+        # Images and AI model are loaded in background, behind the welcome screen
+        self._ai_agent = None       # created, and its model loaded, by the loader or on first use
+        self._loader = loader.BackgroundLoader()
+        self._loader.add("model", work=self._load_agent, finish=self._set_agent)
+        images = [f"{fruit.name_from_kind(kind)}.png" for kind in range(1, fruit.nb_fruits() + 1)]
+        sprites.preload(self._loader, images + ["gameover.png"])
+        self._loader.on_ready = lambda: pg.clock.unschedule(self.loading_tick)
+        self._loader.start()
+        pg.clock.schedule_interval(self.loading_tick, interval=LOADER_INTERVAL)
+
         # Create welcome screen
-        self.welcome_screen = WelcomeScreen(width, height, self.start_game)
+        self.welcome_screen = WelcomeScreen(width, height, self.start_game, loader=self._loader)
         
-        # Initialize game objects
-        self._space = pm.Space()
-        self._space.gravity = (0, GRAVITY)
-        self._bocal = Bocal(space=self._space, **utils.bocal_coords(window_w=width, window_h=height))
-        self._preview = FruitQueue(cnt=PREVIEW_COUNT)
-        self._fruits = ActiveFruits(space=self._space, width=width, height=height)
-        self._countdown = utils.CountDown()
-        self._gui = gui.GUI(window_width=width, window_height=height)
-        self._collision_helper = CollisionHelper(self._space)
-        self._autoplayer = Autoplayer()
+        # Initialize display metrics
+        self.display_fps = utils.Speedmeter()
+        self.pymunk_fps = utils.Speedmeter(bufsize=int(3/PYMUNK_INTERVAL))
+        self._profiler = profiler.FrameProfiler()
+        if( profile_path ):
+            self._profiler.start_export( profile_path )
+
+        # Game objects: created by start_game(), once the images are loaded (their
+        # sprites would decode them on the main thread, behind the welcome screen)
+        self._game_options = dict(instant=instant, preset=preset, spatial_hash=spatial_hash, threads=threads)
+        self._render = None
+        self._game = None
+        self._gui = None
+        self._mouse_state = None
+        self._record_path = record_path
+        self._recorder = None
+        self._recorded_games = 0
         
         # AI agent setup
-        self.ai_agent = SuikaAgent()
         self.ai_enabled = False
         self.training_mode = False
         self.last_state = None
-        self.last_action = None
+        self.last_action = None     # index in the action space of the agent
+        self._last_ratio = None     # drop ratio of last_action across the jar, for the dataset
         self.cumulative_reward = 0
         self.episode = 0
+        self._dataset = None
+        self._last_obs = None       # observation of last_state, for the dataset
+        if( dataset_path ):
+            self._dataset = dataset.TransitionWriter( dataset_path, obs_shape=(OBS_MAX_FRUITS + 1, 3) )
         
-        # Initialize display metrics
-        self.display_fps = utils.Speedmeter()
-        self.pymunk_fps = utils.Speedmeter(bufsize=int(3/PYMUNK_INTERVAL))
+        # Set window properties
+        self.set_caption("Suika Game")
+        self.set_minimum_size(
+            width=2 * BOCAL_MARGIN_SIDE + BOCAL_MIN_WIDTH,
+            height=BOCAL_MARGIN_TOP + BOCAL_MARGIN_BOTTOM + BOCAL_MIN_HEIGHT
+        )
+
+    def _create_game(self):
+        """ Game, GUI, mouse handling and updates, on the first start_game()
+        """
+        width, height = self.get_size()
+        self._render = sprites.RenderContext()
+        self._game = SuikaGame(width=width, height=height, frame_profiler=self._profiler,
+                               render=self._render, **self._game_options)
+        self._game.on_gameover = self.on_gameover
+        self._game.rain.on_finished = self.on_rain_finished
+        self._rewind = rewind.RewindBuffer()
+        if( self._record_path ):
+            self._recorder = replay.ReplayRecorder(self._game, width, height)
+        self._gui = gui.GUI(self._render, window_width=width, window_height=height)
         
         # Initialize mouse handling
         self._mouse_state = MouseState(self)
         self._mouse_state.on_autofire_stop = self._autoplayer.disable
         
         # Schedule updates
-        pg.clock.schedule_interval(self.simulation_tick, interval=PYMUNK_INTERVAL)
+        pg.clock.schedule_interval(self.simulation_tick, interval=self._game.interval)
         pg.clock.schedule_interval(self.autoplay_tick, interval=AUTOPLAY_INTERVAL_BASE)
         pg.clock.schedule_interval(self.ai_tick, interval=0.5)
-        
-        # Set window properties
-        self.set_caption("Suika Game")
-        self.set_minimum_size(
-            width=2 * BOCAL_MARGIN_SIDE + BOCAL_MIN_WIDTH,
-            height=BOCAL_MARGIN_TOP + BOCAL_MARGIN_BOTTOM + BOCAL_MIN_HEIGHT
-        )
-        
-        # Reset game state
-        self.reset_game()
+
+    # shortcuts to the game elements
+    @property
+    def _bocal(self):           return self._game.bocal
+    @property
+    def _fruits(self):          return self._game.fruits
+    @property
+    def _preview(self):         return self._game.preview
+    @property
+    def _autoplayer(self):      return self._game.autoplayer
+    @property
+    def _is_gameover(self):     return self._game.is_gameover
+    @property
+    def _is_paused(self):       return self._game.is_paused
+
+    @property
+    def ai_agent(self):
+        if( self._ai_agent is None ):       # used before the loader got it
+            self._ai_agent = self._load_agent()
+        return self._ai_agent
+
+    def _load_agent(self):
+        from suika_agent import SuikaAgent      # deferred: unpickles the Q-table
+        return SuikaAgent()
+
+    def _set_agent(self, agent):
+        if( self._ai_agent is None ):
+            self._ai_agent = agent
+
+    def loading_tick(self, dt):
+        self._loader.poll()
 
     def reset_game(self):
-        self._is_gameover = False
-        self._is_paused = False
         self._autoplay_txt = ""
         self._is_mouse_shake = False
         self._is_benchmark_mode = False
-        self._dragged_fruit = None
-        self._bocal.reset()
-        self._preview.reset()
-        self._fruits.reset()
-        self._collision_helper.reset()
-        self._countdown.reset()
+        self._rewind_pos = None     # the snapshots are kept: a lost game can still be rewound
+        self.save_replay()
+        self._game.reset()
+        if( self._recorder ):
+            self._recorder.start()
         self._gui.reset()
-        self._autoplayer.reset()
         self._mouse_state.reset()
-        self.prepare_next()
 
     def start_game(self):
         """Called when user clicks start on welcome screen"""
         self.game_started = True
+        if( self._game is None ):
+            self._create_game()
         self.reset_game()
         print("\n=== Game Started! ===")
         print("Controls:")
@@ -220,52 +238,22 @@ class SuikaWindow(pg.window.Window):
         print("- T: Toggle training mode")
         print("- ESC: Quit game\n")
         
-        # Ensure the game is properly initialized
-        self._space.gravity = (0, GRAVITY)
-        self._bocal.reset()
-        self._preview.reset()
-        self._fruits.reset()
-        self._collision_helper.reset()
-        self._countdown.reset()
-        self._gui.reset()
-        self._autoplayer.reset()
-        self._mouse_state.reset()
-        self.prepare_next()
-        
         # Clear any existing welcome screen
-        if hasattr(self, 'welcome_screen'):
+        if self.welcome_screen is not None:
+            self.welcome_screen.delete()
             self.welcome_screen = None
 
     def toggle_benchmark_mode( self ):
-        pg.clock.unschedule( self.simulation_step )
+        pg.clock.unschedule( self.simulation_tick )
         self._is_benchmark_mode = not self._is_benchmark_mode
         if( self._is_benchmark_mode ):
-            pg.clock.schedule( self.simulation_step )
+            pg.clock.schedule( self.simulation_tick )
         else:
-            pg.clock.schedule_interval( self.simulation_step, interval=PYMUNK_INTERVAL )
-
-    def prepare_next(self):
-        kind = self._preview.get_next_fruit()
-        self._fruits.prepare_next( kind=kind )
+            pg.clock.schedule_interval( self.simulation_tick, interval=self._game.interval )
 
 
     def drop(self, cursor_x, nb=1):
-        for _ in range(nb):
-            next = self._fruits.peek_next()
-            if( not next ):
-                return
-            margin=next.radius + WALL_THICKNESS/2 + 1
-
-            # position of the mouse or random if x = None 
-            if( cursor_x is None ):
-                pos = self._bocal.drop_point_random( margin=margin )
-            else:
-                pos = self._bocal.drop_point_cursor( cursor_x, margin=margin )
-
-            if( not pos ):            # pos==None if click is outside container
-                return
-            self._fruits.drop_next(pos)
-            self.prepare_next()
+        self._game.drop(cursor_x, nb=nb)
 
 
     def autoplay_tick(self, dt):
@@ -282,9 +270,9 @@ class SuikaWindow(pg.window.Window):
                 self.drop(cursor_x=self._mouse_state.position[0], nb=nb) 
                 msg.append(f"AUTOFIRE")
         # autoplay ( drop on random location )
-        elif( self._autoplayer._enabled):
+        elif( self._autoplayer.enabled ):
             self.drop(nb=nb, cursor_x=None)
-            msg.append(f"AUTOPLAY")
+            msg.append("RAIN" if self._game.rain.running else "AUTOPLAY")
 
         # add autoplay/autofire rate only if active.
         if(len(msg)):
@@ -292,19 +280,77 @@ class SuikaWindow(pg.window.Window):
         self._autoplay_txt = ' '.join(msg)
 
 
+    def toggle_rain(self):
+        """ Starts or stops the fruit rain load test
+        """
+        rain = self._game.rain
+        if( rain.running ):
+            rain.stop()
+        else:
+            self._rain_txt = ""
+            rain.start()
+
+
+    def on_rain_finished(self):
+        report = self._game.rain.report()
+        print( report )
+        best = self._game.rain.best()
+        self._rain_txt = f"RAIN MAX {best['rate']} fruits/sec" if best else "RAIN OVER BUDGET"
+
+
     def gameover(self):
-        """ Actions in case of game over
+        """ Forces the game over
         """
-        print("GAMEOVER")
-        self._is_gameover = True    # inhibit game actions
-        self._autofire_on = False
-        self._fruits.gameover()
+        if( not self._is_gameover ):
+            self._game.gameover()
+
+
+    def on_gameover(self):
         self._gui.show_gameover()
 
 
     def toggle_pause(self):
-        assert( not self._is_gameover )
-        self._is_paused = not self._is_paused
+        self._game.toggle_pause()
+
+
+    def rewind(self, offset):
+        """ Scrubs the recent snapshots: offset snapshots back (<0) or forward (>0)
+        The game stays paused on the snapshot until resume().
+        """
+        if( len(self._rewind) == 0 ):
+            return
+        if( self._rewind_pos is None ):
+            self._rewind_pos = len(self._rewind)    # live, after the last snapshot
+        self._rewind_pos = min( max( self._rewind_pos + offset, 0 ), len(self._rewind) - 1 )
+        self._game.restore( self._rewind[self._rewind_pos] )
+        if( not self._is_paused ):
+            self._game.toggle_pause()
+        self._gui.reset()           # hides the game over screen
+        self._mouse_state.reset()
+
+
+    def resume(self):
+        """ Resumes the game from the snapshot shown, the later ones are dropped
+        """
+        if( self._rewind_pos is None ):
+            return
+        self._rewind.truncate( self._rewind_pos )
+        self._rewind_pos = None
+        if( self._recorder ):
+            self._recorder.truncate()   # the replay goes on from the restored board
+        if( self._is_paused ):
+            self._game.toggle_pause()
+
+
+    def save_replay(self):
+        """ Saves the replay of the current game, if recording and started
+        """
+        if( not self._recorder or self._recorder.saved or self._game.steps == 0 ):
+            return
+        self._recorded_games += 1
+        path = self._record_path.format( game=self._recorded_games )
+        self._recorder.save( path )
+        print( f"replay saved to {path}" )
 
 
     def set_mouse_shake( self, activate ):
@@ -314,38 +360,17 @@ class SuikaWindow(pg.window.Window):
     def fruit_drag_start(self):
         # pass the fruit under the mouse in DRAG_MODE
         cursor = self._mouse_state.position
-        self._dragged_fruit = self.find_fruit_at( *cursor )
-        if( self._dragged_fruit) :
-            self._dragged_fruit.drag_mode( cursor )   # set_mode
+        if( cursor ):
+            self._game.fruit_drag_start( cursor )
 
 
     def fruit_drag_stop(self):
-        if( self._dragged_fruit ):
-            self._dragged_fruit.drag_mode( None )   # set_mode
-            self._dragged_fruit = None
-
-
-    def find_fruit_at(self, x, y):
-        qi = self._space.point_query( (x, y), max_distance=0, shape_filter=pm.ShapeFilter() )
-        if( len(qi)==0 ):
-            return None
-        if( len(qi) > 1):
-            print("WARNING: Multiple overlapping fruits detected")
-        if( not hasattr( qi[0].shape, 'fruit' )):
-           return None     # shape is not a fruit (e.g. bocal)
-        return qi[0].shape.fruit
+        self._game.fruit_drag_stop()
 
 
     def shoot_fruit(self, x, y):
         print(f"right click x={x} y={y}")
-        f = self.find_fruit_at(x, y)
-        if( not self._is_gameover and f ):
-            f.explose()
-
-
-    def spawn_in_bocal(self, kind, bocal_coords):
-        position = self._bocal.to_world( bocal_coords )
-        self._fruits.spawn( kind, position )
+        self._game.shoot_fruit(x, y)
 
 
     def simulation_tick(self, dt):
@@ -353,88 +378,114 @@ class SuikaWindow(pg.window.Window):
         called by window.on_draw()
         """
         self.pymunk_fps.tick_rel(dt)
-        if( self._is_paused ):
-            return
-
-        # update bocal elements position
-        self._bocal.step(dt)
-        # update dragged fruit in DRAG_MODE
-        if( self._dragged_fruit ):
-            self._dragged_fruit.drag_to( self._mouse_state.position, dt)
-        # prepare collision handler
-        self._collision_helper.reset()
-        # execute 1 physics step
-        self._space.step( PYMUNK_INTERVAL )  
-
-        # modify fruits based on detected collisions
-        self._collision_helper.process( 
-            spawn_func=self.spawn_in_bocal, 
-            world_to_bocal_func=self._bocal.to_bocal )
-        # clean up
-        self._fruits.cleanup()
+        self._game.step(dt, cursor=self._mouse_state.position)
+        with self._profiler.phase(profiler.PHASE_REWIND):
+            self._rewind.record_step( self._game )
+        if( self._recorder ):
+            self._recorder.record_step()
 
 
-    def update(self):
-        # handle countdown in case of overflow
-        if( not self._bocal.is_tumbling):
-            ids = self._bocal.fruits_sur_maxline()
-            self._countdown.update( ids )
-
-        # update display and detect game end
-        countdown_val, countdown_txt = self._countdown.status()
-        if( countdown_val < 0 and not self._is_gameover ):
-            self.gameover()
+    def game_status(self):
+        """ Message of the top center label, also detects the game end
+        """
+        countdown_txt = self._game.update_countdown()
 
         # order of conditions defines message priority
         game_status = ""
-        if( True ):               game_status = self._autoplay_txt
+        if( True ):               game_status = self._rain_txt
+        if( self._autoplay_txt ): game_status = self._autoplay_txt
         if( countdown_txt ):      game_status = countdown_txt
         if( self._is_paused ):    game_status = "PAUSE"
         if( self._is_gameover ):  game_status = "GAME OVER"
+        if( self._rewind_pos is not None ):
+            age = self._rewind[-1].time - self._rewind[self._rewind_pos].time
+            game_status = f"REWIND -{age:.1f}s (ENTER resumes)"
+        return game_status
+
+
+    def update(self):
+        # update display and detect game end
+        game_status = self.game_status()
 
         # Update display with training stats if in training mode
+        # (the GUI skips unchanged values, a label relayout is costly)
         if self.training_mode:
-            self._gui.update_dict({
-                gui.TOP_LEFT: f"Score: {self._fruits._score}",
-                gui.TOP_RIGHT: f"FPS {self.pymunk_fps.value:.0f} / {self.display_fps.value:.0f}",
-                gui.TOP_CENTER: f"Epsilon: {self.ai_agent.epsilon:.3f} | Best: {self.ai_agent.best_score} | Ep: {self.episode}"
-            })
+            self._gui.update_label(gui.TOP_LEFT, "Score:")
+            self._gui.update_training_stats(self.ai_agent.epsilon, self.ai_agent.best_score, self.episode)
         else:
             self._gui.update_dict({
-                gui.TOP_LEFT: f"score {self._fruits._score}",
-                gui.TOP_RIGHT: f"FPS {self.pymunk_fps.value:.0f} / {self.display_fps.value:.0f}",
+                gui.TOP_LEFT: "score",
                 gui.TOP_CENTER: game_status
             })
+        self._gui.update_score(self._fruits._score)
+        self._gui.update_label(gui.TOP_RIGHT, "FPS")
+        self._gui.update_fps(self.pymunk_fps, self.display_fps)
+        self._gui.update_profiler(self._profiler)
+
+
+    def close_dataset(self):
+        if( self._dataset ):
+            self._dataset.close()
+            print( f"dataset: {self._dataset.written} transitions written" )
+            self._dataset = None
 
 
     def end_application(self):
         # TODO : release resources more cleanly
+        self.save_replay()
+        self.close_dataset()
+        self._profiler.stop_export()
         self.close()
 
 
+    def on_close(self):
+        self.save_replay()
+        self.close_dataset()
+        self._profiler.stop_export()
+        super().on_close()
+
+
     def on_draw(self):
         self.clear()
         if not self.game_started:
             self.welcome_screen.draw()
         else:
-            # Update game objects
-            self._fruits.update()
-            self._preview.update()
-            self._bocal.update()
-            self.update()
-
-            # Draw game
-            sprites.batch().draw()
+            prof = self._profiler
+            t0 = time.perf_counter()
+            with prof.phase(profiler.PHASE_FRAME):
+                # Update game objects
+                with prof.phase(profiler.PHASE_FRUITS):
+                    self._fruits.update()
+                with prof.phase(profiler.PHASE_PREVIEW):
+                    self._preview.update()
+                with prof.phase(profiler.PHASE_WALLS):
+                    self._bocal.update()
+                with prof.phase(profiler.PHASE_GUI):
+                    self.update()
+
+                # Draw game
+                with prof.phase(profiler.PHASE_DRAW):
+                    self._render.draw()
+            self._game.rain.record_frame( time.perf_counter() - t0 )
+            prof.end_frame()
             self.display_fps.tick()
 
 
     def on_key_press(self, symbol, modifiers):
         if symbol == pg.window.key.ESCAPE:         # ESC closes the game in all cases
             self.end_application()
+        elif not self.game_started:                # welcome screen
+            return
         elif symbol == pg.window.key.I:            # 'I' for AI
             self.toggle_ai()
         elif symbol == pg.window.key.T:            # 'T' for training mode
             self.toggle_training()
+        elif symbol == pg.window.key.LEFT:         # scrub back the recent snapshots, SHIFT: faster
+            self.rewind( -REWIND_SCRUB_FAST if modifiers & pg.window.key.MOD_SHIFT else -1 )
+        elif symbol == pg.window.key.RIGHT:        # scrub forward
+            self.rewind( REWIND_SCRUB_FAST if modifiers & pg.window.key.MOD_SHIFT else 1 )
+        elif symbol == pg.window.key.ENTER:        # resume from the snapshot shown
+            self.resume()
         elif not self.ai_enabled:  # Only allow these controls when AI is disabled
             if symbol == pg.window.key.R:          # Reset game
                 self.reset_game()
@@ -448,13 +499,22 @@ class SuikaWindow(pg.window.Window):
             elif symbol == pg.window.key.M:        # move a fruit to the mouse
                 self.fruit_drag_start()
             elif symbol == pg.window.key.P:        # P pauses the game
-                self.toggle_pause()
+                if( self._rewind_pos is not None ):
+                    self.resume()
+                else:
+                    self.toggle_pause()
             elif symbol == pg.window.key.G:        # G forces a gameover in progress
                 self.gameover()
             elif symbol == pg.window.key.B:        # Benchmark mode
                 self.toggle_benchmark_mode()
+            elif symbol == pg.window.key.F:        # Frame profiler overlay
+                self._gui.toggle_profiler()
+            elif symbol == pg.window.key.L:        # Load test: fruit rain with a rising rate
+                self.toggle_rain()
 
     def on_key_release(self, symbol, modifiers):
+        if not self.game_started:
+            return
         if(symbol == pg.window.key.SPACE):          # stop manual shaking
             self._bocal.shake_stop()
             self.pop_handlers()
@@ -479,20 +539,20 @@ class SuikaWindow(pg.window.Window):
 
     def on_mouse_scroll(self, x, y, scroll_x, scroll_y):
         #print(f"on_mouse_scroll(x={x} y={y} scroll_x={scroll_x} scroll_y={scroll_y}    => lvl={self._autoplay_level}")
+        if not self.game_started:
+            return
         self._autoplayer.adjust_rate(scroll_y)
 
 
     def on_resize(self, width, height):
         """Handle window resize events"""
-        if hasattr(self, '_bocal'):  # Check if _bocal exists before using it
-            self._bocal.on_resize(**utils.bocal_coords(window_w=width, window_h=height))
-            self._fruits.on_resize(width, height)
-            self._preview.on_resize(width, height)
+        if self._game:  # created by start_game()
+            self._game.on_resize(width, height)
             self._gui.on_resize(width, height)
         
         # Update welcome screen if it exists
-        if hasattr(self, 'welcome_screen'):
-            self.welcome_screen = WelcomeScreen(width, height, self.start_game)
+        if self.welcome_screen is not None:
+            self.welcome_screen.on_resize(width, height)
             
         # Update window
         super().on_resize(width, height)
@@ -572,6 +632,11 @@ class SuikaWindow(pg.window.Window):
 
         # If game is over, handle based on mode
         if self._is_gameover:
+            # terminal transition of the dataset, before the reset
+            if self._dataset and self._last_obs is not None:
+                self._dataset.add(self._last_obs, self._last_ratio, self.get_reward(),
+                                  self._game.observation(), True, self._fruits._score)
+                self._last_obs = None
             if self.training_mode:
                 # Update training statistics
                 self.ai_agent.update_training_stats(self.episode, self._fruits._score, self.cumulative_reward)
@@ -584,11 +649,14 @@ class SuikaWindow(pg.window.Window):
                 self.reset_game()
 
         current_state = self.get_game_state()
+        obs = self._game.observation() if self._dataset else None
         
         # Get reward for previous action
         if self.last_state is not None:
             reward = self.get_reward()
             self.cumulative_reward += reward
+            if self._dataset and self._last_obs is not None:
+                self._dataset.add(self._last_obs, self._last_ratio, reward, obs, False, self._fruits._score)
             
             # Train the agent only in training mode
             if self.training_mode:
@@ -600,20 +668,39 @@ class SuikaWindow(pg.window.Window):
                     self._is_gameover
                 )
 
-        # Get new action from agent
-        action = self.ai_agent.get_action(current_state, self.width)
+        # Get new action from agent: a drop position of the jar, valid for the next fruit
+        action = self.ai_agent.get_action(current_state)
         
         # Execute action
-        self.drop(action)
+        ratio = self._game.drop_action(action, self.ai_agent.action_size)
         
         # Save state and action
         self.last_state = current_state
         self.last_action = action
+        self._last_ratio = np.nan if ratio is None else ratio
+        self._last_obs = obs
 
 def main():
-    pg.resource.path = ['assets/']
-    pg.resource.reindex()
-    window = SuikaWindow()
+    parser = argparse.ArgumentParser(description="Suika Game")
+    parser.add_argument('--profile', metavar='FILE', default=None,
+                        help="stream per-frame phase timings to a JSONL file")
+    parser.add_argument('--instant', action='store_true',
+                        help="instant rules: no merge, spawn or game over animations (training)")
+    parser.add_argument('--physics', choices=list(physics.PRESETS), default=physics.DEFAULT_PRESET,
+                        help="physics quality preset")
+    parser.add_argument('--spatial-hash', action='store_true', default=None,
+                        help="spatial hash broadphase, for crowded boards")
+    parser.add_argument('--threads', type=int, default=1,
+                        help=f"pymunk solver threads (max {physics.THREADS_MAX}, 0 = only on crowded boards)")
+    parser.add_argument('--record', metavar='FILE', default=None,
+                        help="save a replay of each game (.npz, '{game}' in the name numbers them)")
+    parser.add_argument('--dataset', metavar='DIR', default=None,
+                        help="stream the AI transitions to .npy shards, for offline training")
+    args = parser.parse_args()
+
+    window = SuikaWindow(profile_path=args.profile, instant=args.instant, preset=args.physics,
+                         spatial_hash=args.spatial_hash, threads=args.threads, record_path=args.record,
+                         dataset_path=args.dataset)
     pg.app.run()
 
 if __name__ == '__main__':
@@ -1,12 +1,64 @@
 import numpy as np
 import random
-from collections import defaultdict
 import pickle
 import os
-from constants import WINDOW_WIDTH
+
+class QTable:
+    """Q-values of the states as rows of one dense array, so that a batch of rows is one gather.
+    Used as the defaultdict it replaces: a missing state gets a row of zeros.
+    The rows returned are views of the array, valid until it grows."""
+    def __init__(self, action_size, rows=None):
+        self.action_size = action_size
+        self._index = {}  # state: row
+        self._values = np.zeros((64, action_size))
+        for key, row in (rows or {}).items():
+            self[key] = row
+
+    def _add(self, key):
+        i = len(self._index)
+        if i == len(self._values):
+            self._values = np.concatenate([self._values, np.zeros_like(self._values)])
+        self._index[key] = i
+        return i
+
+    def __getitem__(self, key):
+        i = self._index.get(key)
+        if i is None:
+            i = self._add(key)
+        return self._values[i]
+
+    def __setitem__(self, key, row):
+        i = self._index.get(key)
+        if i is None:
+            i = self._add(key)
+        self._values[i] = row
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def keys(self):
+        return self._index.keys()
+
+    def gather(self, keys):
+        """Copy of the rows of the keys (len(keys), action_size), zeros for unknown keys (not added)"""
+        index = self._index
+        rows = np.fromiter((index.get(key, -1) for key in keys), dtype=np.intp, count=len(keys))
+        values = self._values[rows]
+        values[rows < 0] = 0
+        return values
+
+    def to_dict(self):
+        return {key: self._values[i].copy() for key, i in self._index.items()}
 
 class SuikaAgent:
-    def __init__(self, state_size=10, action_size=10, learning_rate=0.2, discount_factor=0.99, epsilon=1.0):
+    def __init__(self, state_size=10, action_size=10, learning_rate=0.2, discount_factor=0.99, epsilon=1.0,
+                 model_file="suika_agent.pkl"):
         self.state_size = state_size  # Number of grid cells for discretization
         self.action_size = action_size  # Number of possible drop positions
         self.lr = learning_rate
@@ -14,8 +66,9 @@ class SuikaAgent:
         self.epsilon = epsilon  # Exploration rate
         self.epsilon_min = 0.01
         self.epsilon_decay = 0.997  # Slower decay for more exploration
-        self.q_table = defaultdict(lambda: np.zeros(action_size))
-        self.model_file = "suika_agent.pkl"
+        self.q_table = QTable(action_size)
+        self._rng = np.random.default_rng()  # exploration of get_actions()
+        self.model_file = model_file  # None: no model file, the table comes from elsewhere (distributed actors)
         
         # Training statistics
         self.training_scores = []
@@ -43,16 +96,32 @@ class SuikaAgent:
             state.append((x, y, kind, velocity))
         return tuple(sorted(state))  # Sort to ensure same state gives same hash
 
-    def get_action(self, state, available_width):
-        """Choose action using epsilon-greedy policy"""
+    def observation_state(self, obs):
+        """Same representation from a SuikaGame.observation() array (no velocity in it)"""
+        fruits = obs[1:][obs[1:, 2] > 0]
+        cells = (fruits[:, :2] * self.state_size).astype(int)
+        kinds = fruits[:, 2].astype(int)
+        return tuple(sorted(zip(cells[:, 0].tolist(), cells[:, 1].tolist(), kinds.tolist(), [0] * len(kinds))))
+
+    def get_action(self, state):
+        """Choose action using epsilon-greedy policy
+        Actions are indices of the drop positions of SuikaGame.action_space(action_size)"""
         if random.random() < self.epsilon:
             # Exploration: choose random action
-            return random.random() * available_width
+            return random.randrange(self.action_size)
         else:
             # Exploitation: choose best action
             discretized_state = self.discretize_state(state)
             actions = self.q_table[discretized_state]
-            return (np.argmax(actions) / self.action_size) * available_width
+            return int(np.argmax(actions))
+
+    def get_actions(self, states):
+        """Batched get_action: actions (array) of many states, one gather of their Q rows"""
+        n = len(states)
+        q_values = self.q_table.gather([self.discretize_state(state) for state in states])
+        best = np.argmax(q_values, axis=1)
+        explore = self._rng.random(n) < self.epsilon
+        return np.where(explore, self._rng.integers(0, self.action_size, n), best)
 
     def discretize_state(self, state):
         """Convert continuous state to discrete state for Q-table"""
@@ -68,9 +137,7 @@ class SuikaAgent:
         disc_state = self.discretize_state(state)
         disc_next_state = self.discretize_state(next_state)
         
-        # Discretize action
-        disc_action = int((action * self.action_size) / WINDOW_WIDTH)
-        disc_action = min(disc_action, self.action_size - 1)  # Ensure action is within bounds
+        disc_action = min(int(action), self.action_size - 1)  # Ensure action is within bounds
         
         # Q-learning update
         old_value = self.q_table[disc_state][disc_action]
@@ -109,8 +176,10 @@ class SuikaAgent:
 
     def save_model(self):
         """Save Q-table and training stats to file"""
+        if not self.model_file:
+            return
         save_data = {
-            'q_table': dict(self.q_table),
+            'q_table': self.q_table.to_dict(),
             'episode_scores': self.episode_scores,
             'episode_rewards': self.episode_rewards,
             'best_score': self.best_score,
@@ -124,10 +193,10 @@ class SuikaAgent:
 
     def load_model(self):
         """Load Q-table and training stats from file if it exists"""
-        if os.path.exists(self.model_file):
+        if self.model_file and os.path.exists(self.model_file):
             with open(self.model_file, 'rb') as f:
                 save_data = pickle.load(f)
-                self.q_table = defaultdict(lambda: np.zeros(self.action_size), save_data['q_table'])
+                self.q_table = QTable(self.action_size, save_data['q_table'])
                 self.episode_scores = save_data.get('episode_scores', [])
                 self.episode_rewards = save_data.get('episode_rewards', [])
                 self.best_score = 0  # Reset best score to 0 each time
@@ -0,0 +1,71 @@
+import numpy as np
+import pymunk as pm
+import pytest
+
+from constants import *
+from action_space import ActionSpace, drop_margin
+from bocal import Bocal
+import fruit
+
+SIZE = 10
+KINDS = range( 1, len( fruit._KIND_RADIUS ) )
+
+
+@pytest.fixture( scope='module' )
+def space():
+    return ActionSpace( SIZE )
+
+
+@pytest.mark.parametrize( "kind", KINDS )
+def test_ratio_bounds(space, kind):
+    """ The actions span the dropline without letting the fruit touch a wall
+    """
+    radius = fruit._KIND_RADIUS[kind]
+    ratios = np.array( [ space.ratio( a, kind ) for a in range( SIZE ) ] )
+    x = ratios * space.bocal_width
+    assert( np.all( np.diff( ratios ) > 0 ) )
+    assert( x[0] == pytest.approx( drop_margin( radius ) ) )
+    assert( x[-1] == pytest.approx( space.bocal_width - drop_margin( radius ) ) )
+    assert( np.all( x - radius > WALL_THICKNESS / 2 ) )
+    assert( np.all( x + radius < space.bocal_width - WALL_THICKNESS / 2 ) )
+
+
+@pytest.mark.parametrize( "kind", KINDS )
+def test_action_inverse(space, kind):
+    for a in range( SIZE ):
+        assert( space.action( space.ratio( a, kind ), kind ) == a )
+    assert( space.action( 0.0, kind ) == 0 )
+    assert( space.action( -1.0, kind ) == 0 )
+    assert( space.action( 1.0, kind ) == SIZE - 1 )
+    assert( space.action( 2.0, kind ) == SIZE - 1 )
+
+
+def test_batched(space):
+    kinds = np.array( [ k for k in KINDS for _ in range( SIZE ) ] )
+    actions = np.tile( np.arange( SIZE ), len( KINDS ) )
+    ratios = space.ratios( actions, kinds )
+    assert( list( ratios ) == [ space.ratio( a, k ) for a, k in zip( actions, kinds ) ] )
+    np.testing.assert_array_equal( space.actions( ratios, kinds ), actions )
+
+
+@pytest.mark.parametrize( "kind", KINDS )
+def test_drops_not_clamped(space, kind):
+    """ The jar drops every action where ActionSpace says, without moving it away from the walls
+    """
+    bocal = Bocal( pm.Space(), center=( 0, 0 ), bocal_w=space.bocal_width, bocal_h=800 )
+    margin = drop_margin( fruit._KIND_RADIUS[kind] )
+    for a in range( SIZE ):
+        r = space.ratio( a, kind )
+        assert( bocal.drop_point_ratio( r, margin=margin ).x == pytest.approx( bocal.drop_point_ratio( r, margin=0 ).x ) )
+
+
+def test_no_fruit_kind(space):
+    assert( space.ratio( 0, 0 ) == pytest.approx( drop_margin( 0 ) / space.bocal_width ) )
+
+
+@pytest.mark.parametrize( "size", [ 1, 2 ] )
+def test_small_spaces(size):
+    space = ActionSpace( size, bocal_width=2 * drop_margin( max( fruit._KIND_RADIUS ) ) + 10 )
+    for kind in KINDS:
+        assert( space.action( space.ratio( size - 1, kind ), kind ) == size - 1 )
+        assert( 0 < space.ratio( 0, kind ) < 1 )
@@ -0,0 +1,75 @@
+import os
+import numpy as np
+import pytest
+
+import dataset
+
+OBS_SHAPE = (4, 3)
+
+
+def transitions(n, first=0):
+    """ Transitions whose fields are all derived from their index
+    """
+    for i in range( first, first + n ):
+        obs = np.full( OBS_SHAPE, i, dtype=np.float32 )
+        yield obs, i / 100, -i, obs + 1, i % 7 == 0, 10 * i
+
+
+def write(directory, n, first=0, shard_size=4):
+    writer = dataset.TransitionWriter( str(directory), OBS_SHAPE, shard_size=shard_size, queue_shards=1 )
+    for t in transitions( n, first ):
+        writer.add( *t )
+    writer.close()
+    return writer
+
+
+def check(batch):
+    """ Every transition of a batch is consistent with its index
+    """
+    i = batch['score'] // 10
+    np.testing.assert_array_equal( batch['obs'], np.broadcast_to( i[:, None, None], batch['obs'].shape ) )
+    np.testing.assert_array_equal( batch['next_obs'], batch['obs'] + 1 )
+    np.testing.assert_allclose( batch['action'], i / 100, rtol=1e-6 )
+    np.testing.assert_array_equal( batch['reward'], -i )
+    np.testing.assert_array_equal( batch['done'], i % 7 == 0 )
+
+
+def test_shard_files(tmp_path):
+    writer = write( tmp_path, 10 )
+    assert( writer.written == 10 )
+    names = sorted( os.listdir( tmp_path ) )
+    assert( names == sorted( f"shard_{k:05d}.{field}.npy" for k in range(3) for field in dataset.FIELDS ) )
+    for field, dtype in ( ('obs', np.float32), ('action', np.float32), ('reward', np.float32),
+                          ('done', np.bool_), ('score', np.int32) ):
+        assert( np.load( tmp_path / f"shard_00000.{field}.npy" ).dtype == dtype )
+    assert( np.load( tmp_path / "shard_00000.obs.npy" ).shape == (4,) + OBS_SHAPE )
+    assert( len( np.load( tmp_path / "shard_00002.done.npy" ) ) == 2 )     # last, partial shard
+
+
+def test_read_back(tmp_path):
+    write( tmp_path, 10 )
+    reader = dataset.TransitionReader( str(tmp_path) )
+    assert( len(reader) == 10 )
+    assert( reader.shards == 3 )
+    scores = np.concatenate( [ s['score'] for s in reader._shards ] )
+    np.testing.assert_array_equal( scores, 10 * np.arange(10) )
+    for _ in range(20):
+        check( reader.sample(3) )
+    out = None
+    for _ in range(20):
+        out = reader.gather( 3, out )
+        check( out )
+
+
+def test_append(tmp_path):
+    write( tmp_path, 8 )
+    write( tmp_path, 3, first=8 )       # new shards after the existing ones
+    reader = dataset.TransitionReader( str(tmp_path) )
+    assert( len(reader) == 11 )
+    assert( reader.shards == 3 )
+    np.testing.assert_array_equal( reader._shards[2]['score'], [80, 90, 100] )
+
+
+def test_empty_directory(tmp_path):
+    with pytest.raises( FileNotFoundError ):
+        dataset.TransitionReader( str(tmp_path) )
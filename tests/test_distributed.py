@@ -0,0 +1,65 @@
+import random
+import numpy as np
+
+import distributed
+from suika_agent import SuikaAgent
+
+ACTIONS = 5
+
+
+def random_state(rng):
+    return [ (rng.randrange(4), rng.randrange(4), rng.randrange(1, 4), 0) for _ in range( rng.randrange(3) ) ]
+
+
+def sync(learner, actor, table):
+    """ Applies the update of an actor at version to its table, returns its new version
+    """
+    learner._acked[actor] = table['version']
+    body = learner.update( table['version'] )[distributed.protocol.LENGTH.size:]
+    version, _, keys, values = distributed.decode_update( body )
+    for key, row in zip( keys, values ):
+        table['rows'][key] = row
+    table['version'] = version
+
+
+def check(learner, table):
+    """ The actor has every published row of the learner
+    """
+    q_table = learner.agent.q_table
+    for key in q_table:
+        if( key not in learner._dirty ):
+            expected = np.asarray( q_table[key], dtype=np.float32 )
+            np.testing.assert_array_equal( table['rows'].get( key, np.zeros( ACTIONS, np.float32 ) ), expected )
+
+
+def test_updates_match_table():
+    """ Actors syncing at random versions, some of them reconnecting, against the learner table
+    """
+    rng = random.Random(3)
+    agent = SuikaAgent( action_size=ACTIONS, model_file=None )
+    agent.q_table[(0,)] = np.arange( ACTIONS )          # rows before the learner starts
+    learner = distributed.Learner( agent )
+    actors = { name: { 'version': 0, 'rows': {} } for name in 'abc' }
+    for _ in range( 500 ):
+        op = rng.randrange(6)
+        if( op < 3 ):
+            n = rng.randrange( 1, 10 )
+            states = [ random_state(rng) for _ in range(n) ]
+            learner.train( [ agent.discretize_state(s) for s in states ], [ rng.randrange(ACTIONS) for _ in range(n) ],
+                           [ rng.uniform(0, 5) for _ in range(n) ],
+                           [ agent.discretize_state( random_state(rng) ) for _ in range(n) ], [ False ] * n, [ 0 ] * n )
+        elif( op == 3 ):
+            learner.publish()
+        elif( op == 4 ):
+            name = rng.choice( 'abc' )
+            sync( learner, name, actors[name] )
+            check( learner, actors[name] )
+        else:
+            name = rng.choice( 'abc' )          # new actor process in place of this one
+            learner._acked.pop( name, None )
+            actors[name] = { 'version': 0, 'rows': {} }
+    assert( learner._base > 0 )
+    assert( sorted( learner._changes ) == list( range( learner._base + 1, learner.version + 1 ) ) )
+    for name, table in actors.items():
+        sync( learner, name, table )
+        check( learner, table )
@@ -0,0 +1,85 @@
+import socket
+import numpy as np
+import pytest
+
+import protocol
+from protocol import ProtocolError
+
+
+def body(frame):
+    """ Body of a frame, after checking its length prefix
+    """
+    size, = protocol.LENGTH.unpack_from( frame )
+    assert( size == len(frame) - protocol.LENGTH.size )
+    return frame[protocol.LENGTH.size:]
+
+
+@pytest.mark.parametrize( "op, args", [
+    ( protocol.OP_NEW, (1,) ),
+    ( protocol.OP_RESET, (-1,) ),
+    ( protocol.OP_RESET, (2**40,) ),
+    ( protocol.OP_OBSERVE, () ),
+    ( protocol.OP_DROP, (0.25,) ),
+    ( protocol.OP_STEP, (7,) ),
+    ( protocol.OP_SETTLE, (0,) ),
+    ( protocol.OP_DELETE, () ),
+])
+def test_request_round_trip(op, args):
+    assert( protocol.decode_request( body( protocol.encode_request( op, 513, *args ) ) ) == ( op, 513, args ) )
+
+
+def test_request_errors():
+    with pytest.raises( ProtocolError, match="truncated" ):
+        protocol.decode_request( b'\x01' )
+    with pytest.raises( ProtocolError, match="unknown opcode 99" ):
+        protocol.decode_request( protocol.HEADER.pack( 99, 0 ) )
+    request = body( protocol.encode_request( protocol.OP_DROP, 0, 0.5 ) )
+    with pytest.raises( ProtocolError, match="bad request length" ):
+        protocol.decode_request( request[:-1] )
+    with pytest.raises( ProtocolError, match="bad request length" ):
+        protocol.decode_request( request + b'\x00' )
+
+
+def test_reply_round_trip():
+    result = protocol.STATE.pack( 120, 3000, 14, True )
+    state = protocol.decode_state( protocol.decode_reply( body( protocol.encode_reply( result ) ) ) )
+    assert( state == protocol.State( score=120, steps=3000, fruits=14, gameover=True ) )
+    assert( bytes( protocol.decode_reply( body( protocol.encode_reply() ) ) ) == b'' )
+
+
+def test_error_frame():
+    frame = protocol.encode_error( "no game 4" )
+    assert( body(frame)[0] == protocol.STATUS_ERROR )
+    with pytest.raises( ProtocolError, match="^no game 4$" ):
+        protocol.decode_reply( body(frame) )
+    with pytest.raises( ProtocolError, match="empty reply" ):
+        protocol.decode_reply( b'' )
+
+
+def test_observation_round_trip():
+    obs = np.arange( np.prod( protocol.OBS_SHAPE ), dtype=np.float32 ).reshape( protocol.OBS_SHAPE )
+    result = protocol.decode_reply( body( protocol.encode_reply( protocol.STATE.pack( 5, 6, 7, False ) + obs.tobytes() ) ) )
+    state, decoded = protocol.decode_observation( result )
+    assert( state == protocol.State( 5, 6, 7, False ) )
+    np.testing.assert_array_equal( decoded, obs )
+
+
+def test_recv_frame():
+    a, b = socket.socketpair()
+    with a, b:
+        frames = [ protocol.encode_request( protocol.OP_STEP, 1, 10 ), protocol.encode_error( "x" * 5000 ) ]
+        a.sendall( b''.join( frames ) )
+        assert( protocol.recv_frame( b ) == body( frames[0] ) )
+        assert( protocol.recv_frame( b ) == body( frames[1] ) )
+        a.sendall( protocol.frame( b'0123456789' ) )
+        with pytest.raises( ProtocolError, match="frame of 10 bytes" ):
+            protocol.recv_frame( b, max_size=8 )
+
+
+def test_recv_frame_closed():
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall( protocol.encode_request( protocol.OP_STEP, 1, 10 )[:-2] )
+        a.close()
+        with pytest.raises( ConnectionError ):
+            protocol.recv_frame( b )
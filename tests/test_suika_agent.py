@@ -0,0 +1,75 @@
+import collections, random
+import numpy as np
+
+from suika_agent import QTable, SuikaAgent
+
+ACTIONS = 5
+
+
+def random_key(rng):
+    return tuple(rng.randrange(30) for _ in range(rng.randrange(1, 3)))
+
+
+def test_qtable_matches_dict():
+    """Random reads, writes and gathers against a defaultdict of rows, past several growths"""
+    rng = random.Random(1)
+    table = QTable(ACTIONS)
+    reference = collections.defaultdict(lambda: np.zeros(ACTIONS))
+    for _ in range(3000):
+        key = random_key(rng)
+        op = rng.randrange(4)
+        if op == 0:
+            np.testing.assert_array_equal(table[key], reference[key])
+        elif op == 1:
+            row = np.array([rng.uniform(-1, 1) for _ in range(ACTIONS)])
+            table[key] = row
+            reference[key] = row.copy()
+        elif op == 2:
+            action = rng.randrange(ACTIONS)
+            value = rng.uniform(-1, 1)
+            table[key][action] = value      # in-place update of a row, as SuikaAgent.train
+            reference[key][action] = value
+        else:
+            keys = [random_key(rng) for _ in range(rng.randrange(1, 20))]
+            expected = [reference[k] if k in reference else np.zeros(ACTIONS) for k in keys]
+            count = len(table)
+            np.testing.assert_array_equal(table.gather(keys), np.array(expected))
+            assert len(table) == count    # unknown keys are not added
+    assert len(table) > 64
+    assert set(table) == set(reference)
+    assert all(k in table for k in reference)
+    rows = table.to_dict()
+    for key, row in reference.items():
+        np.testing.assert_array_equal(rows[key], row)
+    copy = QTable(ACTIONS, rows)
+    np.testing.assert_array_equal(copy.gather(list(reference)), table.gather(list(reference)))
+
+
+def test_gather_copies():
+    table = QTable(ACTIONS)
+    table[(1,)] = np.arange(ACTIONS)
+    rows = table.gather([(1,), (2,)])
+    rows[:] = -1
+    np.testing.assert_array_equal(table[(1,)], np.arange(ACTIONS))
+    assert (2,) not in table
+
+
+def test_train_matches_dict():
+    """Q-learning updates of SuikaAgent against the same updates on a dict"""
+    rng = random.Random(2)
+    agent = SuikaAgent(action_size=ACTIONS, model_file=None)
+    reference = collections.defaultdict(lambda: np.zeros(ACTIONS))
+    states = [[(rng.randrange(10), rng.randrange(10), rng.randrange(1, 6), 0) for _ in range(rng.randrange(3))]
+              for _ in range(40)]
+    for _ in range(2000):
+        state, next_state = rng.choice(states), rng.choice(states)
+        action, reward = rng.randrange(ACTIONS), rng.uniform(0, 10)
+        agent.train(state, action, reward, next_state, False)
+        key, next_key = agent.discretize_state(state), agent.discretize_state(next_state)
+        target = reward + agent.gamma * np.max(reference[next_key])
+        reference[key][action] = (1 - agent.lr) * reference[key][action] + agent.lr * target
+    for key, row in reference.items():
+        np.testing.assert_allclose(agent.q_table[key], row)
+    agent.epsilon = 0
+    actions = agent.get_actions(states)
+    assert list(actions) == [agent.get_action(state) for state in states]
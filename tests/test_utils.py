@@ -0,0 +1,26 @@
+import utils
+from constants import *
+
+
+class Clock(object):
+    """ Simulated clock, starting at 0.0 as the sim_clock of the games
+    """
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def test_countdown_from_clock_zero():
+    clock = Clock()
+    countdown = utils.CountDown( clock=clock )
+    assert( countdown.elapsed() is None )
+    assert( countdown.status() == (0, "") )
+    countdown.update( True )
+    clock.t = 1.0
+    countdown.update( True )        # still in progress: does not restart
+    assert( countdown.elapsed() == 1.0 )
+    assert( countdown.status()[0] == GAMEOVER_DELAY - 1.0 )
+    countdown.update( False )
+    assert( countdown.elapsed() is None )
@@ -1,9 +1,12 @@
-import time, collections
-import pyglet as pg
+import sys, time, collections
 from constants import *
 
 def now():
-    return pg.clock.get_default().time()
+    """ Time of the pyglet default clock, or of time.perf_counter (its default time
+    function) as long as pyglet is not loaded: the rules run without pyglet
+    """
+    clock = sys.modules.get('pyglet.clock')
+    return clock.get_default().time() if clock else time.perf_counter()
 
 DEFAULT_BUFSIZE = 200
 SPEEDMETER_UPDATE_RATE = 0.2   #  seconds
@@ -38,13 +41,16 @@ class Speedmeter(object):
 
 
 class CountDown(object):
-    def __init__(self):
+    def __init__(self, clock=None):
+        """ clock: time function, now() if None
+        """
+        self._clock = clock if clock else now
         self._start_time = None
 
     def update(self, deborde):
-        if( deborde and not self._start_time ):
+        if( deborde and self._start_time is None ):
             #print( "countdown start")
-            self._start_time = now()  # does not reset if already in progress
+            self._start_time = self._clock()  # does not reset if already in progress
         elif( not deborde ):
             #if( self._start_time ):
             #    print( "countdown stop")
@@ -53,15 +59,23 @@ class CountDown(object):
     def reset(self):
         self.update( False )
 
+    def elapsed(self):
+        """ Time since the countdown start, None if not running
+        """
+        return self._clock() - self._start_time if self._start_time is not None else None
+
+    def set_elapsed(self, elapsed):
+        self._start_time = self._clock() - elapsed if elapsed is not None else None
+
     def status(self):
         """ Returns a tuple (t, text)
             val: Countdown value at the time of the status() call
             txt: Countdown info message
         """
-        if (not self._start_time):
+        if( self._start_time is None ):
             return (0, "")
 
-        t = self._start_time + GAMEOVER_DELAY - now()
+        t = self._start_time + GAMEOVER_DELAY - self._clock()
         text = ""
         if( t <  COUNTDOWN_DISPLAY_LIMIT ):
             text = f"Defeat in {t:.01f}s"
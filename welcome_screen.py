@@ -3,53 +3,45 @@ from pyglet import shapes
 from pyglet.text import Label
 import math
 
+import sprites
+
 class WelcomeScreen:
-    def __init__(self, width, height, on_start):
+    def __init__(self, width, height, on_start, loader=None):
+        """ loader: loader.BackgroundLoader of the images and model, the start
+        button is enabled when it is ready
+        """
         self.width = width
         self.height = height
         self.on_start = on_start
+        self.loader = loader
         self.batch = pg.graphics.Batch()
         self.time = 0
         
         # Create gradient background
         self.background = shapes.Rectangle(
-            x=0, y=0,
-            width=width,
-            height=height,
+            x=0, y=0, width=1, height=1,
             color=(180, 230, 180, 255),  # Light green gradient color
             batch=self.batch
         )
         
         # Create wooden frame
-        frame_margin = min(width, height) * 0.15
         self.frame = shapes.Rectangle(
-            x=frame_margin,
-            y=frame_margin,
-            width=width - 2 * frame_margin,
-            height=height - 2 * frame_margin,
+            x=0, y=0, width=1, height=1,
             color=(139, 69, 19, 255),  # Brown color
             batch=self.batch
         )
         
         # Create inner frame (tan colored)
-        inner_margin = frame_margin * 1.05
         self.inner_frame = shapes.Rectangle(
-            x=inner_margin,
-            y=inner_margin,
-            width=width - 2 * inner_margin,
-            height=height - 2 * inner_margin,
+            x=0, y=0, width=1, height=1,
             color=(210, 180, 140, 255),  # Tan color
             batch=self.batch
         )
         
         # Create "Welcome to" text
-        welcome_size = min(width // 16, height // 16)  # Larger size for "Welcome to"
         self.welcome_text = Label(
             text='Welcome to',
             font_name='Arial',
-            font_size=welcome_size,
-            x=width//2,
-            y=height * 0.75,  # Position higher
             anchor_x='center',
             anchor_y='center',
             batch=self.batch,
@@ -57,13 +49,9 @@ class WelcomeScreen:
         )
         
         # Create "SUIKA WORLD" text with smaller font
-        title_size = min(width // 20, height // 8)  # Smaller size for "SUIKA WORLD"
         self.title = Label(
             text='SUIKA WORLD',
             font_name='Arial',
-            font_size=title_size,
-            x=width//2,
-            y=height * 0.65,  # Position below "Welcome to"
             anchor_x='center',
             anchor_y='center',
             batch=self.batch,
@@ -85,10 +73,67 @@ class WelcomeScreen:
             'watermelon.png',      # Watermelon
         ]
         
-        self.fruit_sprites = []
-        fruit_size = min(width, height) * 0.15
+        # Fruit sprites, created as soon as their image is loaded
+        self.fruit_names = fruit_names
+        self.fruit_sprites = {}
+        self.fruit_positions = []
+        
+        # Main button
+        self.button = shapes.Rectangle(
+            x=0, y=0, width=1, height=1,
+            color=(34, 139, 34, 255),  # Forest green
+            batch=self.batch
+        )
+        
+        # Loading progress, over the button until it is enabled
+        self.progress_bar = shapes.Rectangle(
+            x=0, y=0, width=0, height=1,
+            color=(34, 139, 34, 255),
+            batch=self.batch
+        )
+        
+        # Button text
+        self.button_text = Label(
+            text='START GAME',
+            font_name='Arial',
+            anchor_x='center',
+            anchor_y='center',
+            batch=self.batch,
+            color=(255, 255, 255, 255)
+        )
+        
+        self.ready = False
+        self.on_resize(width, height)
+        self.add_loaded_fruits()
+        self.update_progress()
+        
+        # Schedule animation updates
+        pg.clock.schedule_interval(self.update, 1/60)
+    
+    def on_resize(self, width, height):
+        """Lays out the screen for the window size"""
+        self.width = width
+        self.height = height
+        self.background.width = width
+        self.background.height = height
+        
+        frame_margin = min(width, height) * 0.15
+        self.frame.position = (frame_margin, frame_margin)
+        self.frame.width = width - 2 * frame_margin
+        self.frame.height = height - 2 * frame_margin
+        
+        inner_margin = frame_margin * 1.05
+        self.inner_frame.position = (inner_margin, inner_margin)
+        self.inner_frame.width = width - 2 * inner_margin
+        self.inner_frame.height = height - 2 * inner_margin
+        
+        self.welcome_text.font_size = min(width // 16, height // 16)  # Larger size for "Welcome to"
+        self.welcome_text.position = (width//2, height * 0.75, 0)  # Position higher
+        self.title.font_size = min(width // 20, height // 8)  # Smaller size for "SUIKA WORLD"
+        self.title.position = (width//2, height * 0.65, 0)  # Position below "Welcome to"
         
         # Calculate positions in two rows
+        self.fruit_positions = []
         fruits_per_row = 6
         start_x = width * 0.25
         spacing_x = (width * 0.5) / (fruits_per_row - 1)
@@ -96,79 +141,32 @@ class WelcomeScreen:
         # First row - moved down to accommodate title
         y_row1 = height * 0.45
         for i in range(fruits_per_row):
-            if i < len(fruit_names):
-                try:
-                    img = pg.resource.image(fruit_names[i])
-                    img.anchor_x = img.width // 2
-                    img.anchor_y = img.height // 2
-                    
-                    scale = fruit_size / max(img.width, img.height)
-                    
-                    sprite = pg.sprite.Sprite(
-                        img,
-                        x=start_x + i * spacing_x,
-                        y=y_row1,
-                        batch=self.batch
-                    )
-                    sprite.scale = scale
-                    self.fruit_sprites.append(sprite)
-                except Exception as e:
-                    print(f"Error loading fruit image {fruit_names[i]}: {e}")
+            self.fruit_positions.append((start_x + i * spacing_x, y_row1))
         
         # Second row
         y_row2 = height * 0.3
-        remaining_fruits = len(fruit_names) - fruits_per_row
+        remaining_fruits = len(self.fruit_names) - fruits_per_row
         spacing_x2 = (width * 0.4) / (remaining_fruits - 1)
         start_x2 = width * 0.3
-        
         for i in range(remaining_fruits):
-            try:
-                img = pg.resource.image(fruit_names[i + fruits_per_row])
-                img.anchor_x = img.width // 2
-                img.anchor_y = img.height // 2
-                
-                scale = fruit_size / max(img.width, img.height)
-                
-                sprite = pg.sprite.Sprite(
-                    img,
-                    x=start_x2 + i * spacing_x2,
-                    y=y_row2,
-                    batch=self.batch
-                )
-                sprite.scale = scale
-                self.fruit_sprites.append(sprite)
-            except Exception as e:
-                print(f"Error loading fruit image {fruit_names[i + fruits_per_row]}: {e}")
+            self.fruit_positions.append((start_x2 + i * spacing_x2, y_row2))
+        for i, sprite in self.fruit_sprites.items():
+            if sprite is not None:
+                x, y = self.fruit_positions[i]
+                sprite.update(x=x, y=y)
         
-        # Create start button
+        # Start button
         button_width = min(width // 2, 400)  # Slightly narrower button
         button_height = min(height // 8, 80)  # Shorter button
         button_x = (width - button_width) // 2
         button_y = height * 0.15
-        
-        # Main button
-        self.button = shapes.Rectangle(
-            x=button_x,
-            y=button_y,
-            width=button_width,
-            height=button_height,
-            color=(34, 139, 34, 255),  # Forest green
-            batch=self.batch
-        )
-        
-        # Button text - significantly smaller
-        button_text_size = min(width // 36, height // 36)  # Much smaller text size
-        self.button_text = Label(
-            text='START GAME',
-            font_name='Arial',
-            font_size=button_text_size,
-            x=button_x + button_width//2,
-            y=button_y + button_height//2,
-            anchor_x='center',
-            anchor_y='center',
-            batch=self.batch,
-            color=(255, 255, 255, 255)
-        )
+        self.button.position = (button_x, button_y)
+        self.button.width = button_width
+        self.button.height = button_height
+        self.progress_bar.position = (button_x, button_y)
+        self.progress_bar.height = button_height
+        self.button_text.font_size = min(width // 36, height // 36)  # Much smaller text size
+        self.button_text.position = (button_x + button_width//2, button_y + button_height//2, 0)
         
         # Store button dimensions for click detection
         self.button_bounds = {
@@ -177,15 +175,49 @@ class WelcomeScreen:
             'width': button_width,
             'height': button_height
         }
-        
-        # Schedule animation updates
-        pg.clock.schedule_interval(self.update, 1/60)
-        
+        if not self.ready and self.loader is not None:
+            self.progress_bar.width = button_width * self.loader.progress
+        
+    def add_loaded_fruits(self):
+        """Creates the sprites of the fruits whose image is loaded"""
+        fruit_size = min(self.width, self.height) * 0.15
+        for i, (name, (x, y)) in enumerate(zip(self.fruit_names, self.fruit_positions)):
+            if i in self.fruit_sprites or not (self.loader is None or sprites.is_loaded(name)):
+                continue
+            try:
+                img = sprites.image(name)
+                img.anchor_x = img.width // 2
+                img.anchor_y = img.height // 2
+                sprite = pg.sprite.Sprite(img, x=x, y=y, batch=self.batch)
+                sprite.scale = fruit_size / max(img.width, img.height)
+                self.fruit_sprites[i] = sprite
+            except Exception as e:
+                print(f"Error loading fruit image {name}: {e}")
+                self.fruit_sprites[i] = None
+    
+    def update_progress(self):
+        """Loading progress on the start button, enabled when everything is loaded"""
+        if self.ready:
+            return
+        if self.loader is None or self.loader.ready:
+            self.ready = True
+            self.progress_bar.visible = False
+            self.button_text.text = 'START GAME'
+            return
+        self.button.color = (120, 120, 120, 255)  # Grey while disabled
+        self.progress_bar.width = self.button_bounds['width'] * self.loader.progress
+        self.button_text.text = f'LOADING {100 * self.loader.progress:.0f}%'
+    
     def update(self, dt):
         self.time += dt
+        if not self.ready:
+            self.add_loaded_fruits()
+            self.update_progress()
         
         # Gentle pulsing animation for fruits
-        for i, sprite in enumerate(self.fruit_sprites):
+        for i, sprite in self.fruit_sprites.items():
+            if sprite is None:
+                continue
             base_scale = min(self.width, self.height) * 0.15 / max(sprite.image.width, sprite.image.height)
             scale_factor = 1.0 + math.sin(self.time * 2 + i * 0.5) * 0.05
             sprite.scale = base_scale * scale_factor
@@ -194,20 +226,22 @@ class WelcomeScreen:
             sprite.rotation = math.sin(self.time * 1.5 + i * 0.7) * 5
         
         # Button color animation
+        if not self.ready:
+            return
         base_green = 34
         color_shift = int(math.sin(self.time * 2) * 20)
         self.button.color = (base_green, 139 + color_shift, base_green, 255)
     
     def on_button_click(self, x, y):
+        if not self.ready:
+            return
         if (self.button_bounds['x'] <= x <= self.button_bounds['x'] + self.button_bounds['width'] and 
             self.button_bounds['y'] <= y <= self.button_bounds['y'] + self.button_bounds['height']):
             self.on_start()
     
     def draw(self):
         self.batch.draw()
-        
-    def __del__(self):
-        try:
-            pg.clock.unschedule(self.update)
-        except:
-            pass 
\ No newline at end of file
+    
+    def delete(self):
+        """Stops the animation, the screen is not used anymore"""
+        pg.clock.unschedule(self.update) 
\ No newline at end of file